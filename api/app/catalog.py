@@ -0,0 +1,108 @@
+# Versión del catálogo. Se incrementa ante cualquier escritura sobre `products` para que los
+# índices/caches derivados del catálogo sepan cuándo reconstruirse.
+#
+# - En proceso: bump() (escrituras Core) y, para el ORM, el listener after_commit: recién
+#   cuando los cambios son visibles (si subiera en el flush, una lectura concurrente guardaría
+#   en cache las filas viejas bajo la versión nueva, y nada más la invalidaría).
+# - Entre procesos: la fila `catalog_meta` (id=1) guarda una versión que suben el seed y las
+#   escrituras ORM sobre Product; cada proceso la relee a lo sumo cada CHECK_SECONDS (current()).
+# - Stock: las reservas de carritos NO cambian la versión (serían miles de invalidaciones del
+#   índice de búsqueda); se avisa qué productos cambiaron, después del commit, a los que se
+#   registraron con on_stock_change().
+# - Carritos: los que tienen un producto modificado recalculan su total y suben su versión
+#   (ETag) en la misma transacción (app/summary.py); el seed hace lo mismo con las filas que
+#   actualiza. Para respetar el orden de locks de app/stock.py (carrito, después productos),
+#   before_flush bloquea esos carritos antes del UPDATE de products. Las reservas de stock (Core, app/stock.py) no: el stock embebido en un carrito
+#   es informativo.
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import summary
+from .models import CatalogMeta, Product
+
+CHECK_SECONDS = float(os.getenv("CATALOG_CHECK_SECONDS", "2"))
+
+_lock = threading.Lock()
+_version = 0
+_db_version: Optional[int] = None
+_checked_at = 0.0
+_stock_listeners: List[Callable[[Iterable[int]], None]] = []
+
+def version() -> int:
+    return _version
+
+def bump() -> int:
+    """Marca el catálogo como modificado. Llamarlo tras escrituras Core (bulk) sobre products."""
+    global _version
+    with _lock:
+        _version += 1
+        return _version
+
+def bump_db(conn) -> None:
+    """Sube la versión compartida (en la transacción de `conn`) para que los otros procesos
+    se enteren en su próximo chequeo. Un solo upsert: dos procesos que suben la versión por
+    primera vez a la vez no chocan en la PK (corre desde after_flush, dentro de otra escritura)."""
+    insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(CatalogMeta).values(id=1, version=1)
+    conn.execute(stmt.on_conflict_do_update(index_elements=[CatalogMeta.id], set_={"version": CatalogMeta.version + 1}))
+
+def check_due() -> bool:
+    return time.monotonic() - _checked_at > CHECK_SECONDS
+
+def current(db: Session) -> int:
+    """Versión vigente: la local, releyendo la compartida si pasaron CHECK_SECONDS. Sin lock
+    alrededor de la query (en modo async corre en un greenlet del event loop)."""
+    global _db_version, _checked_at
+    if check_due():
+        shared = db.execute(select(CatalogMeta.version).where(CatalogMeta.id == 1)).scalar()
+        _checked_at = time.monotonic()
+        if shared != _db_version:
+            _db_version = shared
+            bump()
+    return _version
+
+def on_stock_change(fn: Callable[[Iterable[int]], None]) -> None:
+    _stock_listeners.append(fn)
+
+def stock_changed(db: Session, ids: Iterable[int]) -> None:
+    """Registra productos con stock modificado en la transacción de `db`; se notifican al commit."""
+    db.info.setdefault("stock_changed", set()).update(ids)
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    # Carritos antes que productos, como las mutaciones de carritos (ver app/stock.py)
+    changed = [obj.id for obj in session.dirty if isinstance(obj, Product) and session.is_modified(obj)]
+    if changed:
+        summary.lock_carts(session.connection(), changed)
+
+@event.listens_for(Session, "after_flush")
+def _on_flush(session, flush_context):
+    # Las escrituras ORM sobre Product invalidan automáticamente
+    if not any(isinstance(obj, Product) for obj in (*session.new, *session.dirty, *session.deleted)):
+        return
+    bump_db(session.connection())
+    session.info["catalog_changed"] = True
+    changed = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, Product) and any(a.history.has_changes() for a in inspect(obj).attrs)
+    ]
+    if changed:
+        summary.refresh_carts(session.connection(), changed)
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    if session.info.pop("catalog_changed", False):
+        bump()
+    ids = session.info.pop("stock_changed", None)
+    if ids:
+        for fn in _stock_listeners:
+            fn(ids)
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop("catalog_changed", None)
+    session.info.pop("stock_changed", None)
@@ -1,15 +1,36 @@
+import os
+from typing import Optional
 from fastapi import FastAPI
 from .db import Base, engine
 from .routers import products, carts
+from . import metrics, migrations, profiling, search
 
 # Create tables on startup
 Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
+search.install(engine)
 
-app = FastAPI(title="Laburen API — Fase práctica", version="0.1.0")
+def create_app(async_mode: Optional[bool] = None) -> FastAPI:
+    """API_ASYNC=1: endpoints `async def` sobre AsyncSession (asyncpg/aiosqlite) en vez del threadpool."""
+    if async_mode is None:
+        async_mode = os.getenv("API_ASYNC", "0") == "1"
 
-app.include_router(products.router)
-app.include_router(carts.router)
+    app = FastAPI(title="Laburen API — Fase práctica", version="0.1.0")
+    metrics.mount(app)
+    profiling.mount(app)  # opt-in: PROFILE_TOKEN / PROFILE_SAMPLE_RATE / PROFILE_ALL
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+    if async_mode:
+        from .routers import products_async, carts_async
+        app.include_router(products_async.router)
+        app.include_router(carts_async.router)
+    else:
+        app.include_router(products.router)
+        app.include_router(carts.router)
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "mode": "async" if async_mode else "sync"}
+
+    return app
+
+app = create_app()
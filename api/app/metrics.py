@@ -0,0 +1,128 @@
+# Métricas Prometheus de la API (GET /metrics).
+#
+# - http_request_duration_seconds{method,route,status}: latencia por ruta (el template,
+#   "/products/{product_id}", no la URL: cardinalidad acotada).
+# - db_queries_per_request / db_time_per_request_seconds {route}: cuántas queries y cuánto
+#   tiempo de base lleva cada request, sumando los eventos del engine (sync y async) en un
+#   acumulador por request (contextvar: lo ven el threadpool y los greenlets de run_sync).
+# - db_query_duration_seconds: cada statement.
+# - db_pool_checkout_wait_seconds: espera por una conexión del pool (incluye abrirla si no
+#   había ninguna libre); db_pool_checked_out: conexiones en uso.
+#
+# Con varios workers de uvicorn/gunicorn, definir PROMETHEUS_MULTIPROC_DIR (directorio vacío
+# por deploy) para que /metrics sume los de todos los procesos.
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, REGISTRY, generate_latest
+from sqlalchemy import event
+
+# Buckets en segundos: de 1 ms a 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request", "Queries SQL por request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Tiempo en la base por request", ["route"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY = Histogram("db_query_duration_seconds", "Duración de cada statement SQL", buckets=LATENCY_BUCKETS)
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool", ["engine"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Conexiones del pool en uso", ["engine"], multiprocess_mode="livesum",
+)
+
+class RequestDB:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+_current: ContextVar[Optional[RequestDB]] = ContextVar("request_db", default=None)
+
+def instrument_engine(engine, name: str = "sync") -> None:
+    """Eventos de cursor (queries por request y duración) y espera del pool para `engine`
+    (para un AsyncEngine, pasar `.sync_engine`)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY.observe(elapsed)
+        acc = _current.get()
+        if acc is not None:
+            acc.queries += 1
+            acc.seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    # El pool no tiene un evento "pedido de conexión": se envuelve _do_get de esta instancia
+    pool = engine.pool
+    do_get = pool._do_get
+    wait = POOL_WAIT.labels(engine=name)
+
+    def _timed_do_get():
+        t0 = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            wait.observe(time.perf_counter() - t0)
+
+    pool._do_get = _timed_do_get
+    # set_function no existe en modo multiproceso (cada proceso escribe su archivo)
+    if hasattr(pool, "checkedout") and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        POOL_CHECKED_OUT.labels(engine=name).set_function(pool.checkedout)
+
+def mount(app) -> None:
+    """Middleware de latencia/queries por ruta y GET /metrics."""
+    from fastapi import Request, Response
+
+    @app.middleware("http")
+    async def _observe(request: Request, call_next):
+        acc = RequestDB()
+        token = _current.set(acc)
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - t0
+            _current.reset(token)
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            if path != "/metrics":
+                HTTP_LATENCY.labels(request.method, path, str(status)).observe(elapsed)
+                DB_QUERIES.labels(path).observe(acc.queries)
+                DB_TIME.labels(path).observe(acc.seconds)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(content=render(), media_type=CONTENT_TYPE_LATEST)
+
+def render() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,20 @@
+# Migraciones livianas al iniciar: create_all crea tablas nuevas pero no agrega columnas ni
+# índices a tablas que ya existen. Esto completa lo que falte (columnas nuevas deben ser
+# nullable o tener server_default).
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from .db import Base
+
+def upgrade(engine) -> None:
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    ddl = CreateColumn(col).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, Text, ForeignKey, DateTime, func, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Numeric, Text, ForeignKey, DateTime, func, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -9,12 +9,33 @@ class Product(Base):
     description = Column(Text, nullable=True, default="")
     price = Column(Numeric(12,2), nullable=False)
     stock = Column(Integer, nullable=False, default=0)
+    # Atributos de la planilla normalizados (minúsculas, sin acentos: "pantalon", "negro", "xl")
+    # para filtrar y contar facetas por índice en vez de buscar dentro de name/description
+    tipo = Column(String(64), nullable=True)
+    color = Column(String(64), nullable=True)
+    talle = Column(String(16), nullable=True)
+    categoria = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        # Cubren los filtros de la conversación: tipo+color+talle (y sus prefijos), color+talle,
+        # talle solo, y categoría (+tipo)
+        Index("ix_products_tipo_color_talle", "tipo", "color", "talle"),
+        Index("ix_products_color_talle", "color", "talle"),
+        Index("ix_products_talle", "talle"),
+        Index("ix_products_categoria_tipo", "categoria", "tipo"),
+    )
 
 class Cart(Base):
     __tablename__ = "carts"
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    # Se incrementa en cada mutación; base del ETag de GET /carts/{id}
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Resumen desnormalizado, se actualiza en la misma transacción que cada mutación
+    line_count = Column(Integer, nullable=False, default=0, server_default="0")
+    unit_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total = Column(Numeric(14,2), nullable=False, default=0, server_default="0")
 
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
 
@@ -31,3 +52,9 @@ class CartItem(Base):
     __table_args__ = (
         UniqueConstraint("cart_id", "product_id", name="uq_cart_product"),
     )
+
+class CatalogMeta(Base):
+    # Una sola fila (id=1): versión del catálogo compartida entre procesos (ver app/catalog.py)
+    __tablename__ = "catalog_meta"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
@@ -0,0 +1,204 @@
+# Profiling bajo demanda de requests puntuales (opt-in; apagado no agrega middleware ni listeners).
+#
+# Se activa por request con cualquiera de:
+# - header `X-Profile: <PROFILE_TOKEN>` (sólo si PROFILE_TOKEN está definido),
+# - PROFILE_SAMPLE_RATE=0.01 (fracción aleatoria de requests),
+# - PROFILE_ALL=1 (todos; para reproducir algo en un entorno de prueba).
+#
+# Un thread muestrea cada PROFILE_INTERVAL_MS el stack de los threads que trabajan para el
+# request (el del event loop y los del threadpool desde su primera query) y cuenta stacks.
+# Las queries se registran con su duración y, mientras una está ejecutando, su texto aparece
+# como frame hoja ("sql: SELECT ...") en el flame graph.
+#
+# Salida en PROFILE_DIR (acotado a PROFILE_MAX_FILES profiles; se borran los más viejos):
+# - <id>.collapsed: "frame;frame;frame muestras" por línea (flamegraph.pl, speedscope, inferno).
+# - <id>.json: ruta, status, duración, muestras y las queries.
+# La respuesta trae `X-Profile-Id: <id>`.
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ALL = os.getenv("PROFILE_ALL", "0") == "1"
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/laburen-profiles"))
+MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+MAX_STATEMENTS = 500
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN or SAMPLE_RATE > 0 or PROFILE_ALL)
+
+class Profile:
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        self.threads: Set[int] = set()
+        self.running_sql: Dict[int, str] = {}  # thread -> statement en curso
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.statements: List[Tuple[float, str]] = []  # (ms, statement)
+
+    def attach(self) -> None:
+        self.threads.add(threading.get_ident())
+
+_current: ContextVar[Optional[Profile]] = ContextVar("profile", default=None)
+
+def _frame_name(code) -> str:
+    parts = Path(code.co_filename).parts[-2:]
+    return f"{code.co_name} ({'/'.join(parts)}:{code.co_firstlineno})".replace(";", ",")
+
+def _collapse(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _sql_frame(statement: str) -> str:
+    return "sql: " + re.sub(r"\s+", " ", statement).strip()[:120].replace(";", ",")
+
+class Sampler:
+    """Un único thread muestrea todos los profiles activos; duerme cuando no hay ninguno."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: Set[Profile] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, profile: Profile) -> None:
+        with self._cond:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self, profile: Profile) -> None:
+        with self._cond:
+            self._active.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._active)
+                active = list(self._active)
+            frames = sys._current_frames()
+            for profile in active:
+                for tid in tuple(profile.threads):
+                    frame = frames.get(tid)
+                    if frame is None:
+                        continue
+                    stack = _collapse(frame)
+                    sql = profile.running_sql.get(tid)
+                    if sql:
+                        stack.append(sql)
+                    profile.stacks[";".join(stack)] += 1
+                    profile.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+SAMPLER = Sampler(INTERVAL)
+
+def instrument_engine(engine) -> None:
+    """Registra las queries del profile activo (para un AsyncEngine, pasar `.sync_engine`)."""
+    if not enabled():
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None:
+            profile.attach()  # el thread del threadpool entra al muestreo con su primera query
+            profile.running_sql[threading.get_ident()] = _sql_frame(statement)
+            conn.info["profile_query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None:
+            profile.running_sql.pop(threading.get_ident(), None)
+            t0 = conn.info.pop("profile_query_start", None)
+            if t0 is not None and len(profile.statements) < MAX_STATEMENTS:
+                profile.statements.append((round((time.perf_counter() - t0) * 1000, 3), statement))
+
+def should_profile(headers) -> bool:
+    if PROFILE_TOKEN and headers.get("x-profile") == PROFILE_TOKEN:
+        return True
+    return PROFILE_ALL or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+_seq = itertools.count()
+
+def _prune(directory: Path) -> None:
+    files = sorted(directory.glob("*.collapsed"))  # el id empieza con la fecha: orden cronológico
+    for old in files[:max(0, len(files) - MAX_FILES)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+def write(profile: Profile, meta: Dict) -> str:
+    """Guarda el profile (collapsed + json) y devuelve su id."""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", profile.label).strip("_")[:60]
+    now = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+    pid = f"{stamp}-{os.getpid()}-{next(_seq):06d}-{slug}"
+    (PROFILE_DIR / f"{pid}.collapsed").write_text(
+        "".join(f"{stack} {n}\n" for stack, n in profile.stacks.most_common())
+    )
+    statements = [{"ms": ms, "sql": sql} for ms, sql in profile.statements]
+    (PROFILE_DIR / f"{pid}.json").write_text(json.dumps({
+        **meta,
+        "label": profile.label,
+        "samples": profile.samples,
+        "interval_ms": INTERVAL * 1000,
+        "sql_count": len(statements),
+        "sql_ms": round(sum(s["ms"] for s in statements), 3),
+        "sql": statements,
+    }, indent=2, ensure_ascii=False))
+    _prune(PROFILE_DIR)
+    return pid
+
+def mount(app) -> None:
+    """Middleware de profiling. No hace nada si no hay ningún disparador configurado (ni
+    PROFILE_TOKEN, ni PROFILE_SAMPLE_RATE, ni PROFILE_ALL)."""
+    if not enabled():
+        return
+
+    @app.middleware("http")
+    async def _profile(request, call_next):
+        if not should_profile(request.headers):
+            return await call_next(request)
+        profile = Profile(f"{request.method} {request.url.path}")
+        profile.attach()  # thread del event loop (endpoints async y run_sync)
+        token = _current.set(profile)
+        SAMPLER.start(profile)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            SAMPLER.stop(profile)
+            _current.reset(token)
+            route = getattr(request.scope.get("route"), "path", None)
+            # Disco (mkdir, dos archivos, poda) en un thread: no frenar al resto de los requests
+            pid = await run_in_threadpool(write, profile, {
+                "method": request.method, "path": request.url.path, "route": route,
+                "query": request.url.query, "status": status,
+                "duration_ms": round((time.perf_counter() - profile.started) * 1000, 3),
+            })
+        response.headers["X-Profile-Id"] = pid
+        return response
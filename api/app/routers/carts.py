@@ -1,66 +1,220 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select, update, delete
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
 from ..db import get_db
 from ..models import Cart, CartItem, Product
-from ..schemas import CartOut, CartCreateIn, CartPatchIn
+from ..schemas import CartOut, CartCommandIn, CartCreateIn, CartPatchIn, CartItemIn
+from .. import stock, summary
 
 router = APIRouter(prefix="/carts", tags=["carts"])
 
+def load_cart(db: Session, cart_id: int):
+    """Cart + items + products in two queries (no lazy load per line item when serializing)."""
+    stmt = (
+        select(Cart)
+        .where(Cart.id == cart_id)
+        .options(selectinload(Cart.items).joinedload(CartItem.product))
+        .execution_options(populate_existing=True)
+    )
+    return db.execute(stmt).scalar_one_or_none()
+
+def cart_etag(cart_id: int, version: int) -> str:
+    # The version also goes up when an embedded product changes (app/summary.refresh_carts)
+    return f'"cart-{cart_id}-v{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def set_cart_headers(response: Response, cart: Cart):
+    response.headers["ETag"] = cart_etag(cart.id, cart.version)
+    response.headers["Cache-Control"] = "no-cache"
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/{cart_id}", response_model=CartOut)
+def get_cart(cart_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag, cart = read_cart(db, cart_id, request.headers.get("if-none-match"))
+    if cart is None:
+        return not_modified(etag)
+    set_cart_headers(response, cart)
+    return cart
+
 @router.post("", response_model=CartOut, status_code=201)
-def create_cart(payload: CartCreateIn, db: Session = Depends(get_db)):
-    # Validate products exist
-    product_ids = [i.product_id for i in payload.items]
-    if not product_ids:
+def create_cart(payload: CartCreateIn, response: Response, db: Session = Depends(get_db)):
+    cart = apply_create(db, payload)
+    set_cart_headers(response, cart)
+    return cart
+
+@router.patch("/{cart_id}", response_model=CartOut)
+def patch_cart(cart_id: int, payload: CartPatchIn, response: Response, db: Session = Depends(get_db)):
+    cart = apply_patch(db, cart_id, payload)
+    set_cart_headers(response, cart)
+    return cart
+
+@router.post("/commands", response_model=CartOut)
+def cart_command(payload: CartCommandIn, response: Response, db: Session = Depends(get_db)):
+    """One round trip for the agent's "add"/"set" turn: create the cart if `cart_id` is null,
+    validate the products and apply the items, all in one transaction. 201 when the cart was
+    created, 200 otherwise; the body carries the updated summary (line/unit counts, total)."""
+    cart, created = apply_command(db, payload)
+    response.status_code = 201 if created else 200
+    set_cart_headers(response, cart)
+    return cart
+
+# Shared with the async endpoints (routers/carts_async.py, through AsyncSession.run_sync)
+
+def read_cart(db: Session, cart_id: int, if_none_match: Optional[str]) -> Tuple[str, Optional[Cart]]:
+    """Read-only. Returns (etag, cart), or (etag, None) when the client's copy is current:
+    in that case only the version is read, items and products are not loaded."""
+    if if_none_match:
+        version = db.execute(select(Cart.version).where(Cart.id == cart_id)).scalar_one_or_none()
+        if version is None:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        etag = cart_etag(cart_id, version)
+        if etag_matches(if_none_match, etag):
+            return etag, None
+    cart = load_cart(db, cart_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return cart_etag(cart.id, cart.version), cart
+
+def apply_create(db: Session, payload: CartCreateIn) -> Cart:
+    if not payload.items:
         raise HTTPException(status_code=400, detail="No items provided")
-    existing = db.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars().all()
-    missing = sorted(set(product_ids) - set(existing))
-    if missing:
-        raise HTTPException(status_code=404, detail=f"Products not found: {missing}")
+    _check_products(db, payload.items)
 
     cart = Cart()
     db.add(cart)
     db.flush()  # get cart.id
+    cart_id = cart.id
+    apply_items(db, cart_id, payload.items)
+
+    db.commit()
+    return load_cart(db, cart_id)
+
+def apply_patch(db: Session, cart_id: int, payload: CartPatchIn) -> Cart:
+    if not payload.items:
+        cart = load_cart(db, cart_id)
+        if not cart:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        return cart
 
-    # Upsert-like: for initial create, just add items with qty>0
-    for it in payload.items:
-        if it.qty <= 0:
-            continue
-        db.add(CartItem(cart_id=cart.id, product_id=it.product_id, qty=it.qty))
+    _lock_cart(db, cart_id)
+    _check_products(db, payload.items)
+    apply_items(db, cart_id, payload.items)
 
     db.commit()
-    db.refresh(cart)
-    return cart
+    return load_cart(db, cart_id)
 
-@router.patch("/{cart_id}", response_model=CartOut)
-def patch_cart(cart_id: int, payload: CartPatchIn, db: Session = Depends(get_db)):
-    cart = db.get(Cart, cart_id)
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
+def apply_command(db: Session, payload: CartCommandIn) -> Tuple[Cart, bool]:
+    """Create-if-needed + validate + apply in one transaction. Returns (cart, created). Any
+    error (unknown cart or product, stock) rolls back everything, including a new cart."""
+    created = payload.cart_id is None
+    if created:
+        if payload.items:
+            _check_products(db, payload.items)
+        cart = Cart()
+        db.add(cart)
+        db.flush()  # get cart.id
+        cart_id = cart.id
+    elif not payload.items:
+        return apply_patch(db, payload.cart_id, CartPatchIn(items=[])), False
+    else:
+        cart_id = payload.cart_id
+        _lock_cart(db, cart_id)
+        _check_products(db, payload.items)
+    if payload.items:
+        apply_items(db, cart_id, payload.items)
 
-    product_ids = [i.product_id for i in payload.items]
-    if not product_ids:
-        return cart
+    db.commit()
+    return load_cart(db, cart_id), created
+
+def _lock_cart(db: Session, cart_id: int):
+    # Row lock on the cart (and first write of the transaction): concurrent mutations of the
+    # same cart are applied one after the other, other carts are not blocked.
+    touched = db.execute(
+        update(Cart).where(Cart.id == cart_id).values(updated_at=func.now(), version=Cart.version + 1)
+    )
+    if touched.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Cart not found")
 
+def _check_products(db: Session, items: List[CartItemIn]):
+    product_ids = {i.product_id for i in items}
     existing = db.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars().all()
-    missing = sorted(set(product_ids) - set(existing))
+    missing = sorted(product_ids - set(existing))
     if missing:
         raise HTTPException(status_code=404, detail=f"Products not found: {missing}")
 
-    # Load existing items for this cart
-    existing_items = {ci.product_id: ci for ci in cart.items}
+def coalesce(items: List[CartItemIn]) -> Dict[int, Tuple[str, int]]:
+    """Fold a batch into one operation per product: {product_id: ("set"|"inc", qty)}.
 
-    for change in payload.items:
-        if change.qty == 0:
-            # delete if exists
-            if change.product_id in existing_items:
-                db.delete(existing_items[change.product_id])
+    A set followed by increments stays a set; a set overrides previous increments.
+    """
+    ops: Dict[int, Tuple[str, int]] = {}
+    for it in items:
+        prev = ops.get(it.product_id)
+        if it.op == "set" or prev is None:
+            ops[it.product_id] = (it.op, it.qty)
         else:
-            if change.product_id in existing_items:
-                existing_items[change.product_id].qty = change.qty
-            else:
-                db.add(CartItem(cart_id=cart.id, product_id=change.product_id, qty=change.qty))
+            ops[it.product_id] = (prev[0], prev[1] + it.qty)
+    return ops
 
-    db.commit()
-    db.refresh(cart)
-    return cart
+def apply_items(db: Session, cart_id: int, items: List[CartItemIn]):
+    """Apply set/increment operations with INSERT ... ON CONFLICT (cart_id, product_id) DO UPDATE.
+
+    Stock is reserved first for the net change of each line (see app/stock.py), then one
+    multi-row upsert per operation kind (rows sorted by product_id so concurrent batches
+    take row locks in the same order), then one DELETE for rows that reached zero.
+    """
+    ops = coalesce(items)
+    stock.reserve(db, _stock_deltas(db, cart_id, ops))
+    sets = [{"cart_id": cart_id, "product_id": pid, "qty": q} for pid, (op, q) in sorted(ops.items()) if op == "set" and q > 0]
+    incs = [{"cart_id": cart_id, "product_id": pid, "qty": q} for pid, (op, q) in sorted(ops.items()) if op == "inc" and q != 0]
+    zeroed = [pid for pid, (op, q) in ops.items() if op == "set" and q <= 0]
+
+    if sets:
+        db.execute(_upsert(db, sets, increment=False))
+    if incs:
+        db.execute(_upsert(db, incs, increment=True))
+    db.execute(
+        delete(CartItem)
+        .where(CartItem.cart_id == cart_id)
+        .where(or_(CartItem.qty <= 0, CartItem.product_id.in_(zeroed)))
+        .execution_options(synchronize_session=False)
+    )
+    _update_summary(db, cart_id)
+
+def _stock_deltas(db: Session, cart_id: int, ops: Dict[int, Tuple[str, int]]) -> Dict[int, int]:
+    """Units to reserve (>0) or release (<0) per product. The cart row is already locked by
+    the caller, so the current quantities can't change under us."""
+    current = dict(
+        db.execute(
+            select(CartItem.product_id, CartItem.qty)
+            .where(CartItem.cart_id == cart_id, CartItem.product_id.in_(ops))
+        ).all()
+    )
+    deltas = {}
+    for pid, (op, q) in ops.items():
+        old = current.get(pid, 0)
+        new = max(q if op == "set" else old + q, 0)
+        deltas[pid] = new - old
+    return deltas
+
+def _update_summary(db: Session, cart_id: int):
+    """Recompute line/unit counts and the exact Numeric total in the database, in the same
+    transaction as the mutation (one UPDATE; reads then serve it without touching the lines)."""
+    summary.update_summaries(db, Cart.id == cart_id)
+
+def _upsert(db: Session, rows: List[dict], increment: bool):
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(CartItem).values(rows)
+    # `cart_items.qty + excluded.qty` is evaluated against the locked, latest row version
+    qty = CartItem.qty + stmt.excluded.qty if increment else stmt.excluded.qty
+    return stmt.on_conflict_do_update(index_elements=[CartItem.cart_id, CartItem.product_id], set_={"qty": qty})
@@ -0,0 +1,35 @@
+# `async def` versions of routers/carts.py (API_ASYNC=1), sharing its logic through run_sync.
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db
+from ..schemas import CartOut, CartCommandIn, CartCreateIn, CartPatchIn
+from . import carts
+
+router = APIRouter(prefix="/carts", tags=["carts"])
+
+@router.get("/{cart_id}", response_model=CartOut)
+async def get_cart(cart_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    etag, cart = await db.run_sync(carts.read_cart, cart_id, request.headers.get("if-none-match"))
+    if cart is None:
+        return carts.not_modified(etag)
+    carts.set_cart_headers(response, cart)
+    return cart
+
+@router.post("", response_model=CartOut, status_code=201)
+async def create_cart(payload: CartCreateIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    cart = await db.run_sync(carts.apply_create, payload)
+    carts.set_cart_headers(response, cart)
+    return cart
+
+@router.patch("/{cart_id}", response_model=CartOut)
+async def patch_cart(cart_id: int, payload: CartPatchIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    cart = await db.run_sync(carts.apply_patch, cart_id, payload)
+    carts.set_cart_headers(response, cart)
+    return cart
+
+@router.post("/commands", response_model=CartOut)
+async def cart_command(payload: CartCommandIn, response: Response, db: AsyncSession = Depends(get_async_db)):
+    cart, created = await db.run_sync(carts.apply_command, payload)
+    response.status_code = 201 if created else 200
+    carts.set_cart_headers(response, cart)
+    return cart
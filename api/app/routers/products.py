@@ -1,24 +1,297 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from ..db import get_db
+from sqlalchemy import func, select
+from ..db import get_db, SessionLocal
 from ..models import Product
-from ..schemas import ProductOut
+from ..schemas import ProductOut, ProductBatchIn, ProductBatchOut, ProductFacetsOut
+from .. import catalog, search
 
 router = APIRouter(prefix="/products", tags=["products"])
 
+NDJSON = "application/x-ndjson"
+ATTRIBUTES = ("tipo", "color", "talle", "categoria")
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.price, Product.stock,
+    *(getattr(Product, a) for a in ATTRIBUTES),
+)
+
+def product_row(row) -> dict:
+    """Fila (columnas de PRODUCT_COLUMNS) -> dict con la forma de ProductOut, sin pasar por Pydantic."""
+    pid, name, description, price, stock, *attrs = row
+    return {
+        "id": pid, "name": name, "description": description, "price": float(price), "stock": stock,
+        **dict(zip(ATTRIBUTES, attrs)),
+    }
+
+def product_dict(p: Product) -> dict:
+    return product_row(tuple(getattr(p, c.key) for c in PRODUCT_COLUMNS))
+
+# ---------- Cache de respuestas serializadas ----------
+
+class ResponseCache:
+    """LRU de respuestas de productos ya codificadas (bytes JSON): un hit no toca la base, ni
+    Pydantic, ni el encoder.
+
+    - Cada entrada guarda la versión del catálogo con la que se armó (catalog.current); si la
+      versión cambió (seed, escritura ORM, otro proceso) la entrada ya no vale.
+    - El stock cambia con cada carrito sin subir la versión: al commitear una reserva se
+      descartan sólo las entradas que incluyen esos productos (índice producto -> claves).
+      Otros procesos no se enteran: `ttl` acota cuánto puede quedar viejo el stock mostrado.
+    - Acotada por cantidad de entradas y por bytes.
+    """
+
+    def __init__(self, maxsize: int, max_bytes: int, ttl: float):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (version, expires, body, headers, ids)
+        self._by_product: Dict[int, set] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Sube con cada invalidación por stock: una respuesta armada mientras tanto no se guarda
+        self.generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[Response]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return Response(content=entry[2], media_type="application/json", headers={**entry[3], "X-Cache": "hit"})
+
+    def put(self, key: Hashable, version: int, generation: int, payload: Any, ids: Iterable[int],
+            headers: Optional[Dict[str, str]] = None) -> Response:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        headers = headers or {}
+        with self._lock:
+            if generation == self.generation and self.maxsize > 0 and len(body) <= self.max_bytes:
+                if key in self._entries:
+                    self._drop(key)
+                ids = frozenset(ids)
+                self._entries[key] = (version, time.monotonic() + self.ttl, body, headers, ids)
+                self._bytes += len(body)
+                for pid in ids:
+                    self._by_product.setdefault(pid, set()).add(key)
+                while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+        return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "miss"})
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, body, _, ids = self._entries.pop(key)
+        self._bytes -= len(body)
+        for pid in ids:
+            keys = self._by_product.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_product[pid]
+
+    def invalidate_products(self, ids: Iterable[int]) -> None:
+        with self._lock:
+            self.generation += 1
+            for pid in ids:
+                for key in list(self._by_product.get(pid, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_product.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+RESPONSE_CACHE = ResponseCache(
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "2048")),
+    max_bytes=int(os.getenv("PRODUCT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "5")),
+)
+catalog.on_stock_change(RESPONSE_CACHE.invalidate_products)
+
+def list_key(q: Optional[str], after_id: Optional[int], limit: int, filters: Dict[str, List[str]]) -> tuple:
+    # Consulta normalizada como la ve la búsqueda: "Medias  NEGRAS" y "medias negras" comparten entrada
+    terms = " ".join(search.query_terms(q)) if q else None
+    return ("list", terms, after_id, limit, tuple(sorted((k, tuple(v)) for k, v in filters.items())))
+
+def product_filters(
+    tipo: Optional[str] = Query(default=None, description="Tipo de prenda (varios separados por coma)"),
+    color: Optional[str] = Query(default=None, description="Color (varios separados por coma)"),
+    talle: Optional[str] = Query(default=None, description="Talle (varios separados por coma)"),
+    categoria: Optional[str] = Query(default=None, description="Categoría (varios separados por coma)"),
+) -> Dict[str, List[str]]:
+    """Filtros por atributo, normalizados como los guarda el seed ("Pantalón" -> "pantalon").
+    AND entre atributos, OR entre los valores de uno mismo."""
+    filters = {}
+    for attr, raw in zip(ATTRIBUTES, (tipo, color, talle, categoria)):
+        values = [search.fold(v).strip() for v in (raw or "").split(",") if v.strip()]
+        if values:
+            filters[attr] = list(dict.fromkeys(values))
+    return filters
+
+def filter_conditions(filters: Dict[str, List[str]], exclude: Optional[str] = None) -> list:
+    # Igualdad / IN sobre columnas indexadas (ix_products_*), nunca LIKE sobre el nombre
+    conds = []
+    for attr, values in filters.items():
+        if attr == exclude:
+            continue
+        col = getattr(Product, attr)
+        conds.append(col == values[0] if len(values) == 1 else col.in_(values))
+    return conds
+
+def stream_stmt(after_id: Optional[int], filters: Optional[Dict[str, List[str]]] = None):
+    # yield_per => cursor del lado del servidor, la memoria no crece con el tamaño del catálogo
+    stmt = select(*PRODUCT_COLUMNS).where(*filter_conditions(filters or {})).order_by(Product.id.asc())
+    if after_id is not None:
+        stmt = stmt.where(Product.id > after_id)
+    return stmt.execution_options(yield_per=1000)
+
+def ndjson_lines(rows) -> str:
+    return "".join(json.dumps(product_row(r), ensure_ascii=False) + "\n" for r in rows)
+
+def _stream_products(after_id: Optional[int], filters: Dict[str, List[str]]):
+    # Sesión propia: vive lo que dure el stream
+    with SessionLocal() as db:
+        result = db.execute(stream_stmt(after_id, filters))
+        for rows in result.partitions():
+            yield ndjson_lines(rows)
+
 @router.get("", response_model=list[ProductOut])
-def list_products(q: str = Query(default=None, description="Buscar por nombre/descr."), db: Session = Depends(get_db)):
-    stmt = select(Product)
-    if q:
-        ilike = f"%{q}%"
-        stmt = stmt.where((Product.name.ilike(ilike)) | (Product.description.ilike(ilike)))
-    stmt = stmt.order_by(Product.id.asc()).limit(200)
-    return db.execute(stmt).scalars().all()
+def list_products(
+    request: Request,
+    q: str = Query(default=None, description="Buscar por nombre/descr. (full-text, por relevancia)"),
+    after_id: Optional[int] = Query(default=None, ge=0, description="Cursor: sólo ids mayores, orden por id"),
+    limit: int = Query(default=200, ge=1, le=1000),
+    filters: Dict[str, List[str]] = Depends(product_filters),
+    db: Session = Depends(get_db),
+):
+    if NDJSON in request.headers.get("accept", ""):
+        if q:
+            raise HTTPException(status_code=400, detail="q is not supported with application/x-ndjson")
+        return StreamingResponse(_stream_products(after_id, filters), media_type=NDJSON)
+
+    return cached_list(db, q, after_id, limit, filters)
+
+@router.get("/facets", response_model=ProductFacetsOut)
+def get_facets(filters: Dict[str, List[str]] = Depends(product_filters), db: Session = Depends(get_db)):
+    return compute_facets(db, filters)
+
+@router.post("/batch", response_model=ProductBatchOut)
+def get_products_batch(payload: ProductBatchIn, db: Session = Depends(get_db)):
+    return fetch_products(db, payload.ids)
+
+@router.get("/cache")
+def get_cache_stats():
+    return RESPONSE_CACHE.stats()
 
 @router.get("/{product_id}", response_model=ProductOut)
 def get_product(product_id: int, db: Session = Depends(get_db)):
+    return cached_product(db, product_id)
+
+# Lógica compartida con los endpoints async (routers/products_async.py, vía AsyncSession.run_sync)
+
+def query_products(
+    db: Session, q: Optional[str], after_id: Optional[int], limit: int,
+    filters: Optional[Dict[str, List[str]]] = None,
+) -> list[Product]:
+    where = filter_conditions(filters or {})
+    if q:
+        return search.search_products(db, q, limit=limit, after_id=after_id, where=where)
+    stmt = select(Product).where(*where).order_by(Product.id.asc())
+    if after_id is not None:
+        stmt = stmt.where(Product.id > after_id)
+    return list(db.execute(stmt.limit(limit)).scalars().all())
+
+def next_cursor(items: list, q: Optional[str], after_id: Optional[int], limit: int) -> Optional[str]:
+    # Próxima página (sólo en orden por id; la búsqueda por relevancia devuelve el top-`limit`)
+    if len(items) == limit and (after_id is not None or not q):
+        return str(items[-1].id)
+    return None
+
+def cached_list(
+    db: Session, q: Optional[str], after_id: Optional[int], limit: int, filters: Dict[str, List[str]],
+) -> Response:
+    key = list_key(q, after_id, limit, filters)
+    version = catalog.current(db)
+    hit = RESPONSE_CACHE.get(key, version)
+    if hit is not None:
+        return hit
+    generation = RESPONSE_CACHE.generation
+    items = query_products(db, q, after_id, limit, filters)
+    cursor = next_cursor(items, q, after_id, limit)
+    return RESPONSE_CACHE.put(
+        key, version, generation, [product_dict(p) for p in items], (p.id for p in items),
+        {"X-Next-After-Id": cursor} if cursor else None,
+    )
+
+def cached_product(db: Session, product_id: int) -> Response:
+    key = ("id", product_id)
+    version = catalog.current(db)
+    hit = RESPONSE_CACHE.get(key, version)
+    if hit is not None:
+        return hit
+    generation = RESPONSE_CACHE.generation
+    product = fetch_product(db, product_id)
+    return RESPONSE_CACHE.put(key, version, generation, product_dict(product), (product_id,))
+
+def cached_hit(key: Hashable) -> Optional[Response]:
+    """Hit sin base (para los endpoints async): sólo si no toca releer la versión compartida."""
+    if catalog.check_due():
+        return None
+    return RESPONSE_CACHE.get(key, catalog.version())
+
+def compute_facets(db: Session, filters: Dict[str, List[str]]) -> dict:
+    """Conteos por valor de cada atributo. Cada faceta aplica los demás filtros pero no el
+    suyo, así se ven las alternativas ("¿en qué otros colores está?")."""
+    out = {"total": db.execute(select(func.count()).select_from(Product).where(*filter_conditions(filters))).scalar_one()}
+    for attr in ATTRIBUTES:
+        col = getattr(Product, attr)
+        rows = db.execute(
+            select(col, func.count())
+            .where(col.is_not(None), *filter_conditions(filters, exclude=attr))
+            .group_by(col)
+            .order_by(func.count().desc(), col.asc())
+        ).all()
+        out[attr] = [{"value": v, "count": n} for v, n in rows]
+    return out
+
+def fetch_product(db: Session, product_id: int) -> Product:
     product = db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
+
+def fetch_products(db: Session, ids: list[int]) -> dict:
+    """Un solo SELECT ... WHERE id IN (...); respeta el orden pedido e informa los faltantes."""
+    wanted = list(dict.fromkeys(ids))
+    rows = db.execute(select(*PRODUCT_COLUMNS).where(Product.id.in_(wanted))).all()
+    found = {r[0]: product_row(r) for r in rows}
+    return {
+        "items": [found[i] for i in wanted if i in found],
+        "missing": [i for i in wanted if i not in found],
+    }
@@ -0,0 +1,58 @@
+# Versiones `async def` de routers/products.py (API_ASYNC=1). La lógica es la misma: se ejecuta
+# con AsyncSession.run_sync, que corre el código sync en un greenlet sobre el driver async.
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_async_db, AsyncSessionLocal
+from ..schemas import ProductOut, ProductBatchIn, ProductBatchOut, ProductFacetsOut
+from . import products
+
+router = APIRouter(prefix="/products", tags=["products"])
+
+async def _stream_products(after_id: Optional[int], filters: Dict[str, List[str]]):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(products.stream_stmt(after_id, filters))
+        async for rows in result.partitions():
+            yield products.ndjson_lines(rows)
+
+@router.get("", response_model=list[ProductOut])
+async def list_products(
+    request: Request,
+    q: str = Query(default=None, description="Buscar por nombre/descr. (full-text, por relevancia)"),
+    after_id: Optional[int] = Query(default=None, ge=0, description="Cursor: sólo ids mayores, orden por id"),
+    limit: int = Query(default=200, ge=1, le=1000),
+    filters: Dict[str, List[str]] = Depends(products.product_filters),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if products.NDJSON in request.headers.get("accept", ""):
+        if q:
+            raise HTTPException(status_code=400, detail="q is not supported with application/x-ndjson")
+        return StreamingResponse(_stream_products(after_id, filters), media_type=products.NDJSON)
+
+    hit = products.cached_hit(products.list_key(q, after_id, limit, filters))
+    if hit is not None:
+        return hit
+    return await db.run_sync(products.cached_list, q, after_id, limit, filters)
+
+@router.get("/facets", response_model=ProductFacetsOut)
+async def get_facets(
+    filters: Dict[str, List[str]] = Depends(products.product_filters),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(products.compute_facets, filters)
+
+@router.post("/batch", response_model=ProductBatchOut)
+async def get_products_batch(payload: ProductBatchIn, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(products.fetch_products, payload.ids)
+
+@router.get("/cache")
+async def get_cache_stats():
+    return products.RESPONSE_CACHE.stats()
+
+@router.get("/{product_id}", response_model=ProductOut)
+async def get_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    hit = products.cached_hit(("id", product_id))
+    if hit is not None:
+        return hit
+    return await db.run_sync(products.cached_product, product_id)
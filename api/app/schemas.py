@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from decimal import Decimal
+from typing import List, Literal, Optional
 
 class ProductOut(BaseModel):
     id: int
@@ -7,12 +8,43 @@ class ProductOut(BaseModel):
     description: str | None = ""
     price: float
     stock: int
+    tipo: str | None = None
+    color: str | None = None
+    talle: str | None = None
+    categoria: str | None = None
     class Config:
         from_attributes = True
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class ProductFacetsOut(BaseModel):
+    total: int
+    tipo: List[FacetCount]
+    color: List[FacetCount]
+    talle: List[FacetCount]
+    categoria: List[FacetCount]
+
+MAX_BATCH_IDS = 5000
+
+class ProductBatchIn(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class ProductBatchOut(BaseModel):
+    items: List[ProductOut]  # en el orden pedido (sin repetidos)
+    missing: List[int]
+
 class CartItemIn(BaseModel):
     product_id: int
-    qty: int = Field(..., gt=-1)  # allow 0 for deletion in PATCH
+    qty: int  # set: new quantity (0 deletes); inc: delta, may be negative
+    op: Literal["set", "inc"] = "set"
+
+    @model_validator(mode="after")
+    def _check_qty(self):
+        if self.op == "set" and self.qty < 0:
+            raise ValueError("qty must be >= 0 for op=set")
+        return self
 
 class CartItemOut(BaseModel):
     id: int
@@ -24,6 +56,9 @@ class CartItemOut(BaseModel):
 class CartOut(BaseModel):
     id: int
     items: List[CartItemOut]
+    line_count: int = 0
+    unit_count: int = 0
+    total: Decimal = Decimal("0")  # exacto; en JSON se serializa como string ("2000.00")
     class Config:
         from_attributes = True
 
@@ -32,3 +67,7 @@ class CartCreateIn(BaseModel):
 
 class CartPatchIn(BaseModel):
     items: List[CartItemIn]
+
+class CartCommandIn(BaseModel):
+    cart_id: Optional[int] = None  # None: crea el carrito en la misma transacción
+    items: List[CartItemIn] = []
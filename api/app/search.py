@@ -0,0 +1,222 @@
+# Búsqueda full-text de productos (nombre + descripción).
+#
+# - Postgres: índice GIN sobre to_tsvector('es_unaccent', ...), una configuración
+#   `spanish` con `unaccent`, y ranking con ts_rank. Ver install().
+# - Otros motores (SQLite en local/tests): índice invertido en memoria con el mismo
+#   tratamiento (minúsculas, sin acentos, stemming liviano de plurales/género) y BM25.
+#
+# En ambos casos cada término admite prefijo: "pantal" encuentra "Pantalón".
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.orm import Session
+
+from . import catalog
+from .models import Product
+
+SEARCH_CONFIG = "es_unaccent"
+# Cada cuánto (s) el índice en memoria revisa si otro proceso cambió la tabla (p.ej. seed)
+INDEX_CHECK_SECONDS = float(os.getenv("SEARCH_INDEX_CHECK_SECONDS", "5"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Palabras vacías (subconjunto de las que descarta la config `spanish` de Postgres)
+STOPWORDS = frozenset("a al con de del el en la las lo los o para por que un una y".split())
+
+def fold(s: str) -> str:
+    """Minúsculas y sin acentos ("Pantalón" -> "pantalon")."""
+    s = unicodedata.normalize("NFKD", s.lower())
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+def stem(tok: str) -> str:
+    """Stemming liviano para español: plural y vocal final ("medias"/"media" -> "medi")."""
+    if len(tok) > 4 and tok.endswith("es") and tok[-3] not in "aeiou":
+        tok = tok[:-2]  # pantalones -> pantalon
+    elif len(tok) > 3 and tok.endswith("s"):
+        tok = tok[:-1]
+    if len(tok) > 3 and tok[-1] in "aeo":
+        tok = tok[:-1]  # negra/negro -> negr
+    return tok
+
+def query_terms(q: Optional[str]) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(fold(q or "")) if t not in STOPWORDS]
+
+def tokenize(s: Optional[str]) -> List[str]:
+    return [stem(t) for t in query_terms(s)]
+
+# ---------- Postgres ----------
+
+def install(engine) -> None:
+    """Crea (idempotente) la config de texto y el índice GIN. No-op fuera de Postgres."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        conn.execute(text(f"""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{SEARCH_CONFIG}') THEN
+                    CREATE TEXT SEARCH CONFIGURATION {SEARCH_CONFIG} (COPY = spanish);
+                    ALTER TEXT SEARCH CONFIGURATION {SEARCH_CONFIG}
+                        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+                END IF;
+            END $$;
+        """))
+        conn.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS ix_products_search ON products
+            USING gin (to_tsvector('{SEARCH_CONFIG}'::regconfig, name || ' ' || coalesce(description, '')))
+        """))
+
+def search_document():
+    """name + descripción, la misma expresión que el índice GIN de install(). Los literales van
+    como literal_column: como parámetros, asyncpg compila `name || $1::VARCHAR || ...`, que ya
+    no es la expresión indexada y el planner hace seq scan."""
+    return Product.name + literal_column("' '") + func.coalesce(Product.description, literal_column("''"))
+
+def _pg_search(db: Session, terms: List[str], limit: int, after_id: Optional[int], where: Sequence) -> List[Product]:
+    # Misma expresión que el índice para que el planner lo use
+    config = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+    document = func.to_tsvector(config, search_document())
+    # Los términos ya vienen saneados ([a-z0-9]+), no hay sintaxis de tsquery que escapar
+    query = func.to_tsquery(config, " & ".join(f"{t}:*" for t in terms))
+    stmt = select(Product).where(document.op("@@")(query), *where)
+    if after_id is not None:
+        stmt = stmt.where(Product.id > after_id).order_by(Product.id.asc())
+    else:
+        stmt = stmt.order_by(func.ts_rank(document, query).desc(), Product.id.asc())
+    stmt = stmt.limit(limit)
+    return list(db.execute(stmt).scalars().all())
+
+# ---------- Índice invertido en memoria ----------
+
+class InvertedIndex:
+    """Postings término -> {product_id: tf}, vocabulario ordenado para prefijos y BM25."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, docs: List[Tuple[int, str]]):
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_len: Dict[int, int] = {}
+        for pid, body in docs:
+            toks = tokenize(body)
+            self.doc_len[pid] = len(toks)
+            for t in toks:
+                p = self.postings[t]
+                p[pid] = p.get(pid, 0) + 1
+        self.vocab = sorted(self.postings)
+        self.avg_len = (sum(self.doc_len.values()) / len(self.doc_len)) if self.doc_len else 0.0
+
+    def _expand(self, term: str) -> List[str]:
+        i = bisect.bisect_left(self.vocab, term)
+        out = []
+        while i < len(self.vocab) and self.vocab[i].startswith(term):
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+    def _match(self, terms: List[str], allowed: Optional[Set[int]] = None):
+        n = len(self.doc_len)
+        # Por término de la consulta: los postings de todo el vocabulario que matchea el prefijo
+        expanded = []
+        for term in terms:
+            plists = [(self._idf(t, n), self.postings[t]) for t in self._expand(stem(term))]
+            if not plists:
+                return [], set()
+            expanded.append(plists)
+        # AND entre términos: se intersecta empezando por el más selectivo
+        expanded.sort(key=lambda pl: sum(len(p) for _, p in pl))
+        candidates = set().union(*(p.keys() for _, p in expanded[0]))
+        if allowed is not None:
+            candidates &= allowed
+        for plists in expanded[1:]:
+            candidates = {pid for pid in candidates if any(pid in p for _, p in plists)}
+            if not candidates:
+                break
+        return expanded, candidates
+
+    def search_after(self, terms: List[str], after_id: int, limit: int, allowed: Optional[Set[int]] = None) -> List[int]:
+        """Matches con id > after_id en orden de id (paginación por cursor)."""
+        _, candidates = self._match(terms, allowed)
+        return heapq.nsmallest(limit, (pid for pid in candidates if pid > after_id))
+
+    def search(self, terms: List[str], limit: int, allowed: Optional[Set[int]] = None) -> List[int]:
+        """Top-`limit` por BM25; `allowed` restringe a esos ids (filtros por atributo)."""
+        expanded, candidates = self._match(terms, allowed)
+
+        def score(pid: int) -> float:
+            norm = self.K1 * (1 - self.B + self.B * self.doc_len[pid] / (self.avg_len or 1))
+            total = 0.0
+            for plists in expanded:
+                total += max(idf * p[pid] * (self.K1 + 1) / (p[pid] + norm) for idf, p in plists if pid in p)
+            return total
+
+        return heapq.nsmallest(limit, candidates, key=lambda pid: (-score(pid), pid))
+
+    def _idf(self, term: str, n: int) -> float:
+        df = len(self.postings[term])
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+_index: Optional[InvertedIndex] = None
+_index_version = -1
+_index_signature: Optional[tuple] = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+def _signature(db: Session) -> tuple:
+    return tuple(db.execute(select(func.count(Product.id), func.max(Product.id))).one())
+
+def _get_index(db: Session) -> InvertedIndex:
+    global _index, _index_version, _index_signature, _index_checked_at
+    # Sin locks alrededor del IO: en modo async esto corre en greenlets sobre un mismo thread
+    # y un threading.Lock tomado durante una query bloquearía el event loop. Dos rebuilds
+    # concurrentes son inofensivos; sólo el swap final es atómico.
+    now = time.monotonic()
+    index, version = _index, catalog.current(db)
+    stale = index is None or _index_version != version
+    if not stale and now - _index_checked_at > INDEX_CHECK_SECONDS:
+        _index_checked_at = now
+        stale = _signature(db) != _index_signature
+    if stale:
+        rows = db.execute(
+            select(Product.id, Product.name, Product.description).execution_options(yield_per=5000)
+        )
+        index = InvertedIndex([(pid, f"{name} {desc or ''}") for pid, name, desc in rows])
+        signature = _signature(db)
+        with _index_lock:
+            _index, _index_version, _index_signature, _index_checked_at = index, version, signature, now
+    return index
+
+def _memory_search(db: Session, terms: List[str], limit: int, after_id: Optional[int], where: Sequence) -> List[Product]:
+    index = _get_index(db)
+    # Los filtros por atributo se resuelven en la base (índices compuestos) y acotan los candidatos
+    allowed = set(db.execute(select(Product.id).where(*where)).scalars()) if where else None
+    if after_id is None:
+        ids = index.search(terms, limit, allowed)
+    else:
+        ids = index.search_after(terms, after_id, limit, allowed)
+    if not ids:
+        return []
+    found = {p.id: p for p in db.execute(select(Product).where(Product.id.in_(ids))).scalars()}
+    return [found[i] for i in ids if i in found]
+
+def search_products(db: Session, q: str, limit: int, after_id: Optional[int] = None, where: Sequence = ()) -> List[Product]:
+    """Productos que contienen todos los términos de `q`, ordenados por relevancia.
+
+    Con `after_id` se ordena por id y se devuelven sólo los ids mayores (paginación estable).
+    `where`: condiciones extra sobre Product (p.ej. filtros por atributo).
+    """
+    terms = query_terms(q)
+    if not terms:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _pg_search(db, terms, limit, after_id, where)
+    return _memory_search(db, terms, limit, after_id, where)
@@ -1,93 +1,283 @@
-﻿import os
+import argparse
+import io
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-from sqlalchemy import delete
-from .db import SessionLocal, engine
-from .models import Product
-from .db import Base
+from openpyxl import load_workbook
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from .db import Base, engine
+from .models import CartItem, Product
+from . import catalog, summary
 
 load_dotenv()
 
-def pick_first_numeric(row, candidates):
-    for c in candidates:
-        if c in row and pd.notna(row[c]):
-            try:
-                v = float(str(row[c]).replace(",", "."))
-                return v
-            except Exception:
-                pass
-    return 0.0
-
-def to_int_safe(v):
-    if pd.isna(v):
-        return 0
+ATTRIBUTES = ["tipo", "color", "talle", "categoria"]
+COLUMNS = ["id", "name", "description", "price", "stock", *ATTRIBUTES]
+PRICE_COLS = ["PRECIO_50_U", "PRECIO_100_U", "PRECIO_200_U"]
+TRUTHY = ["si", "sí", "true", "1", "yes"]
+
+def _iter_sheet(xlsx_path: str) -> Iterator[tuple]:
+    # python-calamine (Rust) lee ~100x más rápido que openpyxl; openpyxl read_only como fallback
     try:
-        return int(float(str(v).replace(",", ".")))
-    except Exception:
-        s = str(v).strip().lower()
-        if s in ("si","sí","true","1","yes"):
-            return 1
-        if s in ("no","false","0"):
-            return 0
-        return 0
-
-def seed_products(xlsx_path: str):
-    print(f"Loading {xlsx_path}...")
-    df = pd.read_excel(xlsx_path)
-
-    # Normalizamos encabezados a UPPER
-    norm = {c: str(c).strip().upper() for c in df.columns}
-    df.rename(columns=norm, inplace=True)
-
-    tipo_col   = "TIPO_PRENDA" if "TIPO_PRENDA" in df.columns else None
-    talla_col  = "TALLA" if "TALLA" in df.columns else None
-    color_col  = "COLOR" if "COLOR" in df.columns else None
-    desc_col   = "DESCRIPCIÓN" if "DESCRIPCIÓN" in df.columns else ("DESCRIPCION" if "DESCRIPCION" in df.columns else None)
-    cat_col    = "CATEGORÍA" if "CATEGORÍA" in df.columns else ("CATEGORIA" if "CATEGORIA" in df.columns else None)
-    stock_col  = "CANTIDAD_DISPONIBLE" if "CANTIDAD_DISPONIBLE" in df.columns else ("DISPONIBLE" if "DISPONIBLE" in df.columns else None)
-    price_cols = [c for c in ["PRECIO_50_U","PRECIO_100_U","PRECIO_200_U"] if c in df.columns]
-
-    def build_name(row):
-        parts = []
-        for c in (tipo_col, color_col, talla_col):
-            if c and c in row and pd.notna(row[c]):
-                parts.append(str(row[c]).strip())
-        if parts:
-            return " ".join(parts)
-        # fallback
-        if "ID" in row and pd.notna(row["ID"]):
-            return f"Producto {row['ID']}"
-        return "Producto"
-
-    def build_desc(row):
-        cat = str(row[cat_col]).strip() if cat_col and pd.notna(row.get(cat_col)) else ""
-        desc = str(row[desc_col]).strip() if desc_col and pd.notna(row.get(desc_col)) else ""
-        return f"{cat} — {desc}" if cat and desc else (cat or desc or "")
-
-    def build_price(row):
-        return pick_first_numeric(row, price_cols) if price_cols else 0.0
-
-    def build_stock(row):
-        if stock_col and stock_col in row:
-            return to_int_safe(row[stock_col])
-        return 0
-
-    out = pd.DataFrame()
-    out["name"] = df.apply(build_name, axis=1).fillna("Producto").replace({"": "Producto"})
-    out["description"] = df.apply(build_desc, axis=1).fillna("")
-    out["price"] = pd.to_numeric(df.apply(build_price, axis=1), errors="coerce").fillna(0.0)
-    out["stock"] = pd.to_numeric(df.apply(build_stock, axis=1), errors="coerce").fillna(0).astype(int)
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        wb = load_workbook(xlsx_path, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+    yield from CalamineWorkbook.from_path(xlsx_path).get_sheet_by_index(0).iter_rows()
+
+def read_chunks(xlsx_path: str, chunk_size: int = 10_000) -> Iterator[pd.DataFrame]:
+    """Lee la planilla en streaming y la entrega en DataFrames de `chunk_size` filas,
+    con encabezados normalizados a UPPER."""
+    rows = _iter_sheet(xlsx_path)
+    header = [str(c).strip().upper() if c not in (None, "") else f"COL{i}" for i, c in enumerate(next(rows, ()))]
+    chunk: List[tuple] = []
+    for row in rows:
+        if any(v not in (None, "") for v in row):
+            chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield pd.DataFrame(chunk, columns=header)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=header)
+
+def _first_col(df: pd.DataFrame, *names: str) -> Optional[str]:
+    return next((c for c in names if c in df.columns), None)
+
+def _text(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    if col is None:
+        return pd.Series("", index=df.index, dtype="string")
+    # Las celdas numéricas llegan como float: 38.0 -> "38"
+    return df[col].astype("string").str.strip().str.replace(r"(?<=\d)\.0$", "", regex=True).fillna("")
+
+def _attr(s: pd.Series) -> pd.Series:
+    # Igual que search.fold: minúsculas y sin acentos ("Pantalón" -> "pantalon"); vacío -> NULL
+    folded = s.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii").str.lower()
+    return folded.astype(object).where(folded != "", None)
+
+def _numeric(s: pd.Series) -> pd.Series:
+    # "12,5" -> 12.5; lo que no sea número -> NaN
+    return pd.to_numeric(s.astype("string").str.strip().str.replace(",", ".", regex=False), errors="coerce")
+
+def transform(df: pd.DataFrame, first_row: int = 1) -> pd.DataFrame:
+    """Planilla -> columnas de `products`, con operaciones vectorizadas (sin apply por fila).
+
+    `id` sale de la columna ID; si falta, del número de fila (first_row = número de la
+    primera fila del chunk) para que las recargas sean estables.
+    """
+    tipo = _text(df, _first_col(df, "TIPO_PRENDA"))
+    color = _text(df, _first_col(df, "COLOR"))
+    talla = _text(df, _first_col(df, "TALLA"))
+    cat = _text(df, _first_col(df, "CATEGORÍA", "CATEGORIA"))
+    desc = _text(df, _first_col(df, "DESCRIPCIÓN", "DESCRIPCION"))
+    stock_col = _first_col(df, "CANTIDAD_DISPONIBLE", "DISPONIBLE")
+
+    if "ID" in df.columns:
+        ids = _numeric(df["ID"])
+    else:
+        ids = pd.Series(np.arange(first_row, first_row + len(df)), index=df.index, dtype="float")
+
+    out = pd.DataFrame(index=df.index)
+    out["id"] = ids
+
+    name = (tipo + " " + color + " " + talla).str.replace(r"\s+", " ", regex=True).str.strip()
+    fallback = ("Producto " + ids.astype("Int64").astype("string")).fillna("Producto")
+    out["name"] = name.mask(name == "", fallback).astype(object)
+
+    out["description"] = pd.Series(
+        np.where((cat != "") & (desc != ""), cat + " — " + desc, cat + desc), index=df.index
+    ).astype(object)
+
+    for col, values in zip(ATTRIBUTES, (tipo, color, talla, cat)):
+        out[col] = _attr(values)
+
+    # Precio: el primer PRECIO_* numérico de la fila
+    price = pd.Series(np.nan, index=df.index)
+    for c in PRICE_COLS:
+        if c in df.columns:
+            price = price.fillna(_numeric(df[c]))
+    out["price"] = price.fillna(0.0).round(2)
 
+    # Stock: número (truncado) o "Sí"/"No" -> 1/0
+    if stock_col:
+        raw = df[stock_col]
+        flag = raw.astype("string").str.strip().str.lower().isin(TRUTHY).astype(float)
+        out["stock"] = np.trunc(_numeric(raw).fillna(flag)).astype(int)
+    else:
+        out["stock"] = 0
+
+    # Filas sin id usable se descartan; ante ids repetidos gana la última
+    out = out[out["id"].notna()]
+    out["id"] = out["id"].astype(int)
+    return out.drop_duplicates(subset="id", keep="last")[COLUMNS]
+
+# ---------- Carga: COPY + diff en SQL (Postgres) ----------
+
+def _load_postgres(conn, chunks: Iterator[pd.DataFrame], incremental: bool, prune: bool) -> Dict[str, int]:
+    conn.execute(text(
+        "CREATE TEMP TABLE products_stage (LIKE products INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+    cursor = conn.connection.driver_connection.cursor()
+    rows = 0
+    for df in chunks:
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        cursor.copy_expert(
+            f"COPY products_stage ({', '.join(COLUMNS)}) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NOT_NULL (description))",
+            buf,
+        )
+        rows += len(df)
+    # Si hubo ids repetidos entre chunks, gana el último (mayor ctid)
+    conn.execute(text(
+        "DELETE FROM products_stage a USING products_stage b WHERE a.id = b.id AND a.ctid < b.ctid"
+    ))
+
+    # La planilla trae stock físico; `products.stock` es el disponible (descontadas las
+    # reservas de carritos, ver app/stock.py). EXCLUSIVE deja leer pero espera a las
+    # mutaciones de carritos en curso y frena las nuevas hasta el commit: las reservas no
+    # cambian entre la suma y el upsert. Carritos antes que productos, el mismo orden que
+    # las mutaciones (el seed después recalcula resúmenes de carritos).
+    conn.execute(text("LOCK TABLE carts, products IN EXCLUSIVE MODE"))
+    conn.execute(text("""
+        UPDATE products_stage s SET stock = GREATEST(s.stock - h.qty, 0)
+        FROM (SELECT product_id, SUM(qty) AS qty FROM cart_items GROUP BY product_id) h
+        WHERE h.product_id = s.id
+    """))
+
+    data = [c for c in COLUMNS if c != "id"]
+    changed = (
+        f"WHERE p.id IS NULL OR ({', '.join('p.' + c for c in data)}) "
+        f"IS DISTINCT FROM ({', '.join('s.' + c for c in data)})"
+    ) if incremental else ""
+    result = conn.execute(text(f"""
+        INSERT INTO products ({', '.join(COLUMNS)})
+        SELECT {', '.join('s.' + c for c in COLUMNS)}
+        FROM products_stage s LEFT JOIN products p ON p.id = s.id
+        {changed}
+        ON CONFLICT (id) DO UPDATE SET
+            {', '.join(f'{c} = excluded.{c}' for c in data)}
+        RETURNING id, (xmax = 0) AS inserted
+    """)).all()
+    updated = [pid for pid, inserted in result if not inserted]
+    summary.refresh_carts(conn, updated)  # el total de los carritos depende del precio
+    stats = {"rows": rows, "inserted": len(result) - len(updated), "updated": len(updated), "deleted": 0}
+
+    if prune:
+        stats["deleted"] = conn.execute(text("""
+            DELETE FROM products p
+            WHERE NOT EXISTS (SELECT 1 FROM products_stage s WHERE s.id = p.id)
+              AND NOT EXISTS (SELECT 1 FROM cart_items ci WHERE ci.product_id = p.id)
+        """)).rowcount
+    # Los ids vienen de la planilla: la secuencia tiene que quedar por delante
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('products', 'id'), COALESCE(MAX(id), 1)) FROM products"
+    ))
+    return stats
+
+# ---------- Carga: diff en pandas + executemany (SQLite y otros) ----------
+
+def _available(conn, df: pd.DataFrame) -> pd.DataFrame:
+    """Stock de la planilla menos lo reservado por carritos (`products.stock` es el disponible)."""
+    held = dict(conn.execute(
+        select(CartItem.product_id, func.sum(CartItem.qty))
+        .where(CartItem.product_id.in_(df["id"].tolist()))
+        .group_by(CartItem.product_id)
+    ).all())
+    if not held:
+        return df
+    return df.assign(stock=(df["stock"] - df["id"].map(held).fillna(0)).clip(lower=0).astype(int))
+
+def _load_generic(conn, chunks: Iterator[pd.DataFrame], incremental: bool, prune: bool) -> Dict[str, int]:
+    dialect = conn.dialect.name
+    upsert = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(Product)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[Product.id],
+        set_={c: upsert.excluded[c] for c in COLUMNS if c != "id"},
+    )
+    stats = {"rows": 0, "inserted": 0, "updated": 0, "deleted": 0}
+    seen: set = set()
+    updated: List[int] = []
+    for df in chunks:
+        stats["rows"] += len(df)
+        seen.update(df["id"].tolist())
+        df = _available(conn, df)
+        current = pd.DataFrame(
+            conn.execute(select(*[getattr(Product, c) for c in COLUMNS]).where(Product.id.in_(df["id"].tolist()))).all(),
+            columns=COLUMNS,
+        )
+        merged = df.merge(current, on="id", how="left", suffixes=("", "_db"), indicator=True)
+        is_new = merged["_merge"] == "left_only"
+        differs = (
+            (merged["name"] != merged["name_db"])
+            | (merged["description"].fillna("") != merged["description_db"].fillna(""))
+            | ((merged["price"] - pd.to_numeric(merged["price_db"])).abs() > 0.004)
+            | (merged["stock"] != merged["stock_db"])
+        )
+        for c in ATTRIBUTES:
+            differs |= merged[c].fillna("") != merged[f"{c}_db"].fillna("")
+        write = merged[is_new | differs] if incremental else merged
+        if len(write):
+            conn.execute(upsert, write[COLUMNS].to_dict("records"))
+        inserted = int((write["_merge"] == "left_only").sum())
+        stats["inserted"] += inserted
+        stats["updated"] += len(write) - inserted
+        updated.extend(write.loc[write["_merge"] == "both", "id"].tolist())
+    summary.refresh_carts(conn, updated)  # el total de los carritos depende del precio
+
+    if prune:
+        referenced = set(conn.execute(select(CartItem.product_id).distinct()).scalars())
+        existing = set(conn.execute(select(Product.id)).scalars())
+        gone = sorted(existing - seen - referenced)
+        for i in range(0, len(gone), 1000):
+            stats["deleted"] += conn.execute(delete(Product).where(Product.id.in_(gone[i:i + 1000]))).rowcount
+    return stats
+
+def seed_products(xlsx_path: str, mode: str = "incremental", prune: bool = False, chunk_size: int = 10_000) -> Dict[str, int]:
+    """Carga la planilla en `products` sin borrar la tabla (los ids de los carritos se mantienen).
+
+    - incremental: sólo escribe filas nuevas o que cambiaron respecto de la tabla.
+    - full: escribe todas las filas (upsert).
+    - prune: borra productos que ya no están en la planilla y ningún carrito referencia.
+
+    El stock que se escribe (y se compara) es el de la planilla menos lo que ya reservan los
+    carritos, así una recarga no devuelve unidades que están en un carrito.
+    """
+    print(f"Loading {xlsx_path} ({mode})...")
+    t0 = time.perf_counter()
     Base.metadata.create_all(bind=engine)
-    with SessionLocal() as db:
-        db.execute(delete(Product))
-        db.commit()
-        objs = [Product(name=r.name, description=r.description, price=float(r.price), stock=int(r.stock)) for r in out.itertuples(index=False)]
-        db.add_all(objs)
-        db.commit()
-    print(f"Seeded {len(objs)} products.")
+
+    def chunks():
+        first_row = 1
+        for raw in read_chunks(xlsx_path, chunk_size):
+            yield transform(raw, first_row)
+            first_row += len(raw)
+
+    load = _load_postgres if engine.dialect.name == "postgresql" else _load_generic
+    with engine.begin() as conn:
+        stats = load(conn, chunks(), incremental=(mode == "incremental"), prune=prune)
+        catalog.bump_db(conn)  # los procesos de la API se enteran en su próximo chequeo
+    catalog.bump()
+    print(
+        f"Seeded {stats['rows']} rows: {stats['inserted']} inserted, {stats['updated']} updated, "
+        f"{stats['deleted']} deleted in {time.perf_counter() - t0:.2f}s."
+    )
+    return stats
 
 if __name__ == "__main__":
-    xlsx = os.getenv("PRODUCTS_XLSX", "./data/products.xlsx")
-    seed_products(xlsx)
+    parser = argparse.ArgumentParser(description="Carga products.xlsx en la tabla products")
+    parser.add_argument("xlsx", nargs="?", default=os.getenv("PRODUCTS_XLSX", "./data/products.xlsx"))
+    parser.add_argument("--mode", choices=["incremental", "full"], default="incremental")
+    parser.add_argument("--prune", action="store_true", help="borra productos ausentes en la planilla y sin carritos")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+    seed_products(args.xlsx, mode=args.mode, prune=args.prune, chunk_size=args.chunk_size)
@@ -0,0 +1,89 @@
+# Reserva de stock. `products.stock` es el stock disponible: cada mutación de carrito lo
+# descuenta (o lo devuelve) en la misma transacción, y los carritos vencidos lo liberan.
+#
+# Orden de locks, siempre el mismo para que no haya deadlocks: primero la fila del carrito
+# (UPDATE carts ... en apply_patch / INSERT en apply_create / SELECT ... FOR UPDATE en
+# expire_carts), después las filas de products en orden de id. Las escrituras ORM sobre
+# Product, que recalculan los carritos que las contienen, también bloquean esos carritos
+# primero (catalog._before_flush). Sólo se bloquean las filas
+# tocadas: carritos que no comparten productos no se esperan entre sí.
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+from fastapi import HTTPException
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from . import catalog
+from .models import Cart, CartItem, Product
+
+# Carritos sin cambios durante este tiempo se vencen y devuelven su stock
+CART_TTL_SECONDS = int(os.getenv("CART_TTL_SECONDS", str(24 * 3600)))
+
+def reserve(db: Session, deltas: Dict[int, int]) -> None:
+    """Aplica {product_id: unidades}: positivo reserva (stock -= d), negativo libera.
+
+    Un único UPDATE condicional `WHERE stock >= d`; si algún producto no alcanza, 409 y la
+    transacción del llamador se descarta entera (no queda nada reservado a medias).
+    """
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return
+    ids = sorted(deltas)
+    if db.get_bind().dialect.name == "postgresql":
+        # Locks de fila en orden de id antes del UPDATE (el UPDATE multi-fila no garantiza orden)
+        db.execute(select(Product.id).where(Product.id.in_(ids)).order_by(Product.id).with_for_update())
+    delta = case(deltas, value=Product.id)
+    updated = set(
+        db.execute(
+            update(Product)
+            .where(Product.id.in_(ids), Product.stock >= delta)
+            .values(stock=Product.stock - delta)
+            .returning(Product.id)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+    )
+    # Los caches de respuestas de productos se invalidan por id cuando commitea
+    catalog.stock_changed(db, updated)
+    short = [pid for pid in ids if pid not in updated]
+    if short:
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for products: {short}")
+
+def expire_carts(db: Session, idle_seconds: int = CART_TTL_SECONDS, batch: int = 500) -> int:
+    """Borra carritos sin cambios hace más de `idle_seconds` y devuelve su stock. Devuelve
+    cuántos se vencieron. Pensado para correr periódicamente (cron): `python -m app.stock`."""
+    # updated_at se guarda en UTC sin zona (CURRENT_TIMESTAMP / now() con TZ=UTC)
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=idle_seconds)
+    expired = 0
+    while True:
+        # SKIP LOCKED: un carrito que se está modificando ahora no está vencido
+        ids = db.execute(
+            select(Cart.id)
+            .where(Cart.updated_at < cutoff)
+            .order_by(Cart.id)
+            .limit(batch)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            return expired
+        held = db.execute(
+            select(CartItem.product_id, func.sum(CartItem.qty))
+            .where(CartItem.cart_id.in_(ids))
+            .group_by(CartItem.product_id)
+        ).all()
+        reserve(db, {pid: -int(qty) for pid, qty in held})
+        db.execute(delete(CartItem).where(CartItem.cart_id.in_(ids)))
+        db.execute(delete(Cart).where(Cart.id.in_(ids)))
+        db.commit()
+        expired += len(ids)
+
+if __name__ == "__main__":
+    from .db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Vence carritos inactivos y libera su stock")
+    parser.add_argument("--idle-seconds", type=int, default=CART_TTL_SECONDS)
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        print(f"Expired {expire_carts(db, args.idle_seconds)} carts.")
@@ -0,0 +1,58 @@
+# Resumen desnormalizado de carritos (line_count, unit_count, total). Se recalcula en la misma
+# transacción que lo invalida: cada mutación de un carrito (routers/carts.py) y cada cambio de
+# productos que un carrito contiene (seed y escrituras ORM sobre Product, ver app/catalog.py),
+# porque `total` depende de `products.price` (y el body embebe el producto: también sube la
+# versión, base del ETag).
+from typing import Iterable
+
+from sqlalchemy import func, select, update
+
+from .models import Cart, CartItem, Product
+
+BATCH = 1000
+
+def update_summaries(db, where, **values) -> None:
+    """Recalcula el resumen de los carritos que cumplen `where`, con un UPDATE (subconsultas
+    por carrito; las lecturas después lo sirven sin tocar las líneas). `values`: columnas extra
+    a escribir en el mismo UPDATE. `db`: Session o Connection."""
+    of_cart = CartItem.cart_id == Cart.id
+    db.execute(
+        update(Cart)
+        .where(where)
+        .values(
+            **values,
+            line_count=select(func.count(CartItem.id)).where(of_cart).scalar_subquery(),
+            unit_count=select(func.coalesce(func.sum(CartItem.qty), 0)).where(of_cart).scalar_subquery(),
+            total=select(func.coalesce(func.sum(CartItem.qty * Product.price), 0))
+            .join(Product, Product.id == CartItem.product_id)
+            .where(of_cart)
+            .scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def lock_carts(db, product_ids: Iterable[int]) -> None:
+    """Bloquea (SELECT ... FOR UPDATE, en orden de id) los carritos que tienen alguno de estos
+    productos. Llamar antes de escribir sobre products: las mutaciones de carritos bloquean el
+    carrito y después los productos (app/stock.py), así que una escritura de productos que
+    después actualiza carritos (refresh_carts) tiene que tomarlos en el mismo orden o puede
+    quedar en deadlock. En SQLite el FOR UPDATE no se emite (los escritores ya se serializan)."""
+    ids = sorted(set(product_ids))
+    carts = set()
+    for i in range(0, len(ids), BATCH):
+        carts.update(db.execute(
+            select(CartItem.cart_id).where(CartItem.product_id.in_(ids[i:i + BATCH]))
+        ).scalars())
+    carts = sorted(carts)
+    for i in range(0, len(carts), BATCH):
+        db.execute(select(Cart.id).where(Cart.id.in_(carts[i:i + BATCH])).order_by(Cart.id).with_for_update())
+
+def refresh_carts(db, product_ids: Iterable[int]) -> None:
+    """Recalcula el resumen de los carritos que tienen alguno de estos productos (p.ej. cambió
+    el precio) y les sube la versión: el body de GET /carts/{id} embebe los productos, así que
+    el ETag anterior deja de valer. Llamar en la misma transacción que la escritura sobre
+    products. No cuenta como actividad del carrito (updated_at queda igual, ver stock.expire_carts)."""
+    ids = sorted(set(product_ids))
+    for i in range(0, len(ids), BATCH):
+        holding = select(CartItem.cart_id).where(CartItem.product_id.in_(ids[i:i + BATCH]))
+        update_summaries(db, Cart.id.in_(holding), version=Cart.version + 1, updated_at=Cart.updated_at)
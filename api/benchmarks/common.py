@@ -0,0 +1,129 @@
+# Utilidades compartidas por los benchmarks de la API (correr desde api/: `python -m benchmarks.<script>`).
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+API_DIR = Path(__file__).resolve().parents[1]
+
+TIPOS = ["Pantalón", "Camiseta", "Falda", "Sudadera", "Media", "Chaqueta", "Camisa"]
+COLORES = ["Negro", "Blanco", "Verde", "Rojo", "Azul", "Gris", "Amarillo"]
+TALLAS = ["S", "M", "L", "XL", "XXL"]
+CATEGORIAS = ["Deportivo", "Casual", "Formal"]
+DESCRIPCIONES = ["Ideal para uso diario.", "Prenda cómoda y ligera.", "Diseño moderno y elegante."]
+
+
+def temp_sqlite_url() -> str:
+    return f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+
+
+def make_catalog(database_url: str, n: int, seed: int = 42) -> None:
+    """Crea las tablas y carga `n` productos sintéticos. Corre en un subproceso para no
+    atar este proceso a un DATABASE_URL (app.db lo lee al importarse)."""
+    code = (
+        "import random, sys\n"
+        "from sqlalchemy import insert\n"
+        "from app.db import Base, engine\n"
+        "from app.models import Product\n"
+        "from benchmarks.common import synthetic_rows\n"
+        "Base.metadata.drop_all(engine); Base.metadata.create_all(engine)\n"
+        "rows = synthetic_rows(int(sys.argv[1]), int(sys.argv[2]))\n"
+        "with engine.begin() as conn:\n"
+        "    for i in range(0, len(rows), 5000):\n"
+        "        conn.execute(insert(Product), rows[i:i + 5000])\n"
+    )
+    env = {**os.environ, "DATABASE_URL": database_url}
+    subprocess.run([sys.executable, "-c", code, str(n), str(seed)], cwd=API_DIR, env=env, check=True)
+
+
+def _attr(value: str) -> str:
+    # Misma normalización que el seed para tipo/color/talle/categoria
+    return "".join(ch for ch in unicodedata.normalize("NFKD", value.lower()) if not unicodedata.combining(ch))
+
+
+def synthetic_rows(n: int, seed: int = 42) -> List[Dict]:
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        tipo, color, talla, cat = rnd.choice(TIPOS), rnd.choice(COLORES), rnd.choice(TALLAS), rnd.choice(CATEGORIAS)
+        rows.append({
+            "name": f"{tipo} {color} {talla}",
+            "description": f"{cat} — {rnd.choice(DESCRIPCIONES)}",
+            "price": rnd.randint(300, 1500),
+            "stock": rnd.randint(10_000, 100_000),
+            "tipo": _attr(tipo), "color": _attr(color), "talle": _attr(talla), "categoria": _attr(cat),
+        })
+    return rows
+
+
+def search_terms(seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    return [f"{rnd.choice(TIPOS)} {rnd.choice(COLORES)}".lower() for _ in range(50)] + [t.lower() for t in TIPOS]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def serve(database_url: str, env: Optional[Dict[str, str]] = None, workers: int = 1):
+    """Levanta `uvicorn app.main:app` en un subproceso y devuelve su base URL."""
+    port = _free_port()
+    proc_env = {**os.environ, "DATABASE_URL": database_url, **(env or {})}
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=API_DIR, env=proc_env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline or proc.poll() is not None:
+                raise RuntimeError("uvicorn no levantó")
+            time.sleep(0.1)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    k = min(len(s) - 1, max(0, int(round(p / 100 * (len(s) - 1)))))
+    return s[k]
+
+
+async def run_concurrent(task: Callable[[httpx.AsyncClient, int], Awaitable[None]],
+                         concurrency: int, total: int, base_url: str) -> float:
+    """Ejecuta `total` tareas con a lo sumo `concurrency` en vuelo; devuelve el tiempo total (s)."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                await task(client, queue.get_nowait())
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - t0
@@ -0,0 +1,214 @@
+"""Benchmark de carga y latencia de la API, con comparación contra un baseline guardado.
+
+Levanta `uvicorn app.main:app` contra un catálogo sintético (SQLite temporal o la base de
+--database-url) y corre una mezcla de requests a concurrencia fija:
+
+    search       GET /products?q=...            (búsquedas del agente, repetidas => cache)
+    detail       GET /products/{id}
+    cart_create  POST /carts
+    cart_patch   PATCH /carts/{id}              (sobre un pool de carritos creados antes)
+    cart_read    GET /carts/{id}
+
+Reporta por endpoint y total: requests/s, p50/p95/p99 y errores. Ejemplos (desde api/):
+
+    python -m benchmarks.suite                                   # mezcla por defecto
+    python -m benchmarks.suite --mix search=1 --requests 5000    # un solo endpoint
+    python -m benchmarks.suite --save-baseline                   # guarda benchmarks/baseline.json
+    python -m benchmarks.suite --check                           # compara; exit 1 si hay regresión
+    python -m benchmarks.suite --env PRODUCT_CACHE_SIZE=0        # sin cache de respuestas
+
+Los números dependen de la máquina: el baseline se genera y se compara en el mismo entorno
+(p.ej. el runner de CI). Ojo: con --database-url la base se vacía y se recarga.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from .common import make_catalog, percentile, run_concurrent, search_terms, serve, temp_sqlite_url
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+ENDPOINTS = ("search", "detail", "cart_create", "cart_patch", "cart_read")
+DEFAULT_MIX = "search=40,detail=25,cart_read=15,cart_patch=15,cart_create=5"
+# Endpoints que bloquean el deploy si empeoran (los que usa el agente en cada mensaje)
+HOT = ("search", "detail", "cart_patch", "cart_read")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"endpoint desconocido en --mix: {name!r} (opciones: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def create_carts(base_url: str, n: int, n_products: int, seed: int = 1) -> List[int]:
+    rnd = random.Random(seed)
+    ids = []
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        for _ in range(n):
+            items = [{"product_id": rnd.randint(1, n_products), "qty": 1} for _ in range(3)]
+            r = client.post("/carts", json={"items": items})
+            r.raise_for_status()
+            ids.append(r.json()["id"])
+    return ids
+
+
+async def run_mix(base_url: str, mix: Dict[str, float], n_products: int, carts: List[int],
+                  concurrency: int, total: int, seed: int = 0):
+    terms = search_terms()
+    names, weights = list(mix), list(mix.values())
+    latencies: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+
+    def request(client: httpx.AsyncClient, name: str, rnd: random.Random):
+        pid = rnd.randint(1, n_products)
+        if name == "search":
+            return client.get("/products", params={"q": rnd.choice(terms), "limit": 20})
+        if name == "detail":
+            return client.get(f"/products/{pid}")
+        if name == "cart_create":
+            return client.post("/carts", json={"items": [{"product_id": pid, "qty": 1}]})
+        cart_id = rnd.choice(carts)
+        if name == "cart_patch":
+            # set (no inc): la reserva de stock queda acotada aunque se repita muchas veces
+            return client.patch(f"/carts/{cart_id}", json={"items": [{"product_id": pid, "qty": rnd.randint(0, 3)}]})
+        return client.get(f"/carts/{cart_id}")
+
+    async def task(client, i):
+        rnd = random.Random(seed * 1_000_003 + i)
+        name = rnd.choices(names, weights)[0]
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        try:
+            r = await request(client, name, rnd)
+            r.raise_for_status()
+        except Exception:
+            errors[name] += 1
+            return
+        latencies[name].append((loop.time() - t0) * 1000)
+
+    elapsed = await run_concurrent(task, concurrency, total, base_url)
+    result = {n: summarize(latencies[n], errors[n], elapsed) for n in names}
+    result["total"] = summarize([x for n in names for x in latencies[n]], sum(errors.values()), elapsed)
+    return result
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Regresiones de `current` respecto de `baseline`: p95 más alto o throughput más bajo que la
+    tolerancia relativa (más `slack_ms` absolutos para no saltar por ruido en latencias de 1-2
+    ms). p99 se informa pero no corta: con unos miles de requests es demasiado ruidoso."""
+    problems = []
+    for name in (*HOT, "total"):
+        cur, base = current["endpoints"].get(name), baseline["endpoints"].get(name)
+        if not cur or not base:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance) + slack_ms
+        if cur["p95_ms"] > limit:
+            problems.append(f"{name}: p95 {cur['p95_ms']:.1f} ms > {limit:.1f} (baseline {base['p95_ms']:.1f})")
+        floor = base["rps"] * (1 - tolerance)
+        if name == "total" and cur["rps"] < floor:
+            problems.append(f"total: rps {cur['rps']:.0f} < {floor:.0f} (baseline {base['rps']:.0f})")
+        if cur["errors"] > base["errors"]:
+            problems.append(f"{name}: {cur['errors']} errores (baseline {base['errors']})")
+    return problems
+
+
+def print_table(endpoints: Dict, baseline: Optional[Dict] = None) -> None:
+    print(f"{'endpoint':12} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8}"
+          + ("  Δp95 vs baseline" if baseline else ""))
+    for name, s in endpoints.items():
+        line = (f"{name:12} {s['count']:7d} {s['rps']:8.1f} {s['p50_ms']:8.1f} "
+                f"{s['p95_ms']:8.1f} {s['p99_ms']:8.1f} {s['errors']:8d}")
+        base = (baseline or {}).get("endpoints", {}).get(name)
+        if base and base["p95_ms"]:
+            line += f"  {(s['p95_ms'] / base['p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--database-url", help="base a usar (default: SQLite temporal)")
+    ap.add_argument("--products", type=int, default=5000)
+    ap.add_argument("--carts", type=int, default=200, help="carritos creados antes de medir (cart_patch/cart_read)")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=4000)
+    ap.add_argument("--warmup", type=int, default=200, help="requests sin medir antes de la corrida")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"pesos por endpoint (default: {DEFAULT_MIX})")
+    ap.add_argument("--mode", choices=["sync", "async"], default="sync")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--env", action="append", default=[], metavar="K=V", help="variables extra para la API")
+    ap.add_argument("--out", help="guarda el resultado en este JSON")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--save-baseline", action="store_true", help="guarda el resultado como baseline")
+    ap.add_argument("--check", action="store_true", help="compara con el baseline; exit 1 si hay regresión")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="regresión relativa permitida (0.25 = 25%%)")
+    ap.add_argument("--slack-ms", type=float, default=2.0, help="margen absoluto de latencia")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    db_url = args.database_url or temp_sqlite_url()
+    make_catalog(db_url, args.products)
+    env = {"API_ASYNC": "1" if args.mode == "async" else "0", **dict(e.split("=", 1) for e in args.env)}
+
+    print(f"{args.products} productos | {args.requests} requests | concurrencia {args.concurrency} | "
+          f"modo {args.mode} | mezcla {args.mix}")
+    with serve(db_url, env=env, workers=args.workers) as base:
+        carts = create_carts(base, args.carts, args.products)
+        if args.warmup:
+            asyncio.run(run_mix(base, mix, args.products, carts, args.concurrency, args.warmup, seed=1))
+        endpoints = asyncio.run(run_mix(base, mix, args.products, carts, args.concurrency, args.requests))
+
+    result = {
+        "meta": {
+            "products": args.products, "requests": args.requests, "concurrency": args.concurrency,
+            "mix": args.mix, "mode": args.mode, "workers": args.workers, "env": args.env,
+            "database": db_url.split(":", 1)[0], "python": platform.python_version(),
+            "machine": platform.machine(), "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "endpoints": endpoints,
+    }
+    baseline = json.loads(Path(args.baseline).read_text()) if Path(args.baseline).exists() else None
+    print_table(endpoints, baseline if args.check else None)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2) + "\n")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(result, indent=2) + "\n")
+        print(f"baseline guardado en {args.baseline}")
+    if args.check:
+        if baseline is None:
+            raise SystemExit(f"no hay baseline en {args.baseline} (correr con --save-baseline)")
+        if baseline["meta"]["mix"] != args.mix or baseline["meta"]["concurrency"] != args.concurrency:
+            print("aviso: el baseline se generó con otra mezcla/concurrencia")
+        problems = compare(result, baseline, args.tolerance, args.slack_ms)
+        for p in problems:
+            print("REGRESIÓN", p)
+        if problems:
+            sys.exit(1)
+        print("sin regresiones respecto del baseline")
+
+
+if __name__ == "__main__":
+    main()
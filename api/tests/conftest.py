@@ -0,0 +1,77 @@
+# api/tests/conftest.py — correr desde api/: `python -m pytest -q`
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+# SQLite efímera; tiene que estar definida antes de importar app.db
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'test.db'}"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.main import app, create_app  # noqa: E402
+from app.db import Base, SessionLocal, engine, get_async_engine  # noqa: E402
+from app.models import Product  # noqa: E402
+from app import catalog  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            # catalog_meta no: la versión compartida sólo crece (si se reinicia, otro proceso
+            # podría ver el mismo número con otro catálogo)
+            if table.name != "catalog_meta":
+                conn.execute(table.delete())
+    catalog.bump()
+    yield
+
+
+@pytest.fixture(params=["sync", "async"])
+def client(request):
+    # Cada test de endpoints corre contra ambos modos (API_ASYNC=0/1)
+    with TestClient(app if request.param == "sync" else create_app(async_mode=True)) as c:
+        yield c
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def make_products(db):
+    def _make(*rows):
+        objs = [Product(**{"description": "", "price": 100, "stock": 10, **r}) for r in rows]
+        db.add_all(objs)
+        db.commit()
+        return [p.id for p in objs]
+    return _make
+
+
+@contextmanager
+def _count_queries():
+    statements = []
+    engines = (engine, get_async_engine().sync_engine)
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for e in engines:
+        event.listen(e, "before_cursor_execute", _before)
+    try:
+        yield statements
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", _before)
+
+
+@pytest.fixture
+def count_queries():
+    """`with count_queries() as stmts:` junta los statements ejecutados (engines sync y async)."""
+    return _count_queries
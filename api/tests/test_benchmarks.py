@@ -0,0 +1,31 @@
+# api/tests/test_benchmarks.py — sólo la lógica de comparación (la corrida real levanta uvicorn)
+import copy
+
+import pytest
+
+from benchmarks.suite import compare, parse_mix
+
+
+def _result(p95=10.0, rps=500.0, errors=0):
+    stats = {"count": 100, "errors": errors, "rps": rps, "p50_ms": 5.0, "p95_ms": p95, "p99_ms": 20.0}
+    return {"endpoints": {name: dict(stats) for name in ("search", "detail", "cart_patch", "cart_read", "cart_create", "total")}}
+
+
+def test_parse_mix():
+    assert parse_mix("search=3, detail") == {"search": 3.0, "detail": 1.0}
+    with pytest.raises(SystemExit):
+        parse_mix("checkout=1")
+
+
+def test_compare_flags_p95_throughput_and_errors():
+    base = _result()
+    assert compare(copy.deepcopy(base), base, tolerance=0.25, slack_ms=2) == []
+    cur = _result()
+    cur["endpoints"]["search"]["p95_ms"] = 12.4  # dentro de 25% + 2 ms
+    cur["endpoints"]["cart_create"]["p95_ms"] = 100  # no es endpoint caliente
+    assert compare(cur, base, 0.25, 2) == []
+    cur["endpoints"]["detail"]["p95_ms"] = 15
+    cur["endpoints"]["total"]["rps"] = 300
+    cur["endpoints"]["cart_read"]["errors"] = 3
+    problems = compare(cur, base, 0.25, 2)
+    assert [p.split(":")[0] for p in problems] == ["detail", "cart_read", "total"]
@@ -0,0 +1,208 @@
+# api/tests/test_carts.py
+import pytest
+
+from app.models import Product
+
+
+def test_create_and_patch_cart(client, make_products):
+    p1, p2 = make_products({"name": "Media negra M", "price": 1000}, {"name": "Media blanca L", "price": 1100})
+    r = client.post("/carts", json={"items": [{"product_id": p1, "qty": 1}, {"product_id": p2, "qty": 2}]})
+    assert r.status_code == 201
+    cart = r.json()
+    assert sorted((i["product"]["id"], i["qty"]) for i in cart["items"]) == [(p1, 1), (p2, 2)]
+
+    r = client.patch(f"/carts/{cart['id']}", json={"items": [{"product_id": p1, "qty": 3}, {"product_id": p2, "qty": 0}]})
+    assert r.status_code == 200
+    assert [(i["product"]["id"], i["qty"]) for i in r.json()["items"]] == [(p1, 3)]
+
+
+def test_cart_404s(client, make_products):
+    (p1,) = make_products({"name": "Media"})
+    assert client.post("/carts", json={"items": [{"product_id": 999, "qty": 1}]}).status_code == 404
+    assert client.patch("/carts/999", json={"items": [{"product_id": p1, "qty": 1}]}).status_code == 404
+
+
+@pytest.mark.parametrize("method", ["post", "patch"])
+def test_cart_queries_do_not_grow_with_items(client, make_products, count_queries, method):
+    ids = make_products(*({"name": f"Media {i}"} for i in range(20)))
+
+    def run(n):
+        items = [{"product_id": pid, "qty": 1} for pid in ids[:n]]
+        if method == "post":
+            with count_queries() as stmts:
+                r = client.post("/carts", json={"items": items})
+        else:
+            cart_id = client.post("/carts", json={"items": items[:1]}).json()["id"]
+            with count_queries() as stmts:
+                r = client.patch(f"/carts/{cart_id}", json={"items": items})
+        assert r.status_code in (200, 201)
+        assert len(r.json()["items"]) == n
+        return len(stmts)
+
+    assert run(2) == run(20)
+
+
+def _qtys(cart):
+    return {i["product"]["id"]: i["qty"] for i in cart["items"]}
+
+
+def test_patch_increments_and_removes_at_zero(client, make_products):
+    p1, p2 = make_products({"name": "Media"}, {"name": "Remera"})
+    cart_id = client.post("/carts", json={"items": [{"product_id": p1, "qty": 2}]}).json()["id"]
+
+    r = client.patch(f"/carts/{cart_id}", json={"items": [
+        {"product_id": p1, "qty": 3, "op": "inc"},
+        {"product_id": p2, "qty": 1, "op": "inc"},
+        {"product_id": p2, "qty": 1, "op": "inc"},
+    ]})
+    assert _qtys(r.json()) == {p1: 5, p2: 2}
+
+    r = client.patch(f"/carts/{cart_id}", json={"items": [{"product_id": p1, "qty": -5, "op": "inc"}]})
+    assert _qtys(r.json()) == {p2: 2}
+
+    # set seguido de inc en el mismo batch
+    r = client.patch(f"/carts/{cart_id}", json={"items": [
+        {"product_id": p2, "qty": 10}, {"product_id": p2, "qty": -1, "op": "inc"},
+    ]})
+    assert _qtys(r.json()) == {p2: 9}
+
+
+def test_negative_set_is_rejected(client, make_products):
+    (p1,) = make_products({"name": "Media"})
+    cart_id = client.post("/carts", json={"items": [{"product_id": p1, "qty": 1}]}).json()["id"]
+    assert client.patch(f"/carts/{cart_id}", json={"items": [{"product_id": p1, "qty": -1}]}).status_code == 422
+
+
+def test_concurrent_increments_are_not_lost(make_products):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.db import SessionLocal
+    from app.routers import carts
+    from app.schemas import CartCreateIn, CartPatchIn
+
+    p1, p2 = make_products({"name": "Media", "stock": 100}, {"name": "Remera", "stock": 100})
+    with SessionLocal() as db:
+        cart_id = carts.apply_create(db, CartCreateIn(items=[{"product_id": p1, "qty": 1}])).id
+
+    def add_one(i):
+        with SessionLocal() as db:
+            carts.apply_patch(db, cart_id, CartPatchIn(items=[
+                {"product_id": p1, "qty": 1, "op": "inc"}, {"product_id": p2, "qty": 1, "op": "inc"},
+            ]))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add_one, range(40)))
+
+    with SessionLocal() as db:
+        cart = carts.load_cart(db, cart_id)
+        assert {i.product_id: i.qty for i in cart.items} == {p1: 41, p2: 40}
+
+
+def test_get_cart_etag_and_304(client, make_products, count_queries):
+    p1, p2 = make_products({"name": "Media"}, {"name": "Remera"})
+    created = client.post("/carts", json={"items": [{"product_id": p1, "qty": 1}]})
+    cart_id = created.json()["id"]
+
+    r = client.get(f"/carts/{cart_id}")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert etag == created.headers["ETag"]
+    assert _qtys(r.json()) == {p1: 1}
+
+    with count_queries() as stmts:
+        r = client.get(f"/carts/{cart_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert len(stmts) == 1  # sólo la versión, sin items ni productos
+
+    patched = client.patch(f"/carts/{cart_id}", json={"items": [{"product_id": p2, "qty": 1, "op": "inc"}]})
+    assert patched.headers["ETag"] != etag
+    r = client.get(f"/carts/{cart_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == patched.headers["ETag"]
+    assert _qtys(r.json()) == {p1: 1, p2: 1}
+
+
+def test_get_cart_404(client):
+    assert client.get("/carts/999").status_code == 404
+    assert client.get("/carts/999", headers={"If-None-Match": '"cart-999-v1"'}).status_code == 404
+
+
+def test_cart_summary_is_exact_and_maintained(client, make_products):
+    p1, p2 = make_products({"name": "Media", "price": "0.10"}, {"name": "Remera", "price": "1099.99"})
+    cart = client.post("/carts", json={"items": [{"product_id": p1, "qty": 3}]}).json()
+    assert (cart["line_count"], cart["unit_count"], cart["total"]) == (1, 3, "0.30")
+
+    cart = client.patch(f"/carts/{cart['id']}", json={"items": [{"product_id": p2, "qty": 2, "op": "inc"}]}).json()
+    assert (cart["line_count"], cart["unit_count"], cart["total"]) == (2, 5, "2200.28")
+
+    cart = client.patch(f"/carts/{cart['id']}", json={"items": [{"product_id": p2, "qty": 0}]}).json()
+    assert (cart["line_count"], cart["unit_count"], cart["total"]) == (1, 3, "0.30")
+    assert client.get(f"/carts/{cart['id']}").json()["total"] == "0.30"
+
+
+def test_product_change_updates_cart_total_and_etag(client, make_products, db):
+    (pid,) = make_products({"name": "Media", "price": 1000})
+    cart_id = client.post("/carts", json={"items": [{"product_id": pid, "qty": 2}]}).json()["id"]
+
+    etag = client.get(f"/carts/{cart_id}").headers["ETag"]
+
+    db.get(Product, pid).price = 1500
+    db.commit()
+    r = client.get(f"/carts/{cart_id}", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["ETag"] != etag
+    assert r.json()["total"] == "3000.00" and r.json()["items"][0]["product"]["price"] == 1500
+
+    # Un cambio de nombre también invalida la copia del cliente
+    db.get(Product, pid).name = "Media larga"
+    db.commit()
+    r = client.get(f"/carts/{cart_id}", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 200 and r.json()["items"][0]["product"]["name"] == "Media larga"
+
+
+def test_product_write_locks_its_carts_before_the_product(client, make_products, db, count_queries):
+    (pid,) = make_products({"name": "Media", "price": 1000})
+    client.post("/carts", json={"items": [{"product_id": pid, "qty": 2}]})
+    product = db.get(Product, pid)
+    with count_queries() as stmts:
+        product.price = 1500
+        db.commit()
+    # Mismo orden que una mutación de carrito (carrito, después productos): sin deadlocks en Postgres
+    lock = next(i for i, s in enumerate(stmts) if s.startswith("SELECT carts.id"))
+    write = next(i for i, s in enumerate(stmts) if s.startswith("UPDATE products"))
+    assert lock < write
+
+
+def test_cart_command_creates_validates_and_applies_in_one_request(client, make_products, count_queries):
+    p1, p2 = make_products({"name": "Media negra M", "price": 1000, "stock": 5}, {"name": "Media blanca L", "price": 1100})
+
+    r = client.post("/carts/commands", json={"items": [{"product_id": p1, "qty": 2, "op": "inc"}]})
+    assert r.status_code == 201 and r.headers["ETag"]
+    cart = r.json()
+    assert _qtys(cart) == {p1: 2} and cart["total"] == "2000.00" and cart["unit_count"] == 2
+
+    with count_queries() as queries:
+        r = client.post("/carts/commands", json={"cart_id": cart["id"], "items": [
+            {"product_id": p1, "qty": 1, "op": "inc"}, {"product_id": p2, "qty": 1}]})
+    assert r.status_code == 200
+    assert _qtys(r.json()) == {p1: 3, p2: 1} and r.json()["total"] == "4100.00"
+    # lock, productos, cantidades actuales, stock, 2 upserts, delete, resumen, carga (2)
+    assert len(queries) <= 10
+
+    # Sin items y sin cart_id: carrito vacío (lo que antes rechazaba POST /carts)
+    empty = client.post("/carts/commands", json={})
+    assert empty.status_code == 201 and empty.json()["items"] == []
+
+
+def test_cart_command_errors_roll_back_everything(client, make_products, db):
+    from app.models import Cart, Product
+
+    (p1,) = make_products({"name": "Media", "stock": 2})
+    carts_before = db.query(Cart).count()
+    assert client.post("/carts/commands", json={"items": [{"product_id": 999, "qty": 1}]}).status_code == 404
+    assert client.post("/carts/commands", json={"items": [{"product_id": p1, "qty": 5}]}).status_code == 409
+    db.expire_all()
+    assert db.query(Cart).count() == carts_before  # no quedó un carrito vacío creado a medias
+    assert db.get(Product, p1).stock == 2
+
+    r = client.post("/carts/commands", json={"cart_id": 999, "items": [{"product_id": p1, "qty": 1}]})
+    assert r.status_code == 404 and r.json()["detail"] == "Cart not found"
@@ -0,0 +1,31 @@
+# api/tests/test_metrics.py
+from prometheus_client import REGISTRY
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_per_route_template_with_db_queries(client, make_products):
+    (pid,) = make_products({"name": "Remera negra"})
+    route = "/products/{product_id}"
+    before = _sample("http_request_duration_seconds_count", method="GET", route=route, status="200")
+    queries_before = _sample("db_queries_per_request_sum", route=route)
+
+    client.get("/products/cache")  # ruta estática declarada antes: no cuenta como {product_id}
+    assert client.get(f"/products/{pid}").status_code == 200
+    assert client.get("/products/999999").status_code == 404
+
+    assert _sample("http_request_duration_seconds_count", method="GET", route=route, status="200") == before + 1
+    assert _sample("http_request_duration_seconds_count", method="GET", route=route, status="404") >= 1
+    # Cada request a la base suma sus queries (también en modo async, vía run_sync)
+    assert _sample("db_queries_per_request_sum", route=route) > queries_before
+    assert _sample("db_pool_checkout_wait_seconds_count", engine="sync") > 0  # make_products
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert 'route="/products/{product_id}"' in body
+    assert "db_query_duration_seconds_bucket" in body
+    assert 'route="/metrics"' not in body  # el scrape no se mide a sí mismo
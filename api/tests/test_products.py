@@ -0,0 +1,281 @@
+# api/tests/test_products.py
+import json
+
+from sqlalchemy import create_engine, select
+
+from app import catalog, search
+from app.db import engine
+from app.models import CatalogMeta, Product
+from app.routers.products import ResponseCache
+
+
+def test_list_products_ordered_by_id(client, make_products):
+    ids = make_products({"name": "Media negra M"}, {"name": "Remera blanca L"})
+    r = client.get("/products")
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()] == ids
+
+
+def test_search_stems_plural_and_gender(client, make_products):
+    make_products(
+        {"name": "Media negra M", "description": "Casual — Cómoda"},
+        {"name": "Media blanca L", "description": "Casual — Clásica"},
+        {"name": "Pantalón negro XL", "description": "Formal — Elegante"},
+    )
+    r = client.get("/products", params={"q": "medias negras"})
+    assert [p["name"] for p in r.json()] == ["Media negra M"]
+
+
+def test_search_folds_accents_and_prefixes(client, make_products):
+    make_products({"name": "Pantalón Verde XXL"}, {"name": "Camiseta Verde S"})
+    assert [p["name"] for p in client.get("/products", params={"q": "pantalon"}).json()] == ["Pantalón Verde XXL"]
+    assert [p["name"] for p in client.get("/products", params={"q": "PANTAL"}).json()] == ["Pantalón Verde XXL"]
+    assert len(client.get("/products", params={"q": "verdes"}).json()) == 2
+
+
+def test_search_ranks_by_relevance(client, make_products):
+    make_products(
+        {"name": "Camiseta Negro S", "description": "Deportivo — Prenda cómoda"},
+        {"name": "Camiseta Deportivo M", "description": "Deportivo — Deportivo y liviano"},
+    )
+    names = [p["name"] for p in client.get("/products", params={"q": "deportivo"}).json()]
+    assert names == ["Camiseta Deportivo M", "Camiseta Negro S"]
+
+
+def test_search_sees_new_products(client, make_products):
+    assert client.get("/products", params={"q": "falda"}).json() == []
+    make_products({"name": "Falda Roja S"})
+    assert len(client.get("/products", params={"q": "falda"}).json()) == 1
+
+
+def test_tokenize():
+    assert search.tokenize("Medias NEGRAS de algodón") == ["medi", "negr", "algodon"]
+    assert search.tokenize("pantalones") == search.tokenize("Pantalón")
+
+
+def test_keyset_pagination_walks_whole_catalog(client, make_products):
+    ids = make_products(*({"name": f"Media {i}"} for i in range(7)))
+    seen, after = [], None
+    while True:
+        params = {"limit": 3, **({"after_id": after} if after is not None else {})}
+        r = client.get("/products", params=params)
+        seen += [p["id"] for p in r.json()]
+        after = r.headers.get("X-Next-After-Id")
+        if after is None:
+            break
+    assert seen == ids
+
+
+def test_pg_search_document_matches_index_under_asyncpg():
+    # Sin parámetros: con `$1::VARCHAR` la expresión no coincide con la del índice GIN
+    from sqlalchemy.dialects.postgresql import asyncpg, psycopg2
+
+    for dialect in (asyncpg.dialect(), psycopg2.dialect()):
+        compiled = search.search_document().compile(dialect=dialect)
+        assert str(compiled) == "products.name || ' ' || coalesce(products.description, '')"
+        assert not compiled.params
+
+
+def test_search_with_cursor_orders_by_id(client, make_products):
+    ids = make_products({"name": "Media negra"}, {"name": "Falda"}, {"name": "Media blanca"}, {"name": "Media roja"})
+    r = client.get("/products", params={"q": "media", "after_id": 0, "limit": 2})
+    assert [p["id"] for p in r.json()] == [ids[0], ids[2]]
+    assert r.headers["X-Next-After-Id"] == str(ids[2])
+    r = client.get("/products", params={"q": "media", "after_id": ids[2], "limit": 2})
+    assert [p["id"] for p in r.json()] == [ids[3]]
+
+
+def test_ndjson_stream(client, make_products):
+    ids = make_products(*({"name": f"Remera {i}", "price": 10.5} for i in range(5)))
+    r = client.get("/products", params={"after_id": ids[1]}, headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [p["id"] for p in rows] == ids[2:]
+    assert rows[0] == {
+        "id": ids[2], "name": "Remera 2", "description": "", "price": 10.5, "stock": 10,
+        "tipo": None, "color": None, "talle": None, "categoria": None,
+    }
+
+
+def test_batch_preserves_order_and_reports_missing(client, make_products):
+    a, b, c = make_products({"name": "A"}, {"name": "B"}, {"name": "C"})
+    r = client.post("/products/batch", json={"ids": [c, 999, a, c]})
+    assert r.status_code == 200
+    body = r.json()
+    assert [p["id"] for p in body["items"]] == [c, a]
+    assert body["missing"] == [999]
+
+
+def test_batch_thousands_of_ids_in_one_query(client, db, count_queries):
+    from sqlalchemy import insert
+    from app.models import Product
+
+    db.execute(insert(Product), [{"name": f"P{i}", "price": 1, "stock": 1} for i in range(4000)])
+    db.commit()
+    ids = list(range(4500, 0, -1))  # orden inverso, 500 inexistentes
+    with count_queries() as stmts:
+        r = client.post("/products/batch", json={"ids": ids})
+    body = r.json()
+    assert len(stmts) == 1
+    assert [p["id"] for p in body["items"]] == list(range(4000, 0, -1))
+    assert body["missing"] == list(range(4500, 4000, -1))
+
+
+def test_batch_upper_bound(client):
+    assert client.post("/products/batch", json={"ids": list(range(1, 5002))}).status_code == 422
+    assert client.post("/products/batch", json={"ids": []}).status_code == 422
+
+
+def _catalog(make_products):
+    return make_products(
+        {"name": "Pantalón Negro M", "tipo": "pantalon", "color": "negro", "talle": "m", "categoria": "formal"},
+        {"name": "Pantalón Negro L", "tipo": "pantalon", "color": "negro", "talle": "l", "categoria": "formal"},
+        {"name": "Pantalón Azul M", "tipo": "pantalon", "color": "azul", "talle": "m", "categoria": "casual"},
+        {"name": "Camiseta Negro M", "tipo": "camiseta", "color": "negro", "talle": "m", "categoria": "casual"},
+        {"name": "Gorra"},
+    )
+
+
+def test_filter_by_attributes(client, make_products):
+    ids = _catalog(make_products)
+    r = client.get("/products", params={"color": "Negro", "talle": "M"})
+    assert [p["id"] for p in r.json()] == [ids[0], ids[3]]
+    assert r.json()[0]["tipo"] == "pantalon"
+    # Varios valores de un atributo: OR; normaliza acentos
+    r = client.get("/products", params={"tipo": "Pantalón", "talle": "m,l"})
+    assert [p["id"] for p in r.json()] == ids[:3]
+    # Combinado con búsqueda y con el export NDJSON
+    assert [p["id"] for p in client.get("/products", params={"q": "negro", "tipo": "camiseta"}).json()] == [ids[3]]
+    r = client.get("/products", params={"color": "azul"}, headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line)["id"] for line in r.text.splitlines()] == [ids[2]]
+
+
+def test_filtered_listing_uses_equality_not_like(client, make_products, count_queries):
+    _catalog(make_products)
+    with count_queries() as stmts:
+        client.get("/products", params={"color": "negro", "talle": "m"})
+    sql = " ".join(stmts).lower()
+    assert "products.color = " in sql and "like" not in sql
+
+
+def test_facets_count_each_attribute_without_its_own_filter(client, make_products):
+    _catalog(make_products)
+    body = client.get("/products/facets", params={"tipo": "pantalon", "talle": "m"}).json()
+    assert body["total"] == 2
+    # Talles disponibles para pantalón (sin aplicar talle=m)
+    assert body["talle"] == [{"value": "m", "count": 2}, {"value": "l", "count": 1}]
+    assert body["color"] == [{"value": "azul", "count": 1}, {"value": "negro", "count": 1}]
+    # Tipos en talle m
+    assert body["tipo"] == [{"value": "pantalon", "count": 2}, {"value": "camiseta", "count": 1}]
+    assert client.get("/products/facets").json()["total"] == 5
+
+
+def test_hot_search_is_served_from_cache_without_db(client, make_products, count_queries):
+    make_products({"name": "Media negra M"}, {"name": "Media blanca L"})
+    first = client.get("/products", params={"q": "medias negras"})
+    assert first.headers["X-Cache"] == "miss"
+    with count_queries() as stmts:
+        again = client.get("/products", params={"q": "Medias  NEGRAS"})  # misma consulta normalizada
+    assert again.headers["X-Cache"] == "hit" and stmts == []
+    assert again.content == first.content
+    assert again.json() == [{
+        "id": first.json()[0]["id"], "name": "Media negra M", "description": "", "price": 100.0, "stock": 10,
+        "tipo": None, "color": None, "talle": None, "categoria": None,
+    }]
+    assert client.get("/products/cache").json()["hit_rate"] > 0
+
+
+def test_cached_page_keeps_cursor_header(client, make_products):
+    ids = make_products(*({"name": f"Media {i}"} for i in range(4)))
+    client.get("/products", params={"limit": 2})
+    r = client.get("/products", params={"limit": 2})
+    assert r.headers["X-Cache"] == "hit" and r.headers["X-Next-After-Id"] == str(ids[1])
+
+
+def test_product_detail_cache_and_404(client, make_products):
+    (pid,) = make_products({"name": "Gorra"})
+    assert client.get(f"/products/{pid}").headers["X-Cache"] == "miss"
+    assert client.get(f"/products/{pid}").headers["X-Cache"] == "hit"
+    assert client.get("/products/999").status_code == 404
+
+
+def test_stock_reservation_invalidates_only_affected_entries(client, make_products):
+    a, b = make_products({"name": "Media"}, {"name": "Gorra"})
+    client.get(f"/products/{a}")
+    client.get(f"/products/{b}")
+    client.get("/products")
+    assert client.post("/carts", json={"items": [{"product_id": a, "qty": 3}]}).status_code == 201
+    r = client.get(f"/products/{a}")
+    assert r.headers["X-Cache"] == "miss" and r.json()["stock"] == 7
+    listing = client.get("/products")
+    assert listing.headers["X-Cache"] == "miss" and listing.json()[0]["stock"] == 7
+    assert client.get(f"/products/{b}").headers["X-Cache"] == "hit"
+
+
+def test_product_write_invalidates(client, make_products, db):
+    (pid,) = make_products({"name": "Gorra"})
+    client.get(f"/products/{pid}")
+    db.get(Product, pid).price = 250
+    db.commit()
+    assert client.get(f"/products/{pid}").json()["price"] == 250.0
+
+
+def test_read_between_flush_and_commit_is_not_cached_as_new(client, make_products, db):
+    (pid,) = make_products({"name": "Gorra"})
+    db.get(Product, pid).price = 250
+    db.flush()
+    # Todavía sin commit: la lectura ve el precio viejo y no puede quedar como versión nueva
+    assert client.get(f"/products/{pid}").json()["price"] == 100.0
+    db.commit()
+    assert client.get(f"/products/{pid}").json()["price"] == 250.0
+
+
+def test_product_write_rolled_back_keeps_the_version(make_products, db):
+    (pid,) = make_products({"name": "Gorra"})
+    before = catalog.version()
+    db.get(Product, pid).price = 250
+    db.flush()
+    db.rollback()
+    db.commit()
+    assert catalog.version() == before
+
+
+def test_reseed_from_another_process_invalidates(client, make_products, monkeypatch):
+    (pid,) = make_products({"name": "Gorra"})
+    client.get(f"/products/{pid}")
+    # Otro proceso (seed) cambia la tabla y sube la versión compartida, sin tocar la local
+    with engine.begin() as conn:
+        conn.execute(Product.__table__.update().values(name="Gorra roja"))
+        catalog.bump_db(conn)
+    monkeypatch.setattr(catalog, "CHECK_SECONDS", 0)
+    assert client.get(f"/products/{pid}").json()["name"] == "Gorra roja"
+
+
+def test_bump_db_creates_the_row_with_an_upsert(tmp_path):
+    other = create_engine(f"sqlite:///{tmp_path / 'meta.db'}")
+    CatalogMeta.__table__.create(other)
+    with other.begin() as conn:
+        catalog.bump_db(conn)  # sin fila: la crea
+        catalog.bump_db(conn)
+        assert conn.execute(select(CatalogMeta.id, CatalogMeta.version)).all() == [(1, 2)]
+    other.dispose()
+
+
+def test_response_cache_is_lru_and_bounded():
+    cache = ResponseCache(maxsize=2, max_bytes=1000, ttl=60)
+    for key in ("a", "b"):
+        cache.put(key, 1, cache.generation, [key], [1])
+    assert cache.get("a", 1) is not None  # "a" pasa a ser la más reciente
+    cache.put("c", 1, cache.generation, ["c"], [2])
+    assert cache.get("b", 1) is None and cache.get("a", 1) is not None
+    assert cache.get("a", 2) is None  # otra versión del catálogo
+    cache.put("big", 1, cache.generation, ["x" * 2000], [3])
+    assert cache.get("big", 1) is None
+    # Una respuesta armada antes de una invalidación por stock no se guarda
+    generation = cache.generation
+    cache.invalidate_products([9])
+    cache.put("late", 1, generation, [], [9])
+    assert cache.get("late", 1) is None
+    assert cache.stats()["evictions"] == 1
+
@@ -0,0 +1,70 @@
+# api/tests/test_profiling.py
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import profiling
+from app.db import engine, get_async_engine
+from app.main import create_app
+
+
+@pytest.fixture(params=["sync", "async"])
+def profiled_client(request, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secreto")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "MAX_FILES", 2)
+    # Los listeners de SQL quedan registrados; sin profile activo no hacen nada
+    profiling.instrument_engine(engine)
+    profiling.instrument_engine(get_async_engine().sync_engine)
+    with TestClient(create_app(async_mode=request.param == "async")) as c:
+        yield c, tmp_path
+
+
+def test_disabled_by_default(client):
+    r = client.get("/health", headers={"X-Profile": ""})
+    assert "X-Profile-Id" not in r.headers
+
+
+def test_header_profiles_request_with_sql(profiled_client, make_products):
+    client, out = profiled_client
+    (pid,) = make_products({"name": "Remera negra"})
+
+    assert "X-Profile-Id" not in client.get(f"/products/{pid}").headers
+    assert "X-Profile-Id" not in client.get(f"/products/{pid}", headers={"X-Profile": "otro"}).headers
+
+    r = client.get("/products", params={"q": "remera", "fresh": 1}, headers={"X-Profile": "secreto"})
+    assert r.status_code == 200
+    profile_id = r.headers["X-Profile-Id"]
+    meta = json.loads((out / f"{profile_id}.json").read_text())
+    assert meta["route"] == "/products" and meta["status"] == 200
+    assert meta["sql_count"] >= 1 and any("products" in s["sql"] for s in meta["sql"])
+    for line in (out / f"{profile_id}.collapsed").read_text().splitlines():
+        stack, n = line.rsplit(" ", 1)
+        assert stack and int(n) > 0
+
+
+def test_output_directory_is_bounded(profiled_client):
+    client, out = profiled_client
+    ids = [client.get("/health", headers={"X-Profile": "secreto"}).headers["X-Profile-Id"] for _ in range(4)]
+    assert sorted(p.stem for p in out.glob("*.collapsed")) == sorted(ids[-2:])
+    assert len(list(out.glob("*.json"))) == 2
+
+
+def test_profile_is_written_off_the_event_loop(profiled_client, monkeypatch):
+    client, out = profiled_client
+    on_loop = []
+    write = profiling.write
+
+    def spy(profile, meta):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return write(profile, meta)
+
+    monkeypatch.setattr(profiling, "write", spy)
+    assert client.get("/health", headers={"X-Profile": "secreto"}).headers["X-Profile-Id"]
+    assert on_loop == [False]
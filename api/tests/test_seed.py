@@ -0,0 +1,137 @@
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import select
+
+from app.models import Cart, CartItem, Product
+from app.routers import carts
+from app.schemas import CartCreateIn, CartPatchIn
+from app.seed import seed_products, transform
+
+HEADER = ["ID", "TIPO_PRENDA", "TALLA", "COLOR", "CANTIDAD_DISPONIBLE", "PRECIO_50_U", "PRECIO_100_U", "DISPONIBLE", "CATEGORÍA", "DESCRIPCIÓN"]
+
+
+@pytest.fixture
+def write_xlsx(tmp_path):
+    def _write(rows):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(HEADER)
+        for r in rows:
+            ws.append(r)
+        path = tmp_path / "products.xlsx"
+        wb.save(path)
+        return str(path)
+    return _write
+
+
+def _rows(n, price=1000):
+    return [[i, "Camiseta", "M", "Negro", 10, price, 900, "Sí", "Casual", "Algodón"] for i in range(1, n + 1)]
+
+
+def test_transform_is_equivalent_to_row_rules():
+    df = pd.DataFrame(
+        [
+            [7, "Pantalón", " L ", "Azul", "12,9", None, "1.234,5", "Sí", "Formal", "Lino"],
+            [8, None, None, None, None, "abc", "45,5", "no", None, "Sólo descripción"],
+            [9, None, None, None, None, None, None, "Sí", "Casual", None],
+        ],
+        columns=HEADER,
+    )
+    out = transform(df).set_index("id")
+    base = ["name", "description", "price", "stock"]
+    assert out.loc[7, base].tolist() == ["Pantalón Azul L", "Formal — Lino", 0.0, 12]
+    assert out.loc[8, base].tolist() == ["Producto 8", "Sólo descripción", 45.5, 0]
+    # Atributos normalizados para filtrar; vacíos -> NULL
+    assert out.loc[7, ["tipo", "color", "talle", "categoria"]].tolist() == ["pantalon", "azul", "l", "formal"]
+    assert out.loc[8, ["tipo", "color", "talle", "categoria"]].tolist() == [None, None, None, None]
+    # Sin stock numérico: "Sí" -> 1 sólo si viene en la columna de stock
+    assert out.loc[9, "name"] == "Producto 9" and out.loc[9, "description"] == "Casual"
+
+
+def test_transform_prefers_first_numeric_price():
+    df = pd.DataFrame([[1, "Gorra", None, None, 3, None, "250", None, None, None]], columns=HEADER)
+    assert transform(df)["price"].tolist() == [250.0]
+
+
+def test_seed_inserts_with_source_ids(write_xlsx, db):
+    stats = seed_products(write_xlsx(_rows(25)), chunk_size=10)
+    assert stats == {"rows": 25, "inserted": 25, "updated": 0, "deleted": 0}
+    products = db.execute(select(Product).order_by(Product.id)).scalars().all()
+    assert [p.id for p in products] == list(range(1, 26))
+    assert products[0].name == "Camiseta Negro M" and products[0].price == Decimal("1000.00")
+
+
+def test_incremental_reseed_only_writes_changes_and_keeps_carts(write_xlsx, db):
+    seed_products(write_xlsx(_rows(20)), chunk_size=7)
+    cart = Cart(items=[CartItem(product_id=3, qty=2)])
+    db.add(cart)
+    db.commit()
+
+    rows = _rows(22)
+    rows[2][5] = 1500  # cambia el precio del producto 3
+    stats = seed_products(write_xlsx(rows), chunk_size=7)
+    assert stats == {"rows": 22, "inserted": 2, "updated": 1, "deleted": 0}
+
+    db.expire_all()
+    assert db.get(Product, 3).price == Decimal("1500.00")
+    assert db.get(CartItem, cart.items[0].id).product_id == 3
+
+    # Sin cambios: no se escribe nada
+    stats = seed_products(write_xlsx(rows))
+    assert (stats["inserted"], stats["updated"]) == (0, 0)
+
+    # Cambio sólo en un atributo: se detecta y se escribe
+    rows[4][3] = "Azul"
+    assert seed_products(write_xlsx(rows))["updated"] == 1
+    db.expire_all()
+    assert db.get(Product, 5).color == "azul"
+
+
+def test_full_mode_and_prune_keep_referenced_products(write_xlsx, db):
+    seed_products(write_xlsx(_rows(5)))
+    db.add(Cart(items=[CartItem(product_id=5, qty=1)]))
+    db.commit()
+
+    stats = seed_products(write_xlsx(_rows(3)), mode="full", prune=True)
+    assert stats == {"rows": 3, "inserted": 0, "updated": 3, "deleted": 1}
+    assert db.execute(select(Product.id).order_by(Product.id)).scalars().all() == [1, 2, 3, 5]
+
+
+def test_reseed_keeps_stock_reserved_by_carts(write_xlsx, db):
+    seed_products(write_xlsx(_rows(3)))
+    cart_id = carts.apply_create(db, CartCreateIn(items=[{"product_id": 2, "qty": 2}])).id
+    db.expire_all()
+    assert db.get(Product, 2).stock == 8
+
+    # Misma planilla: el disponible ya es 10 - 2, no hay nada que escribir
+    assert seed_products(write_xlsx(_rows(3)))["updated"] == 0
+    assert seed_products(write_xlsx(_rows(3)), mode="full")["updated"] == 3
+    db.expire_all()
+    assert db.get(Product, 2).stock == 8
+
+    rows = _rows(3)
+    rows[1][4] = 15  # llegó mercadería
+    assert seed_products(write_xlsx(rows))["updated"] == 1
+    db.expire_all()
+    assert db.get(Product, 2).stock == 13
+
+    # Al soltar el carrito vuelve al stock físico de la planilla, no por encima
+    carts.apply_patch(db, cart_id, CartPatchIn(items=[{"product_id": 2, "qty": 0}]))
+    db.expire_all()
+    assert db.get(Product, 2).stock == 15
+
+
+def test_reseed_price_change_updates_cart_totals(write_xlsx, client):
+    seed_products(write_xlsx(_rows(3)))
+    created = client.post("/carts", json={"items": [{"product_id": 1, "qty": 2}, {"product_id": 2, "qty": 1}]})
+    cart_id = created.json()["id"]
+
+    rows = _rows(3)
+    rows[0][5] = 1500
+    seed_products(write_xlsx(rows))
+    r = client.get(f"/carts/{cart_id}", headers={"If-None-Match": created.headers["ETag"]})
+    assert r.status_code == 200
+    assert r.json()["total"] == "4000.00" and r.json()["items"][0]["product"]["price"] == 1500
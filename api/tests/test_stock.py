@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from app import stock
+from app.db import SessionLocal
+from app.models import Cart, CartItem, Product
+from app.routers import carts
+from app.schemas import CartCreateIn, CartPatchIn
+
+
+def _stock(db, pid):
+    db.expire_all()
+    return db.get(Product, pid).stock
+
+
+def test_mutations_reserve_and_release_stock(client, make_products, db):
+    p1, p2 = make_products({"name": "Media", "stock": 5}, {"name": "Remera", "stock": 5})
+    cart_id = client.post("/carts", json={"items": [{"product_id": p1, "qty": 3}]}).json()["id"]
+    assert _stock(db, p1) == 2
+
+    r = client.patch(f"/carts/{cart_id}", json={"items": [
+        {"product_id": p1, "qty": 1}, {"product_id": p2, "qty": 2, "op": "inc"},
+    ]})
+    assert r.status_code == 200
+    assert (_stock(db, p1), _stock(db, p2)) == (4, 3)
+
+    client.patch(f"/carts/{cart_id}", json={"items": [{"product_id": p2, "qty": -9, "op": "inc"}]})
+    assert _stock(db, p2) == 5
+
+
+def test_insufficient_stock_is_409_and_changes_nothing(client, make_products, db):
+    p1, p2 = make_products({"name": "Media", "stock": 5}, {"name": "Remera", "stock": 1})
+    created = client.post("/carts", json={"items": [{"product_id": p1, "qty": 1}]})
+    cart = created.json()
+
+    r = client.patch(f"/carts/{cart['id']}", json={"items": [
+        {"product_id": p1, "qty": 2, "op": "inc"}, {"product_id": p2, "qty": 2},
+    ]})
+    assert r.status_code == 409
+    assert str(p2) in r.json()["detail"]
+    assert (_stock(db, p1), _stock(db, p2)) == (4, 1)
+    assert client.get(f"/carts/{cart['id']}").headers["ETag"] == created.headers["ETag"]
+
+    assert client.post("/carts", json={"items": [{"product_id": p2, "qty": 2}]}).status_code == 409
+    assert db.execute(select(func.count(Cart.id))).scalar() == 1
+
+
+def test_expired_carts_release_stock(make_products, db):
+    p1, p2 = make_products({"name": "Media", "stock": 5}, {"name": "Remera", "stock": 5})
+    old = carts.apply_create(db, CartCreateIn(items=[{"product_id": p1, "qty": 2}, {"product_id": p2, "qty": 1}])).id
+    fresh = carts.apply_create(db, CartCreateIn(items=[{"product_id": p1, "qty": 1}])).id
+    db.execute(update(Cart).where(Cart.id == old).values(updated_at=func.datetime("now", "-2 hours")))
+    db.commit()
+
+    assert stock.expire_carts(db, idle_seconds=3600) == 1
+    assert (_stock(db, p1), _stock(db, p2)) == (4, 5)
+    assert db.execute(select(Cart.id)).scalars().all() == [fresh]
+    assert stock.expire_carts(db, idle_seconds=3600) == 0
+
+
+def test_hot_sku_never_oversells(make_products, capsys):
+    # Sólo cubre que no se sobrevende bajo concurrencia. La suite corre sobre SQLite, que
+    # serializa a los escritores: el orden de locks de fila de Postgres (carrito, luego
+    # productos por id, SELECT ... FOR UPDATE en stock.reserve) no se ejercita acá.
+    (hot, other), available = make_products({"name": "Hot", "stock": 50}, {"name": "Otro", "stock": 1000}), 50
+    attempts = 16 * 12
+    with SessionLocal() as db:
+        existing = [
+            carts.apply_create(db, CartCreateIn(items=[{"product_id": other, "qty": 1}])).id for _ in range(8)
+        ]
+
+    def buy(i):
+        with SessionLocal() as db:
+            try:
+                # Mitad carritos nuevos, mitad incrementos (op inc) sobre carritos existentes,
+                # siempre tocando el SKU caliente
+                if i % 2:
+                    carts.apply_patch(db, existing[i % len(existing)],
+                                      CartPatchIn(items=[{"product_id": hot, "qty": 1, "op": "inc"}]))
+                else:
+                    carts.apply_create(db, CartCreateIn(items=[{"product_id": other, "qty": 1}, {"product_id": hot, "qty": 1}]))
+                return True
+            except HTTPException as e:
+                assert e.status_code == 409
+                return False
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(buy, range(attempts)))
+    elapsed = time.perf_counter() - t0
+
+    with SessionLocal() as db:
+        held = db.execute(select(func.coalesce(func.sum(CartItem.qty), 0)).where(CartItem.product_id == hot)).scalar()
+        left = db.get(Product, hot).stock
+    oversell = held - available
+    with capsys.disabled():
+        print(f"\nhot SKU: {attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s), "
+              f"{sum(results)} reserved, oversell={oversell}")
+    assert oversell == 0
+    assert sum(results) == available and left == 0
+    assert any(results[1::2]) and any(results[::2])  # los dos caminos reservaron
@@ -0,0 +1,96 @@
+# app/agent/async_tools.py
+# Contraparte async de tools.py (httpx.AsyncClient) para ShoppingAgent.handle_async: un turno
+# que espera a la API no ocupa un thread, y un único event loop atiende cientos de sesiones.
+#
+# - Mismas caches que tools.py (productos, búsquedas, snapshots de carrito con ETag): los
+#   turnos sync y async se benefician de lo que trae el otro.
+# - Un AsyncClient por event loop (httpx no se puede compartir entre loops), con pool de
+#   conexiones keep-alive de API_POOL_SIZE (como la sesión de requests).
+# - Errores: ApiError igual que tools.py; los de transporte son httpx.HTTPError.
+from __future__ import annotations
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .. import profiling
+from ..metrics import timed_tool
+from .cache import MISS
+from .tools import (
+    API_BASE, SEARCH_TIMEOUT, _absorb_cart, _cart_snapshots, _handle_response,
+    _normalize_query, _product_cache, _remember_products, _search_cache, _stale_cart,
+)
+
+_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", "16"))
+_TIMEOUT = httpx.Timeout(10.0)
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None  # tests: httpx.MockTransport
+
+def _get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        limits = httpx.Limits(max_connections=_POOL_SIZE, max_keepalive_connections=_POOL_SIZE)
+        hooks = {"request": [_profile_request], "response": [_profile_response]} if profiling.PROFILE_TOKEN else {}
+        _client = httpx.AsyncClient(
+            base_url=API_BASE, timeout=_TIMEOUT, limits=limits, transport=_transport, event_hooks=hooks,
+        )
+        _client_loop = loop
+    return _client
+
+# Igual que la sesión de tools.py: en un turno perfilado la API recibe X-Profile y su id vuelve
+async def _profile_request(request: httpx.Request) -> None:
+    request.headers.update(profiling.outgoing_headers())
+
+async def _profile_response(response: httpx.Response) -> None:
+    profiling.collect_api_profile(response)
+
+async def aclose() -> None:
+    """Cierra el cliente del loop actual (al apagar el worker async)."""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = _client_loop = None
+
+@timed_tool
+async def search_products(q: Optional[str] = None, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    key = _normalize_query(q)
+    attrs = tuple(sorted((k, _normalize_query(v)) for k, v in (filters or {}).items() if v))
+    cached = _search_cache.get((key, attrs))
+    if cached is not MISS:
+        return cached
+    params = {"q": key} if key else {}
+    params.update(attrs)
+    r = await _get_client().get("/products", params=params, timeout=SEARCH_TIMEOUT)
+    products = _handle_response(r)
+    _search_cache.put((key, attrs), products)
+    _remember_products(products)
+    return products
+
+@timed_tool
+async def get_product(pid: int) -> Dict[str, Any]:
+    cached = _product_cache.get(pid)
+    if cached is not MISS:
+        return cached
+    r = await _get_client().get(f"/products/{pid}")
+    product = _handle_response(r)
+    _product_cache.put(pid, product)
+    return product
+
+@timed_tool
+async def get_cart(cart_id: int) -> Dict[str, Any]:
+    snapshot = _cart_snapshots.peek(cart_id)
+    headers = {"If-None-Match": snapshot[0]} if snapshot is not MISS else {}
+    r = await _get_client().get(f"/carts/{cart_id}", headers=headers)
+    if r.status_code == 304 and snapshot is not MISS:
+        return snapshot[1]
+    return _absorb_cart(r, _handle_response(r))
+
+@timed_tool
+async def cart_command(cart_id: Optional[int], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    r = await _get_client().post("/carts/commands", json={"cart_id": cart_id, "items": items})
+    if _stale_cart(r, cart_id):
+        r = await _get_client().post("/carts/commands", json={"cart_id": None, "items": items})
+    return _absorb_cart(r, _handle_response(r))
@@ -0,0 +1,74 @@
+# app/agent/cache.py
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+MISS = object()
+
+class TTLCache:
+    """
+    LRU acotado con vencimiento por entrada (thread-safe).
+    - maxsize: cantidad máxima de entradas; al pasarse se descarta la menos usada.
+    - ttl: segundos de vida de cada entrada (None = sin vencimiento, 0 = cache deshabilitado).
+    - Cuenta hits/misses para exponer métricas.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float]):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Devuelve el valor o MISS."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires >= time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return MISS
+
+    def peek(self, key: Hashable) -> Any:
+        """Como get() pero sin tocar el orden LRU ni los contadores."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                return MISS
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.ttl == 0 or self.maxsize <= 0:
+            return
+        expires = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._data),
+            }
@@ -0,0 +1,208 @@
+# app/agent/catalog_index.py
+from __future__ import annotations
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Snapshot local del catálogo para resolver productos por nombre sin ir a la API:
+# "agregá 2 medias negras talle M" -> product_id en ~1 ms, sin red.
+#
+# - Texto normalizado igual que la búsqueda de la API (minúsculas, sin acentos, stemming
+#   liviano de plural/género), BM25 sobre nombre (peso doble) + descripción.
+# - Cada término de la consulta se expande a términos del vocabulario: exacto, prefijo
+#   ("pantal" -> "pantalon") o, si no hay, por trigramas de caracteres (typos: "remra").
+# - CatalogSnapshot refresca el índice en un thread de fondo; mientras tanto se sigue
+#   usando el último snapshot, así las búsquedas responden aunque la API esté lenta.
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Palabras vacías + palabras de "relleno" de los pedidos ("talle M", "color negro")
+STOPWORDS = frozenset(
+    "a al con de del el en la las lo los o para por que un una y unidad unidades producto productos talle talla color".split()
+)
+NAME_WEIGHT = 2
+
+def fold(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s.lower())
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+def stem(tok: str) -> str:
+    if len(tok) > 4 and tok.endswith("es") and tok[-3] not in "aeiou":
+        tok = tok[:-2]
+    elif len(tok) > 3 and tok.endswith("s"):
+        tok = tok[:-1]
+    if len(tok) > 3 and tok[-1] in "aeo":
+        tok = tok[:-1]
+    return tok
+
+def tokenize(s: Optional[str]) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall(fold(s or "")) if t not in STOPWORDS]
+
+def trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class CatalogIndex:
+    K1 = 1.2
+    B = 0.75
+    MIN_TRIGRAM_SIM = 0.35
+
+    def __init__(self, products: Iterable[Dict[str, Any]]):
+        self.products: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)  # term -> {pid: peso}
+        self.doc_len: Dict[int, int] = {}
+        for p in products:
+            pid = p["id"]
+            self.products[pid] = p
+            toks = tokenize(p.get("name")) * NAME_WEIGHT + tokenize(p.get("description"))
+            self.doc_len[pid] = len(toks)
+            for t in toks:
+                post = self.postings[t]
+                post[pid] = post.get(pid, 0) + 1
+        self.vocab = sorted(self.postings)
+        self.avg_len = (sum(self.doc_len.values()) / len(self.doc_len)) if self.doc_len else 0.0
+        # Peso BM25 de cada posting precalculado: la consulta sólo suma
+        n = len(self.doc_len)
+        for post in self.postings.values():
+            idf = math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5))
+            for pid, tf in post.items():
+                norm = self.K1 * (1 - self.B + self.B * self.doc_len[pid] / (self.avg_len or 1))
+                post[pid] = idf * tf * (self.K1 + 1) / (tf + norm)
+        self._trigrams: Dict[str, List[str]] = defaultdict(list)
+        for term in self.vocab:
+            for g in trigrams(term):
+                self._trigrams[g].append(term)
+        self._expand_cache: Dict[str, List[Tuple[str, float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Términos del vocabulario para `term`, con peso: exacto/prefijo 1.0, trigramas = similitud."""
+        cached = self._expand_cache.get(term)
+        if cached is not None:
+            return cached
+        out = []
+        i = bisect.bisect_left(self.vocab, term)
+        while i < len(self.vocab) and self.vocab[i].startswith(term):
+            out.append((self.vocab[i], 1.0))
+            i += 1
+        if not out and len(term) >= 3:
+            grams = trigrams(term)
+            shared: Dict[str, int] = defaultdict(int)
+            for g in grams:
+                for cand in self._trigrams.get(g, ()):
+                    shared[cand] += 1
+            for cand, n in shared.items():
+                sim = n / len(grams | trigrams(cand))
+                if sim >= self.MIN_TRIGRAM_SIM:
+                    out.append((cand, sim))
+        if len(self._expand_cache) < 10_000:
+            self._expand_cache[term] = out
+        return out
+
+    def scored(self, q: str, limit: int = 10) -> List[Tuple[float, int, Dict[str, Any]]]:
+        """[(score, términos de la consulta que matchearon, producto)], mejor primero."""
+        scores: Dict[int, float] = defaultdict(float)
+        hits: Dict[int, int] = defaultdict(int)
+        for term in dict.fromkeys(tokenize(q)):
+            expanded = self._expand(term)
+            if len(expanded) == 1:
+                vterm, weight = expanded[0]
+                best = self.postings[vterm] if weight == 1.0 else {pid: weight * s for pid, s in self.postings[vterm].items()}
+            else:
+                # Varios términos del vocabulario para uno de la consulta: vale el mejor por producto
+                best = {}
+                for vterm, weight in expanded:
+                    for pid, s in self.postings[vterm].items():
+                        s *= weight
+                        if s > best.get(pid, 0.0):
+                            best[pid] = s
+            for pid, s in best.items():
+                scores[pid] += s
+                hits[pid] += 1
+        # Más términos cubiertos primero, después score; a igualdad, con stock y menor id
+        top = heapq.nsmallest(
+            limit, scores,
+            key=lambda pid: (-hits[pid], -scores[pid], self.products[pid].get("stock", 0) <= 0, pid),
+        )
+        return [(scores[pid], hits[pid], self.products[pid]) for pid in top]
+
+    def search(self, q: str, limit: int = 10, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Top-`limit` por relevancia; `filters` compara contra los atributos del producto
+        (tipo/color/talle/categoria, ya normalizados por la API)."""
+        if not filters:
+            return [p for _, _, p in self.scored(q, limit)]
+        wanted = {k: fold(v).strip() for k, v in filters.items() if v}
+        ranked = (p for _, _, p in self.scored(q, len(self.products)))
+        return [p for p in ranked if all(p.get(k) == v for k, v in wanted.items())][:limit]
+
+    def resolve(self, q: str) -> Optional[Dict[str, Any]]:
+        """El producto que mejor matchea `q`, si cubre al menos la mitad de sus términos."""
+        terms = set(tokenize(q))
+        best = self.scored(q, 1)
+        if not terms or not best:
+            return None
+        _, hits, product = best[0]
+        return product if hits * 2 >= len(terms) else None
+
+class CatalogSnapshot:
+    """Índice del catálogo refrescado en background cada `interval` segundos (0 = sin thread;
+    se carga a mano con load()). Los lectores nunca esperan al refresh."""
+
+    def __init__(self, fetch: Callable[[], Iterable[Dict[str, Any]]], interval: float):
+        self.fetch = fetch
+        self.interval = interval
+        self.index: Optional[CatalogIndex] = None
+        self.loaded_at = 0.0
+        self.refreshes = 0
+        self.errors = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def load(self, products: Iterable[Dict[str, Any]]) -> CatalogIndex:
+        index = CatalogIndex(products)
+        self.index, self.loaded_at = index, time.time()
+        return index
+
+    def refresh(self) -> bool:
+        try:
+            self.load(self.fetch())
+        except Exception as e:
+            self.errors += 1
+            print("Catalog refresh error:", e)
+            return False
+        self.refreshes += 1
+        return True
+
+    def _run(self):
+        while True:
+            ok = self.refresh()
+            # Si falló se reintenta antes, sin martillar la API
+            time.sleep(self.interval if ok else min(self.interval, 30))
+
+    def get(self) -> Optional[CatalogIndex]:
+        """El índice actual (None hasta la primera carga). Arranca el thread la primera vez:
+        lazy, para que en gunicorn se cree después del fork."""
+        if self.interval > 0 and self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="catalog-refresh", daemon=True)
+                    self._thread.start()
+        return self.index
+
+    def clear(self) -> None:
+        self.index = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "products": len(self.index) if self.index else 0,
+            "age_s": round(time.time() - self.loaded_at, 1) if self.index else None,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
@@ -0,0 +1,117 @@
+# app/agent/intents.py
+from __future__ import annotations
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .catalog_index import STOPWORDS, fold
+
+# Gramática de intenciones, declarativa y compilada una sola vez al importar.
+#
+# 1) Un autómata de palabras clave (una única regex con un grupo nombrado por familia)
+#    recorre el mensaje una vez y devuelve qué familias de palabras aparecen: agregar,
+#    quitar, cambiar, detalle, carrito, ayuda, buscar. Ninguna palabra clave es prefijo o
+#    sufijo de una de otra familia, así que alcanza con matches sin solapamiento.
+# 2) Sólo se prueban las reglas cuya familia apareció, en orden de prioridad, y ancladas
+#    (pattern.match) en la posición donde el autómata encontró la palabra: todas empiezan
+#    por una palabra clave de su familia, así que no hace falta re.search. Las acciones
+#    concretas (con ids) van antes que "ver carrito"/"ayuda", así "agregá 2 del producto 5
+#    al carrito" es un add y no un show_cart. Agregar por nombre ("agregá 2 medias negras")
+#    va después de todas las reglas con id, y si lo que sigue al verbo no tiene ninguna
+#    palabra de producto ("agregar al carrito") no aplica y sigue a "ver carrito".
+
+KEYWORDS: Dict[str, tuple] = {
+    "add": ("agregar", "agregá", "agrega", "añade", "sumar"),
+    "remove": ("quitar", "quitá", "quita", "remover", "remueve", "sacar", "sacá", "saca"),
+    "set": ("cambiar", "cambia", "setea", "poner", "deja"),
+    "detail": ("información", "detalle", "info"),
+    "cart": ("carrito", "total"),
+    "help": ("ayuda", "qué sabés hacer", "como uso", "help"),
+    "search": ("buscar", "buscá", "busca", "mostrame", "mostrá", "mostra", "productos", "tenés", "tenes"),
+}
+
+def _alt(words) -> str:
+    # Más largas primero: "agregar" antes que "agrega"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+_KEYWORD_RE = re.compile("|".join(f"(?P<{k}>{_alt(ws)})" for k, ws in KEYWORDS.items()))
+
+_ADD = "(?:agrega|agregá|añade|sumar|agregar)"
+_REMOVE = "(?:quita|quitá|quitar|remueve|remover|saca|sacá|sacar)"
+_FILTER_RE = re.compile(r"\b(?:color|colores?)\s*:\s*(?P<color>[a-záéíóúñ]+)|\b(?:talle|tamaño|size)\s*:\s*(?P<talle>[a-z0-9\-]+)")
+_SEARCH_WORDS_RE = re.compile(r"\b(?:" + _alt(KEYWORDS["search"]) + r")\b")
+
+class Rule(NamedTuple):
+    intent: str
+    trigger: str  # familia de palabras clave que habilita la regla
+    pattern: Optional[re.Pattern]
+    build: Callable[[Optional[re.Match], str], Optional[Dict[str, Any]]]  # None: no aplica, sigue
+
+def _search(m: Optional[re.Match], t: str) -> Dict[str, Any]:
+    filters = {}
+    if ":" in t:  # los filtros siempre son "clave: valor"
+        for f in _FILTER_RE.finditer(t):
+            for k, v in f.groupdict().items():
+                if v and k not in filters:  # vale la primera mención
+                    filters[k] = v
+        t = _FILTER_RE.sub(" ", t)
+    q = " ".join(_SEARCH_WORDS_RE.sub(" ", t).split())
+    return {"intent": "search", "q": q or None, "filters": filters or None}
+
+# Palabras que no nombran un producto: "agregar al carrito" no es un add por nombre
+_NOT_A_NAME = STOPWORDS | frozenset(KEYWORDS["cart"])
+
+def _add_by_name(m: Optional[re.Match], t: str) -> Optional[Dict[str, Any]]:
+    if all(fold(w) in _NOT_A_NAME for w in m["query"].split()):
+        return None  # sigue con las reglas siguientes (show_cart)
+    return {"intent": "add", "qty": int(m[1] or 1), "query": m["query"]}
+
+RULES = (
+    Rule("detail", "detail", re.compile(r"(?:detalle|info|información)\s+(?:id|producto)\s*(\d+)"),
+         lambda m, t: {"intent": "detail", "product_id": int(m[1])}),
+    # "agregá 2 del producto 5" / "agregar 3 unidades 7"
+    Rule("add", "add", re.compile(_ADD + r"\s*(\d+)\s*(?:x|unidades?|u\.?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)"),
+         lambda m, t: {"intent": "add", "qty": int(m[1]), "product_id": int(m[2])}),
+    # "agregar producto 5" => qty 1
+    Rule("add", "add", re.compile(r"(?:agrega|agregá|agregar|sumar).*producto\s*(\d+)"),
+         lambda m, t: {"intent": "add", "qty": 1, "product_id": int(m[1])}),
+    # "quitar 1 del producto 5" => incremento negativo
+    Rule("add", "remove", re.compile(_REMOVE + r"\s*(\d+)\s*(?:x|unidades?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)"),
+         lambda m, t: {"intent": "add", "qty": -int(m[1]), "product_id": int(m[2])}),
+    # "cambiar producto 5 a 3"
+    Rule("set_qty", "set", re.compile(r"(?:cambia|cambiar|setea|poner|deja)\s*(?:el\s*)?(?:producto\s*)?(\d+)\s*(?:a|en)\s*(\d+)"),
+         lambda m, t: {"intent": "set_qty", "product_id": int(m[1]), "qty": int(m[2])}),
+    # "quitar producto 5" => qty 0
+    Rule("set_qty", "remove", re.compile(_REMOVE + r".*producto\s*(\d+)"),
+         lambda m, t: {"intent": "set_qty", "product_id": int(m[1]), "qty": 0}),
+    # "agregá 2 medias negras talle M" => por nombre; el agente lo resuelve con el índice local
+    Rule("add", "add", re.compile(_ADD + r"\s+(?:(\d+)\s*(?:x|unidades?|u\.?)?\s+)?(?:(?:de|del|el|la|los|las|un|una|unos|unas)\s+)?(?P<query>[a-záéíóúñ].*?)(?:\s+al\s+carrito)?[.!]?$"),
+         _add_by_name),
+    Rule("help", "help", None, lambda m, t: {"intent": "help"}),
+    Rule("show_cart", "cart", re.compile(r"\b(?:carrito|total)\b"), lambda m, t: {"intent": "show_cart"}),
+    Rule("search", "search", None, _search),
+)
+
+def keyword_families(t: str) -> Dict[str, List[int]]:
+    """{familia: posiciones} de las palabras clave en `t` (ya en minúsculas), en una sola pasada."""
+    found: Dict[str, List[int]] = {}
+    for m in _KEYWORD_RE.finditer(t):
+        found.setdefault(m.lastgroup, []).append(m.start())
+    return found
+
+def parse_intent(text: str) -> Dict[str, Any]:
+    t = text.lower().strip()
+    found = keyword_families(t)
+    if found:
+        for rule in RULES:
+            positions = found.get(rule.trigger)
+            if positions is None:
+                continue
+            if rule.pattern is None:
+                return rule.build(None, t)
+            for pos in positions:
+                m = rule.pattern.match(t, pos)
+                if m:
+                    intent = rule.build(m, t)
+                    if intent is not None:
+                        return intent
+    return {"intent": "help"}
@@ -0,0 +1,175 @@
+# app/agent/session_store.py
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Estado de conversación por sesión (cart_id + filtros recordados).
+# - MemorySessionStore: LRU + TTL en el proceso; acotado en memoria.
+# - SqliteSessionStore: archivo SQLite en modo WAL, compartido entre los workers de gunicorn
+#   de la misma máquina (el cart_id sobrevive aunque el próximo mensaje caiga en otro worker).
+# Se elige con SESSION_STORE: "memory" (default) o "sqlite:///ruta/al/archivo.db".
+
+SESSION_TTL = float(os.environ.get("SESSION_TTL_SECONDS", str(24 * 3600)))
+SESSION_MAXSIZE = int(os.environ.get("SESSION_MAXSIZE", "10000"))
+
+class SessionRecord:
+    """Estado de una sesión. __slots__: sin __dict__ por instancia (miles de sesiones vivas)."""
+
+    __slots__ = ("cart_id", "filters", "expires")
+
+    def __init__(self, cart_id: Optional[int] = None, filters: Optional[Dict[str, str]] = None, expires: float = 0.0):
+        self.cart_id = cart_id
+        self.filters = filters if filters is not None else {}
+        self.expires = expires
+
+    def snapshot(self) -> tuple:
+        """Para detectar cambios y no escribir si la sesión no se modificó."""
+        return (self.cart_id, tuple(sorted(self.filters.items())))
+
+class SessionStore(ABC):
+    """Interfaz: get() nunca falla (sesión nueva si no existe o venció), put() persiste."""
+
+    # get/put hacen IO (disco, red): ShoppingAgent.handle_async los corre en un thread
+    blocking = True
+
+    @abstractmethod
+    def get(self, session_id: str) -> SessionRecord: ...
+
+    @abstractmethod
+    def put(self, session_id: str, record: SessionRecord) -> None: ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class MemorySessionStore(SessionStore):
+    """LRU acotado a `maxsize` sesiones, cada una vence `ttl` segundos después de su último uso."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = SESSION_MAXSIZE, ttl: float = SESSION_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionRecord:
+        now = time.monotonic()
+        with self._lock:
+            rec = self._data.get(session_id)
+            if rec is not None and rec.expires >= now:
+                rec.expires = now + self.ttl
+                self._data.move_to_end(session_id)
+                return rec
+            if rec is not None:
+                del self._data[session_id]
+        # Sesión nueva: se guarda recién en put(), si la conversación cambió algo
+        return SessionRecord()
+
+    def put(self, session_id: str, record: SessionRecord) -> None:
+        record.expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._insert(session_id, record)
+
+    def _insert(self, session_id: str, record: SessionRecord) -> None:
+        self._data[session_id] = record
+        self._data.move_to_end(session_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", "size": len(self._data), "evictions": self.evictions}
+
+class SqliteSessionStore(SessionStore):
+    """Sesiones en SQLite (WAL: lectores y un escritor concurrentes entre procesos).
+
+    Una conexión por thread; las vencidas se purgan cada `purge_every` escrituras.
+    """
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL, purge_every: int = 500):
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, cart_id INTEGER, filters TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; busy_timeout para esperar al escritor de otro worker en vez de fallar
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> SessionRecord:
+        # Reloj de pared: los procesos no comparten time.monotonic(). Como en memoria, el TTL
+        # corre desde el último uso: ShoppingAgent sólo hace put() si la sesión cambió.
+        now = time.time()
+        row = self._conn().execute(
+            "UPDATE sessions SET expires = ? WHERE session_id = ? AND expires >= ? RETURNING cart_id, filters",
+            (now + self.ttl, session_id, now),
+        ).fetchone()
+        if row is None:
+            return SessionRecord()
+        return SessionRecord(cart_id=row[0], filters=json.loads(row[1]), expires=now + self.ttl)
+
+    def put(self, session_id: str, record: SessionRecord) -> None:
+        record.expires = time.time() + self.ttl
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (session_id, cart_id, filters, expires) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET cart_id = excluded.cart_id, "
+            "filters = excluded.filters, expires = excluded.expires",
+            (session_id, record.cart_id, json.dumps(record.filters), record.expires),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+    def delete(self, session_id: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM sessions")
+
+    def stats(self) -> Dict[str, Any]:
+        size = self._conn().execute("SELECT count(*) FROM sessions WHERE expires >= ?", (time.time(),)).fetchone()[0]
+        return {"backend": "sqlite", "size": size}
+
+def store_from_env(url: Optional[str] = None) -> SessionStore:
+    url = url if url is not None else os.environ.get("SESSION_STORE", "memory")
+    if url.startswith("sqlite:///"):
+        return SqliteSessionStore(url[len("sqlite:///"):])
+    if url in ("", "memory"):
+        return MemorySessionStore()
+    raise ValueError(f"SESSION_STORE no soportado: {url!r}")
@@ -1,195 +1,292 @@
 # app/agent/shopping_agent.py
 from __future__ import annotations
-import re
+import asyncio
+import time
+from decimal import Decimal
+import httpx
+import requests
 from typing import Any, Dict, List, Optional, Tuple
-from .tools import search_products, get_product, create_cart, patch_cart, ApiError
+from .intents import parse_intent
+from .tools import search_products, get_product, get_cart, cart_command, ApiError, CATALOG
+from . import async_tools
+from .session_store import SessionRecord, SessionStore, store_from_env
+from .catalog_index import STOPWORDS, fold
+from .. import profiling
+from ..metrics import INTENT_LATENCY
 
 # Memoria breve por sesión (ej: filtros), y cart_id por conversación.
-# En prod, sustituir por Redis/DB. Acá mantenemos en memoria.
-SESSION_STATE: Dict[str, Dict[str, Any]] = {}
+# Backend según SESSION_STORE (ver session_store.py): en memoria o compartido entre workers.
+SESSIONS: SessionStore = store_from_env()
 
-def _state(session_id: str) -> Dict[str, Any]:
-    if session_id not in SESSION_STATE:
-        SESSION_STATE[session_id] = {"cart_id": None, "filters": {}}
-    return SESSION_STATE[session_id]
+def cart_total(cart: Dict[str, Any]) -> Any:
+    """Total del carrito: el resumen exacto que mantiene la API (`total`, decimal como string);
+    si no viene (API vieja), se suma en el cliente."""
+    if cart.get("total") is not None:
+        return Decimal(str(cart["total"]))
+    return sum(ci["qty"] * ci["product"]["price"] for ci in cart.get("items", []))
+
+HELP = (
+    "Puedo buscar productos, ver detalle por id, y gestionar tu carrito:\n"
+    "• Buscar: “buscá medias negras”, “mostrá productos color:negro talle:M”.\n"
+    "• Detalle: “detalle producto 5”.\n"
+    "• Agregar: “agregá 2 del producto 5” o por nombre “agregá 2 medias negras”. Quitar: “quitar 1 del producto 5”.\n"
+    "• Cambiar cantidad: “cambiar producto 5 a 3”.\n"
+    "• Ver carrito/total: “ver carrito”."
+)
 
 class ShoppingAgent:
     """
     Agente conversacional de compras (ES).
     Intenciones: buscar, detalle, agregar/quitar/cambiar qty, ver carrito/total, ayuda.
-    - Un cart_id por conversación (se crea si no existe al agregar).
+    - Un cart_id por conversación (lo crea la API en el primer “agregá”, en el mismo request).
     - Respuestas concisas y confirmando cambios.
     - Manejo de errores: 404 producto, qty inválida, carrito vacío.
     - Memoria breve: recuerda filtros (p.ej., color/talle) en la sesión.
     """
 
-    def __init__(self, session_id: str):
+    def __init__(self, session_id: str, store: Optional[SessionStore] = None):
         self.session_id = session_id
-        self.state = _state(session_id)
+        self.store = store or SESSIONS
+        # Se carga al empezar cada turno (handle/handle_async): construir el agente no hace IO
+        self.state = SessionRecord()
 
-    # ---------- NLU súper ligera (regex + heurísticas) ----------
+    # ---------- NLU: gramática de intenciones compilada (ver intents.py) ----------
     def parse(self, text: str) -> Dict[str, Any]:
-        t = text.lower().strip()
-
-        # ayuda
-        if any(k in t for k in ["ayuda", "qué sabés hacer", "como uso", "help"]):
-            return {"intent": "help"}
-
-        # ver carrito / total
-        if re.search(r"\b(carrito|total|ver carrito|mostrar carrito)\b", t):
-            return {"intent": "show_cart"}
-
-        # detalle por id
-        m = re.search(r"(detalle|info|información)\s+(id|producto)\s*(\d+)", t)
-        if m:
-            return {"intent": "detail", "product_id": int(m.group(3))}
-
-        # agregar X unidades de producto Y (por id)
-        m = re.search(r"(agrega|agregá|añade|sumar|agregar)\s*(\d+)\s*(?:x|unidades?|u\.?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)", t)
-        if m:
-            return {"intent": "add", "qty": int(m.group(2)), "product_id": int(m.group(3))}
-
-        # agregar por id simple: "agregar producto 5", qty=1
-        m = re.search(r"(agrega|agregá|agregar|sumar).*(producto\s*)(\d+)", t)
-        if m:
-            return {"intent": "add", "qty": 1, "product_id": int(m.group(3))}
-
-        # quitar/cambiar qty
-        # "quitar 1 del producto 5" => qty negativa
-        m = re.search(r"(quita|quitar|remueve|remover|saca|sacar)\s*(\d+)\s*(?:x|unidades?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)", t)
-        if m:
-            return {"intent": "add", "qty": -int(m.group(2)), "product_id": int(m.group(3))}
-
-        # "cambiar producto 5 a 3" => set qty 3
-        m = re.search(r"(cambia|cambiar|setea|poner|deja)\s*(?:el\s*)?(?:producto\s*)?(\d+)\s*(?:a|en)\s*(\d+)", t)
-        if m:
-            return {"intent": "set_qty", "product_id": int(m.group(2)), "qty": int(m.group(3))}
-
-        # quitar por id completo: "quitar producto 5" => qty 0
-        m = re.search(r"(quita|quitar|remueve|remover|saca|sacar).*(producto\s*)(\d+)", t)
-        if m:
-            return {"intent": "set_qty", "product_id": int(m.group(3)), "qty": 0}
-
-        # buscar (por texto)
-        # guarda filtros recordados (color/talle) si aparecen
-        filters = {}
-        m_color = re.search(r"\b(color|colores?)\s*:\s*([a-záéíóúñ]+)", t)
-        if m_color:
-            filters["color"] = m_color.group(2)
-        m_talle = re.search(r"\b(talle|tamaño|size)\s*:\s*([a-z0-9\-]+)", t)
-        if m_talle:
-            filters["talle"] = m_talle.group(2)
-
-        # “busca medias negras”, “mostrá productos”, “tenés zoquetes?”
-        if any(k in t for k in ["busca", "buscá", "buscar", "productos", "tenes", "tenés", "mostra", "mostrá", "mostrame"]):
-            q = re.sub(r"(busca|buscá|buscar|mostra|mostrá|mostrame|productos|tenes|tenés)", "", t).strip()
-            q = re.sub(r"(color\s*:\s*\w+|talle\s*:\s*\w+)", "", q).strip()
-            return {"intent": "search", "q": q if q else None, "filters": filters or None}
-
-        # fallback a ayuda
-        return {"intent": "help"}
+        return parse_intent(text)
+
+    def resolve_product(self, query: str) -> Optional[Dict[str, Any]]:
+        """Producto por nombre ("medias negras talle M"): índice local del catálogo y, si
+        todavía no cargó o no hay match, el primer resultado de la búsqueda de la API."""
+        index = CATALOG.get()
+        if index is not None:
+            p = index.resolve(query)
+            if p is not None:
+                return p
+        # La búsqueda de la API exige todos los términos: sin las palabras de relleno ("talle")
+        products = search_products(" ".join(w for w in query.split() if fold(w) not in STOPWORDS))
+        return products[0] if products else None
+
+    def search(self, q: Optional[str], filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        try:
+            return search_products(q, filters)
+        except (ApiError, requests.RequestException):
+            # API caída o lenta (timeout corto): se responde con el último snapshot del catálogo
+            index = CATALOG.get()
+            if index is None or not q:
+                raise
+            return index.search(q, limit=50, filters=filters)
+
+    async def resolve_product_async(self, query: str) -> Optional[Dict[str, Any]]:
+        index = CATALOG.get()
+        if index is not None:
+            p = index.resolve(query)
+            if p is not None:
+                return p
+        products = await async_tools.search_products(" ".join(w for w in query.split() if fold(w) not in STOPWORDS))
+        return products[0] if products else None
+
+    async def search_async(self, q: Optional[str], filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        try:
+            return await async_tools.search_products(q, filters)
+        except (ApiError, httpx.HTTPError):
+            index = CATALOG.get()
+            if index is None or not q:
+                raise
+            return index.search(q, limit=50, filters=filters)
 
     # ---------- Lógica por intención ----------
     def handle(self, text: str) -> str:
+        # Se relee en cada turno: con un store compartido, el turno anterior pudo correr en otro worker
+        self.state = self.store.get(self.session_id)
+        before = self.state.snapshot()
+        t0 = time.perf_counter()
         intent = self.parse(text)
+        profiling.note(intent=intent["intent"])
+        try:
+            return self._handle(intent)
+        finally:
+            INTENT_LATENCY.labels(intent["intent"]).observe(time.perf_counter() - t0)
+            if self.state.snapshot() != before:
+                self.store.put(self.session_id, self.state)
+
+    async def handle_async(self, text: str) -> str:
+        """Igual que handle() (mismas respuestas), sobre async_tools: no bloquea un thread
+        mientras espera a la API."""
+        self.state = await self._store_io(self.store.get, self.session_id)
+        before = self.state.snapshot()
+        t0 = time.perf_counter()
+        intent = self.parse(text)
+        profiling.note(intent=intent["intent"])
+        try:
+            return await self._handle_async(intent)
+        finally:
+            INTENT_LATENCY.labels(intent["intent"]).observe(time.perf_counter() - t0)
+            if self.state.snapshot() != before:
+                await self._store_io(self.store.put, self.session_id, self.state)
 
+    async def _store_io(self, fn, *args):
+        # Un store con IO (SQLite: disco, busy_timeout) no puede correr en el event loop: frenaría
+        # a todas las sesiones del loop
+        if self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _handle(self, intent: Dict[str, Any]) -> str:
         try:
             if intent["intent"] == "help":
-                return (
-                    "Puedo buscar productos, ver detalle por id, y gestionar tu carrito:\n"
-                    "• Buscar: “buscá medias negras”, “mostrá productos color:negro talle:M”.\n"
-                    "• Detalle: “detalle producto 5”.\n"
-                    "• Agregar: “agregá 2 del producto 5”. Quitar: “quitar 1 del producto 5”.\n"
-                    "• Cambiar cantidad: “cambiar producto 5 a 3”.\n"
-                    "• Ver carrito/total: “ver carrito”."
-                )
+                return HELP
 
             if intent["intent"] == "search":
-                if intent.get("filters"):
-                    self.state["filters"].update(intent["filters"])
-                q = intent.get("q")
-                # Puedes enriquecer q con filtros recordados (opcional)
-                filter_hint = ""
-                if self.state["filters"]:
-                    # Nota: tu API actual no acepta color/talle, lo dejamos como memoria conversacional
-                    filter_hint = " (recordando filtros de sesión)"
-                products = search_products(q)
-                if not products:
-                    return "No encontré productos con ese criterio."
-                top = products[:5]
-                lines = [f"{p['id']}. {p['name']} — ${p['price']} (stock: {p['stock']})" for p in top]
-                more = "" if len(products) <= 5 else f"\n…y {len(products)-5} más. Refiná tu búsqueda.{filter_hint}"
-                return "Productos:\n" + "\n".join(lines) + more
+                q, filters = self._search_args(intent)
+                return self._reply_search(self.search(q, filters), filters)
 
             if intent["intent"] == "detail":
-                pid = intent["product_id"]
-                p = get_product(pid)
-                return f"{p['id']}. {p['name']}\n${p['price']} | stock: {p['stock']}\n{p.get('description','')}".strip()
+                return self._reply_detail(get_product(intent["product_id"]))
 
             if intent["intent"] in ("add", "set_qty"):
-                pid = intent["product_id"]
-                # valida existencia
-                _ = get_product(pid)
-
-                # aseguramos cart
-                if not self.state["cart_id"]:
-                    cart = create_cart(items=[])
-                    self.state["cart_id"] = cart["id"]
-
-                # resolvemos cantidades
-                if intent["intent"] == "add":
-                    qty_change = intent["qty"]
-                    # para add con qty negativa -> suma con signo
-                    payload_items = [{"product_id": pid, "qty": qty_change}]
-                else:
-                    # set_qty a cantidad específica
-                    new_qty = intent["qty"]
-                    payload_items = [{"product_id": pid, "qty": new_qty}]  # qty=0 elimina
-
-                cart = patch_cart(self.state["cart_id"], payload_items)
-                # formateo de total
-                total = sum(ci["qty"] * ci["product"]["price"] for ci in cart.get("items", []))
-                # mensaje conciso y confirmación
-                if intent["intent"] == "add":
-                    verb = "Agregué" if payload_items[0]["qty"] > 0 else "Quité"
-                    qty_abs = abs(payload_items[0]["qty"])
-                    return f"{verb} producto {pid} x{qty_abs}. Total: ${total}."
+                if "query" in intent:
+                    p = self.resolve_product(intent["query"])
+                    if p is None:
+                        return self._reply_not_found(intent)
+                    pid = p["id"]
+                    label = f"producto {pid} ({p['name']})"  # match aproximado: se confirma el nombre
                 else:
-                    qv = payload_items[0]["qty"]
-                    if qv == 0:
-                        return f"Eliminé producto {pid}. Total: ${total}."
-                    else:
-                        return f"Dejé producto {pid} en {qv}u. Total: ${total}."
+                    pid = intent["product_id"]
+                    label = f"producto {pid}"
+
+                # Un solo request: crea el carrito si no hay, valida el producto (404) y aplica
+                payload_items = self._change_items(intent, pid)
+                cart = cart_command(self.state.cart_id, payload_items)
+                self.state.cart_id = cart["id"]
+                return self._reply_change(intent, label, pid, payload_items, cart)
 
             if intent["intent"] == "show_cart":
-                if not self.state["cart_id"]:
+                if not self.state.cart_id:
                     return "Tu carrito está vacío."
                 try:
-                    cart = patch_cart(self.state["cart_id"], [])  # no-op para obtener estado actual
-                except ApiError as e:
+                    cart = get_cart(self.state.cart_id)  # GET condicional (ETag), no abre escritura
+                except ApiError:
                     # Si el carrito no existe ya, reseteamos
-                    self.state["cart_id"] = None
+                    self.state.cart_id = None
                     return "Tu carrito está vacío."
-                items = cart.get("items", [])
-                if not items:
-                    return "Tu carrito está vacío."
-                lines = []
-                total = 0
-                for it in items:
-                    pid = it["product"]["id"]
-                    name = it["product"]["name"]
-                    qty = it["qty"]
-                    price = it["product"]["price"]
-                    subtotal = qty * price
-                    total += subtotal
-                    lines.append(f"- {pid} {name} x{qty} = ${subtotal}")
-                lines.append(f"Total: ${total}")
-                return "\n".join(lines)
+                return self._reply_cart(cart)
 
             # fallback
             return "No entendí. Escribí “ayuda” para ver ejemplos."
 
         except ApiError as e:
-            if str(e) == "404":
-                return "No encuentro ese producto (404)."
-            return f"Ocurrió un error con la API. {e}"
\ No newline at end of file
+            return self._reply_api_error(e)
+
+    async def _handle_async(self, intent: Dict[str, Any]) -> str:
+        try:
+            if intent["intent"] == "help":
+                return HELP
+
+            if intent["intent"] == "search":
+                q, filters = self._search_args(intent)
+                return self._reply_search(await self.search_async(q, filters), filters)
+
+            if intent["intent"] == "detail":
+                return self._reply_detail(await async_tools.get_product(intent["product_id"]))
+
+            if intent["intent"] in ("add", "set_qty"):
+                if "query" in intent:
+                    p = await self.resolve_product_async(intent["query"])
+                    if p is None:
+                        return self._reply_not_found(intent)
+                    pid = p["id"]
+                    label = f"producto {pid} ({p['name']})"
+                else:
+                    pid = intent["product_id"]
+                    label = f"producto {pid}"
+
+                payload_items = self._change_items(intent, pid)
+                cart = await async_tools.cart_command(self.state.cart_id, payload_items)
+                self.state.cart_id = cart["id"]
+                return self._reply_change(intent, label, pid, payload_items, cart)
+
+            if intent["intent"] == "show_cart":
+                if not self.state.cart_id:
+                    return "Tu carrito está vacío."
+                try:
+                    cart = await async_tools.get_cart(self.state.cart_id)
+                except ApiError:
+                    self.state.cart_id = None
+                    return "Tu carrito está vacío."
+                return self._reply_cart(cart)
+
+            return "No entendí. Escribí “ayuda” para ver ejemplos."
+
+        except ApiError as e:
+            return self._reply_api_error(e)
+
+    # ---------- Respuestas (compartidas por handle y handle_async) ----------
+    def _search_args(self, intent: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, str]]:
+        if intent.get("filters"):
+            self.state.filters.update(intent["filters"])
+        # Los filtros recordados (color/talle) viajan a la API, que filtra por índice
+        return intent.get("q"), dict(self.state.filters)
+
+    @staticmethod
+    def _reply_search(products: List[Dict[str, Any]], filters: Dict[str, str]) -> str:
+        filter_hint = f" (filtrando por {', '.join(f'{k}: {v}' for k, v in filters.items())})" if filters else ""
+        if not products:
+            return f"No encontré productos con ese criterio{filter_hint}."
+        top = products[:5]
+        lines = [f"{p['id']}. {p['name']} — ${p['price']} (stock: {p['stock']})" for p in top]
+        more = "" if len(products) <= 5 else f"\n…y {len(products)-5} más. Refiná tu búsqueda.{filter_hint}"
+        return "Productos:\n" + "\n".join(lines) + more
+
+    @staticmethod
+    def _reply_detail(p: Dict[str, Any]) -> str:
+        return f"{p['id']}. {p['name']}\n${p['price']} | stock: {p['stock']}\n{p.get('description','')}".strip()
+
+    @staticmethod
+    def _reply_not_found(intent: Dict[str, Any]) -> str:
+        return f"No encontré “{intent['query']}”. Probá buscarlo o indicá el id del producto."
+
+    @staticmethod
+    def _change_items(intent: Dict[str, Any], pid: int) -> List[Dict[str, Any]]:
+        if intent["intent"] == "add":
+            # incremento con signo (qty negativa quita); la API lo aplica atómicamente
+            return [{"product_id": pid, "qty": intent["qty"], "op": "inc"}]
+        # set_qty a cantidad específica; qty=0 elimina
+        return [{"product_id": pid, "qty": intent["qty"]}]
+
+    @staticmethod
+    def _reply_change(intent: Dict[str, Any], label: str, pid: int, payload_items: List[Dict[str, Any]],
+                      cart: Dict[str, Any]) -> str:
+        total = cart_total(cart)
+        # mensaje conciso y confirmación
+        if intent["intent"] == "add":
+            verb = "Agregué" if payload_items[0]["qty"] > 0 else "Quité"
+            qty_abs = abs(payload_items[0]["qty"])
+            return f"{verb} {label} x{qty_abs}. Total: ${total}."
+        qv = payload_items[0]["qty"]
+        if qv == 0:
+            return f"Eliminé producto {pid}. Total: ${total}."
+        return f"Dejé producto {pid} en {qv}u. Total: ${total}."
+
+    @staticmethod
+    def _reply_cart(cart: Dict[str, Any]) -> str:
+        items = cart.get("items", [])
+        if not items:
+            return "Tu carrito está vacío."
+        lines = []
+        for it in items:
+            pid = it["product"]["id"]
+            name = it["product"]["name"]
+            qty = it["qty"]
+            price = it["product"]["price"]
+            subtotal = qty * price
+            lines.append(f"- {pid} {name} x{qty} = ${subtotal}")
+        lines.append(f"Total: ${cart_total(cart)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _reply_api_error(e: ApiError) -> str:
+        if str(e) == "404":
+            return "No encuentro ese producto (404)."
+        if str(e) == "409":
+            return "No hay stock suficiente para esa cantidad."
+        return f"Ocurrió un error con la API. {e}"
@@ -1,7 +1,13 @@
 # app/agent/tools.py
+import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Any, Dict, List, Optional, Tuple
+from .cache import MISS, TTLCache
+from .catalog_index import CatalogSnapshot
+from .. import profiling
+from ..metrics import timed_tool
 
 API_BASE = os.environ.get("API_BASE", "http://api:8000")  # en docker compose, servicio "api"
 # Para correr fuera de docker: export API_BASE=http://localhost:8000
@@ -9,28 +15,172 @@ API_BASE = os.environ.get("API_BASE", "http://api:8000")  # en docker compose, s
 class ApiError(Exception):
     pass
 
+# Sesión compartida: keep-alive y pool de conexiones hacia la API (una conexión TCP se
+# reutiliza entre turnos en vez de abrir una nueva por request).
+class _ApiSession(requests.Session):
+    """En un turno perfilado (app/profiling.py) manda X-Profile, así la API también perfila, y
+    anota el id del profile que devuelve. Fuera de un turno perfilado no agrega nada."""
+
+    def request(self, method, url, headers=None, **kwargs):
+        extra = profiling.outgoing_headers()
+        if extra:
+            headers = {**(headers or {}), **extra}
+        r = super().request(method, url, headers=headers, **kwargs)
+        profiling.collect_api_profile(r)
+        return r
+
+_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", "16"))
+_session = _ApiSession()
+_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=_POOL_SIZE)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+# Caches (LRU + TTL). AGENT_CACHE_TTL=0 los deshabilita.
+_CACHE_TTL = float(os.environ.get("AGENT_CACHE_TTL", "60"))
+_product_cache = TTLCache(maxsize=int(os.environ.get("AGENT_PRODUCT_CACHE_SIZE", "2048")), ttl=_CACHE_TTL)
+_search_cache = TTLCache(maxsize=int(os.environ.get("AGENT_SEARCH_CACHE_SIZE", "512")), ttl=_CACHE_TTL)
+# Última versión vista de cada carrito (ETag, body) para GET condicional: si no cambió,
+# la API responde 304 sin re-serializar y reusamos el body. La valida el servidor, no vence.
+_cart_snapshots = TTLCache(maxsize=1024, ttl=None)
+# Las búsquedas tienen timeout corto: si la API tarda, el agente responde desde el snapshot
+SEARCH_TIMEOUT = float(os.environ.get("API_SEARCH_TIMEOUT", "3"))
+
 def _handle_response(r: requests.Response) -> Any:
     if r.status_code in (200, 201):
         return r.json()
     elif r.status_code == 404:
         raise ApiError("404")
+    elif r.status_code == 409:
+        raise ApiError("409")
     else:
         raise ApiError(f"HTTP {r.status_code}: {r.text}")
 
-def search_products(q: Optional[str] = None) -> List[Dict[str, Any]]:
-    params = {"q": q} if q else {}
-    r = requests.get(f"{API_BASE}/products", params=params, timeout=10)
-    return _handle_response(r)
+def _normalize_query(q: Optional[str]) -> str:
+    return " ".join((q or "").lower().split())
+
+def _remember_products(products: List[Dict[str, Any]]) -> None:
+    for p in products:
+        _product_cache.put(p["id"], p)
+
+def _absorb_cart(r: requests.Response, cart: Dict[str, Any]) -> Dict[str, Any]:
+    """Guarda el snapshot del carrito y refresca los productos que trae (precio/stock
+    actuales). Si alguno cambió respecto del cache, las búsquedas cacheadas quedan viejas."""
+    etag = r.headers.get("ETag")
+    if etag and "id" in cart:
+        _cart_snapshots.put(cart["id"], (etag, cart))
+    stale = False
+    for it in cart.get("items", []):
+        p = it.get("product")
+        if not p or "id" not in p:
+            continue
+        cached = _product_cache.peek(p["id"])
+        if cached is not MISS and cached != p:
+            stale = True
+        _product_cache.put(p["id"], p)
+    if stale:
+        _search_cache.clear()
+    return cart
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {"product": _product_cache.stats(), "search": _search_cache.stats(), "catalog": CATALOG.stats()}
+
+def clear_caches() -> None:
+    for c in (_product_cache, _search_cache, _cart_snapshots, CATALOG):
+        c.clear()
 
+@timed_tool
+def search_products(q: Optional[str] = None, filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """GET /products?q=...; `filters` (color/talle/tipo/categoria) los resuelve la API por índice."""
+    key = _normalize_query(q)
+    attrs = tuple(sorted((k, _normalize_query(v)) for k, v in (filters or {}).items() if v))
+    cached = _search_cache.get((key, attrs))
+    if cached is not MISS:
+        return cached
+    params = {"q": key} if key else {}
+    params.update(attrs)
+    r = _session.get(f"{API_BASE}/products", params=params, timeout=SEARCH_TIMEOUT)
+    products = _handle_response(r)
+    _search_cache.put((key, attrs), products)
+    _remember_products(products)
+    return products
+
+@timed_tool
 def get_product(pid: int) -> Dict[str, Any]:
-    r = requests.get(f"{API_BASE}/products/{pid}", timeout=10)
-    return _handle_response(r)
+    cached = _product_cache.get(pid)
+    if cached is not MISS:
+        return cached
+    r = _session.get(f"{API_BASE}/products/{pid}", timeout=10)
+    product = _handle_response(r)
+    _product_cache.put(pid, product)
+    return product
+
+@timed_tool
+def get_products(ids: List[int]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Varios productos en un solo request (POST /products/batch) para los que no estén en
+    cache. Devuelve (productos en el orden pedido, ids inexistentes)."""
+    wanted = list(dict.fromkeys(ids))
+    found: Dict[int, Dict[str, Any]] = {}
+    for pid in wanted:
+        cached = _product_cache.get(pid)
+        if cached is not MISS:
+            found[pid] = cached
+    to_fetch = [pid for pid in wanted if pid not in found]
+    if to_fetch:
+        r = _session.post(f"{API_BASE}/products/batch", json={"ids": to_fetch}, timeout=10)
+        body = _handle_response(r)
+        _remember_products(body["items"])
+        found.update((p["id"], p) for p in body["items"])
+    return [found[pid] for pid in wanted if pid in found], [pid for pid in wanted if pid not in found]
 
+@timed_tool
+def get_cart(cart_id: int) -> Dict[str, Any]:
+    snapshot = _cart_snapshots.peek(cart_id)
+    headers = {"If-None-Match": snapshot[0]} if snapshot is not MISS else {}
+    r = _session.get(f"{API_BASE}/carts/{cart_id}", headers=headers, timeout=10)
+    if r.status_code == 304 and snapshot is not MISS:
+        return snapshot[1]
+    return _absorb_cart(r, _handle_response(r))
+
+@timed_tool
 def create_cart(items: List[Dict[str, int]]) -> Dict[str, Any]:
     # items = [{ "product_id": int, "qty": int }]
-    r = requests.post(f"{API_BASE}/carts", json={"items": items}, timeout=10)
-    return _handle_response(r)
+    r = _session.post(f"{API_BASE}/carts", json={"items": items}, timeout=10)
+    return _absorb_cart(r, _handle_response(r))
 
+@timed_tool
 def patch_cart(cart_id: int, items: List[Dict[str, int]]) -> Dict[str, Any]:
-    r = requests.patch(f"{API_BASE}/carts/{cart_id}", json={"items": items}, timeout=10)
-    return _handle_response(r)
\ No newline at end of file
+    # items = [{ "product_id": int, "qty": int, "op": "set"|"inc" }]
+    r = _session.patch(f"{API_BASE}/carts/{cart_id}", json={"items": items}, timeout=10)
+    return _absorb_cart(r, _handle_response(r))
+
+def _stale_cart(r, cart_id: Optional[int]) -> bool:
+    """404 por carrito inexistente (no por producto): el cart_id de la sesión quedó viejo."""
+    if r.status_code != 404 or cart_id is None:
+        return False
+    try:
+        return r.json().get("detail") == "Cart not found"
+    except ValueError:
+        return False
+
+@timed_tool
+def cart_command(cart_id: Optional[int], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """POST /carts/commands: crea el carrito si hace falta (cart_id None), valida los productos y
+    aplica los items en un solo request y una transacción; devuelve el carrito con el total.
+    Si el cart_id ya no existe, se reintenta con uno nuevo."""
+    r = _session.post(f"{API_BASE}/carts/commands", json={"cart_id": cart_id, "items": items}, timeout=10)
+    if _stale_cart(r, cart_id):
+        r = _session.post(f"{API_BASE}/carts/commands", json={"cart_id": None, "items": items}, timeout=10)
+    return _absorb_cart(r, _handle_response(r))
+
+@timed_tool
+def fetch_catalog() -> List[Dict[str, Any]]:
+    """Catálogo completo en un request (export NDJSON de la API, cursor del lado del servidor).
+    Lista ya materializada: el índice la necesita entera y así la conexión se libera acá."""
+    with _session.get(f"{API_BASE}/products", headers={"Accept": "application/x-ndjson"}, stream=True, timeout=60) as r:
+        if r.status_code != 200:
+            _handle_response(r)
+        return [json.loads(line) for line in r.iter_lines() if line]
+
+# Snapshot del catálogo para resolver productos por nombre localmente (catalog_index.py).
+# AGENT_CATALOG_REFRESH_SECONDS=0 deshabilita el refresh en background.
+CATALOG = CatalogSnapshot(fetch_catalog, interval=float(os.environ.get("AGENT_CATALOG_REFRESH_SECONDS", "300")))
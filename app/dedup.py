@@ -0,0 +1,130 @@
+# app/dedup.py
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Deduplicación de entregas del webhook por id de mensaje (`msg["id"]`, wamid...).
+# Cloud API reentrega el mismo webhook si no recibe un 200 a tiempo; cada id se procesa
+# una sola vez dentro de la ventana `window` (segundos).
+# - MemoryDeduper: dict ordenado por llegada, O(1) por chequeo, acotado por ventana y maxsize.
+# - SqliteDeduper: tabla compartida por los workers de la máquina (mismo esquema que
+#   session_store: archivo SQLite en WAL).
+# Se elige con WA_DEDUP_STORE: "memory" (default) o "sqlite:///ruta/al/archivo.db".
+
+DEDUP_WINDOW = float(os.environ.get("WA_DEDUP_WINDOW_SECONDS", str(24 * 3600)))
+DEDUP_MAXSIZE = int(os.environ.get("WA_DEDUP_MAXSIZE", "100000"))
+
+class Deduper(ABC):
+    """seen(id): True si ya se vio dentro de la ventana (duplicado); si no, lo registra."""
+
+    def __init__(self):
+        self.checked = 0
+        self.duplicates = 0
+        self._stats_lock = threading.Lock()
+
+    def seen(self, msg_id: str) -> bool:
+        dup = self._check_and_add(msg_id)
+        with self._stats_lock:
+            self.checked += 1
+            self.duplicates += dup
+        return dup
+
+    @abstractmethod
+    def forget(self, msg_id: str) -> None:
+        """Olvida un id (p.ej. si no se pudo encolar: la reentrega sí se tiene que procesar)."""
+
+    @abstractmethod
+    def _check_and_add(self, msg_id: str) -> bool: ...
+
+    @abstractmethod
+    def size(self) -> int: ...
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"checked": self.checked, "duplicates_dropped": self.duplicates, "size": self.size()}
+
+class MemoryDeduper(Deduper):
+    def __init__(self, window: float = DEDUP_WINDOW, maxsize: int = DEDUP_MAXSIZE):
+        super().__init__()
+        self.window = window
+        self.maxsize = maxsize
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_and_add(self, msg_id: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            # Los ids entran en orden de llegada: los vencidos están siempre al principio
+            cutoff = now - self.window
+            while self._seen and next(iter(self._seen.values())) < cutoff:
+                self._seen.popitem(last=False)
+            if msg_id in self._seen:
+                return True
+            self._seen[msg_id] = now
+            if len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+            return False
+
+    def forget(self, msg_id: str) -> None:
+        with self._lock:
+            self._seen.pop(msg_id, None)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._seen)
+
+class SqliteDeduper(Deduper):
+    def __init__(self, path: str, window: float = DEDUP_WINDOW, purge_every: int = 1000):
+        super().__init__()
+        self.path = path
+        self.window = window
+        self.purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS seen_messages (msg_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _check_and_add(self, msg_id: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        # Un solo statement atómico: inserta si es nuevo o si el registro anterior venció.
+        # rowcount 0 => otro worker (o una entrega anterior) ya lo registró en la ventana.
+        cur = conn.execute(
+            "INSERT INTO seen_messages (msg_id, seen_at) VALUES (?, ?) "
+            "ON CONFLICT (msg_id) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_messages.seen_at < ?",
+            (msg_id, now, now - self.window),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            conn.execute("DELETE FROM seen_messages WHERE seen_at < ?", (now - self.window,))
+        return cur.rowcount == 0
+
+    def forget(self, msg_id: str) -> None:
+        self._conn().execute("DELETE FROM seen_messages WHERE msg_id = ?", (msg_id,))
+
+    def size(self) -> int:
+        return self._conn().execute(
+            "SELECT count(*) FROM seen_messages WHERE seen_at >= ?", (time.time() - self.window,)
+        ).fetchone()[0]
+
+def deduper_from_env(url: Optional[str] = None) -> Deduper:
+    url = url if url is not None else os.environ.get("WA_DEDUP_STORE", "memory")
+    if url.startswith("sqlite:///"):
+        return SqliteDeduper(url[len("sqlite:///"):])
+    if url in ("", "memory"):
+        return MemoryDeduper()
+    raise ValueError(f"WA_DEDUP_STORE no soportado: {url!r}")
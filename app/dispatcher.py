@@ -0,0 +1,315 @@
+# app/dispatcher.py
+from __future__ import annotations
+import asyncio
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+# Cola de trabajo del webhook: el POST encola y responde 200 al toque; un pool de workers
+# procesa (agente + envío por Graph) fuera del request.
+#
+# Orden por sesión: cada sesión cae siempre en el mismo shard (hash estable del session_id)
+# y cada shard tiene un único worker, así los mensajes de un mismo `wa:{número}` se procesan
+# en orden estricto y sesiones distintas corren en paralelo en shards distintos.
+#
+# Backpressure: cada shard tiene capacidad `queue_size`. Al llenarse se aplica `overflow`:
+# - "reject": no se encola (el webhook responde 503 y Meta reintenta más tarde).
+# - "drop_oldest": se descarta el mensaje más viejo del shard para hacer lugar.
+# - "block": se espera hasta `block_timeout` segundos a que haya lugar; si no, "reject".
+
+OVERFLOW_POLICIES = ("reject", "drop_oldest", "block")
+
+Job = Tuple[str, Any, float]  # (session_id, payload, encolado_en)
+
+class _Shard:
+    __slots__ = ("queue", "cond", "busy")
+
+    def __init__(self):
+        self.queue: Deque[Job] = deque()
+        self.cond = threading.Condition()
+        self.busy = False
+
+class Dispatcher:
+    def __init__(
+        self,
+        handler: Callable[[str, Any], None],
+        workers: int = 4,
+        queue_size: int = 100,
+        overflow: str = "reject",
+        block_timeout: float = 1.0,
+        on_wait: Optional[Callable[[float], None]] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow debe ser uno de {OVERFLOW_POLICIES}, no {overflow!r}")
+        self.handler = handler
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.on_wait = on_wait  # recibe la espera en cola (s) de cada mensaje, p.ej. para métricas
+        self._shards = [_Shard() for _ in range(max(1, workers))]
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._counters = {"submitted": 0, "processed": 0, "failed": 0, "rejected": 0, "dropped": 0}
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    # Los threads arrancan con el primer mensaje y no al importar: gunicorn forkea los
+    # workers después de importar la app y los threads no sobreviven al fork.
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            threads = [
+                threading.Thread(target=self._run, args=(shard,), name=f"dispatch-{i}", daemon=True)
+                for i, shard in enumerate(self._shards)
+            ]
+            for t in threads:
+                t.start()
+            self._threads = threads
+
+    def _shard_for(self, session_id: str) -> _Shard:
+        # crc32 y no hash(): estable entre procesos y ejecuciones
+        return self._shards[zlib.crc32(session_id.encode()) % len(self._shards)]
+
+    def submit(self, session_id: str, payload: Any) -> bool:
+        """Encola un mensaje. False si se rechazó por cola llena (o el dispatcher se está cerrando)."""
+        self._ensure_started()
+        shard = self._shard_for(session_id)
+        with shard.cond:
+            if self._stopping:
+                self._count("rejected")
+                return False
+            if len(shard.queue) >= self.queue_size:
+                if self.overflow == "drop_oldest":
+                    shard.queue.popleft()
+                    self._count("dropped")
+                elif self.overflow == "block" and shard.cond.wait_for(
+                    lambda: len(shard.queue) < self.queue_size, timeout=self.block_timeout
+                ):
+                    pass
+                else:
+                    self._count("rejected")
+                    return False
+            shard.queue.append((session_id, payload, time.monotonic()))
+            depth = len(shard.queue)
+            shard.cond.notify_all()
+        with self._stats_lock:
+            self._counters["submitted"] += 1
+            self._max_depth = max(self._max_depth, depth)
+        return True
+
+    def _run(self, shard: _Shard):
+        while True:
+            with shard.cond:
+                shard.cond.wait_for(lambda: shard.queue or self._stopping)
+                if not shard.queue:
+                    return  # cerrando y sin pendientes
+                session_id, payload, enqueued = shard.queue.popleft()
+                shard.busy = True
+                shard.cond.notify_all()  # libera a un submit() bloqueado por cola llena
+            started = time.monotonic()
+            if self.on_wait is not None:
+                self.on_wait(started - enqueued)
+            ok = True
+            try:
+                self.handler(session_id, payload)
+            except Exception as e:
+                ok = False
+                print(f"Dispatcher error ({session_id}):", e)
+            finished = time.monotonic()
+            with shard.cond:
+                shard.busy = False
+                shard.cond.notify_all()
+            with self._stats_lock:
+                self._counters["processed" if ok else "failed"] += 1
+                wait = started - enqueued
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._run_total += finished - started
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._counters[key] += 1
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se vacíen todas las colas. True si terminó dentro del timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self._shards:
+            with shard.cond:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not shard.cond.wait_for(lambda: not shard.queue and not shard.busy, timeout=remaining):
+                    return False
+        return True
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Deja de aceptar mensajes, procesa los pendientes y frena los workers."""
+        for shard in self._shards:
+            with shard.cond:
+                self._stopping = True
+                shard.cond.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        depths = []
+        busy = 0
+        for shard in self._shards:
+            with shard.cond:
+                depths.append(len(shard.queue))
+                busy += shard.busy
+        with self._stats_lock:
+            done = self._counters["processed"] + self._counters["failed"]
+            return {
+                **self._counters,
+                "workers": len(self._shards),
+                "queue_size": self.queue_size,
+                "overflow": self.overflow,
+                "queue_depth": sum(depths),
+                "max_shard_depth": max(depths),
+                "max_depth_seen": self._max_depth,
+                "in_flight": busy,
+                "avg_wait_ms": round(1000 * self._wait_total / done, 2) if done else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+                "avg_run_ms": round(1000 * self._run_total / done, 2) if done else 0.0,
+            }
+
+class AsyncDispatcher:
+    """Variante para handlers `async def` (ShoppingAgent.handle_async): un único event loop en
+    un thread atiende hasta `concurrency` turnos a la vez; mientras esperan a la API no ocupan
+    un thread cada uno. Misma garantía de orden por sesión (una tarea drena los mensajes de
+    cada sesión en orden) y misma interfaz que Dispatcher: submit/join/stop/stats.
+
+    Backpressure: hasta `queue_size` mensajes esperando en total; más allá se rechaza (503).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, Any], Awaitable[None]],
+        concurrency: int = 500,
+        queue_size: int = 1000,
+        on_wait: Optional[Callable[[float], None]] = None,
+    ):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.on_wait = on_wait
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sessions: Dict[str, Deque[Job]] = {}  # sólo se toca desde el loop
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._pending = 0
+        self._in_flight = 0
+        self._counters = {"submitted": 0, "processed": 0, "failed": 0, "rejected": 0, "dropped": 0}
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    # Como Dispatcher: el loop arranca con el primer mensaje (después del fork de gunicorn)
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._sem = asyncio.Semaphore(self.concurrency)
+                self._loop.call_soon(ready.set)
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="dispatch-async", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def submit(self, session_id: str, payload: Any) -> bool:
+        self._ensure_started()
+        with self._cond:
+            if self._stopping or self._pending >= self.queue_size:
+                self._counters["rejected"] += 1
+                return False
+            self._pending += 1
+            self._counters["submitted"] += 1
+            self._max_depth = max(self._max_depth, self._pending)
+        self._loop.call_soon_threadsafe(self._enqueue, session_id, payload, time.monotonic())
+        return True
+
+    def _enqueue(self, session_id: str, payload: Any, enqueued: float) -> None:
+        queue = self._sessions.get(session_id)
+        if queue is not None:
+            queue.append((session_id, payload, enqueued))  # ya hay una tarea drenando esta sesión
+            return
+        self._sessions[session_id] = deque([(session_id, payload, enqueued)])
+        self._loop.create_task(self._drain(session_id))
+
+    async def _drain(self, session_id: str) -> None:
+        queue = self._sessions[session_id]
+        while queue:
+            _, payload, enqueued = queue.popleft()
+            async with self._sem:
+                started = time.monotonic()
+                with self._cond:
+                    self._pending -= 1
+                    self._in_flight += 1
+                if self.on_wait is not None:
+                    self.on_wait(started - enqueued)
+                ok = True
+                try:
+                    await self.handler(session_id, payload)
+                except Exception as e:
+                    ok = False
+                    print(f"Dispatcher error ({session_id}):", e)
+                finished = time.monotonic()
+            with self._cond:
+                self._in_flight -= 1
+                self._counters["processed" if ok else "failed"] += 1
+                wait = started - enqueued
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._run_total += finished - started
+                self._cond.notify_all()
+        del self._sessions[session_id]
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._in_flight, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        with self._cond:
+            self._stopping = True
+        if self._loop is None:
+            return
+        self.join(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            done = self._counters["processed"] + self._counters["failed"]
+            return {
+                **self._counters,
+                "mode": "async",
+                "workers": self.concurrency,
+                "queue_size": self.queue_size,
+                "overflow": "reject",
+                "queue_depth": self._pending,
+                "max_depth_seen": self._max_depth,
+                "in_flight": self._in_flight,
+                "avg_wait_ms": round(1000 * self._wait_total / done, 2) if done else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+                "avg_run_ms": round(1000 * self._run_total / done, 2) if done else 0.0,
+            }
@@ -0,0 +1,124 @@
+# app/metrics.py
+# Métricas Prometheus del webhook y del agente (GET /metrics en whatsapp_server).
+#
+# - http_request_duration_seconds{method,route,status}: latencia por ruta de Flask.
+# - agent_intent_duration_seconds{intent}: ShoppingAgent.handle por intención.
+# - agent_tool_duration_seconds{tool,status}: cada llamada de tools.py (incluye hits de cache:
+#   una mediana de microsegundos = el cache está respondiendo).
+# - webhook_stage_duration_seconds{stage}: dónde pasa el tiempo un mensaje en el dispatcher
+#   (queue = espera en la cola, agent = ShoppingAgent.handle, send = envío a WhatsApp).
+#
+# Con gunicorn -w N, definir PROMETHEUS_MULTIPROC_DIR (directorio vacío por deploy) para que
+# /metrics sume los de todos los workers.
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from app import profiling
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, REGISTRY, generate_latest
+
+# Buckets en segundos: de 1 ms a 30 s (el envío a Graph con reintentos puede tardar)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 3.0, 10.0)
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de requests HTTP", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+INTENT_LATENCY = Histogram(
+    "agent_intent_duration_seconds", "ShoppingAgent.handle por intención", ["intent"], buckets=LATENCY_BUCKETS,
+)
+TOOL_LATENCY = Histogram(
+    "agent_tool_duration_seconds", "Llamadas de tools.py (API + caches)", ["tool", "status"], buckets=FAST_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "webhook_stage_duration_seconds", "Etapas de un mensaje en el dispatcher", ["stage"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("webhook_queue_depth", "Mensajes esperando en el dispatcher", multiprocess_mode="livesum")
+
+def timed_tool(fn: Callable) -> Callable:
+    """Decorador para las funciones de tools.py / async_tools.py: duración por herramienta y
+    resultado (también queda en el profile del turno, si hay uno en curso)."""
+    ok = TOOL_LATENCY.labels(fn.__name__, "ok")
+    error = TOOL_LATENCY.labels(fn.__name__, "error")
+
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                elapsed = time.perf_counter() - t0
+                error.observe(elapsed)
+                profiling.record_call(name, elapsed, False)
+                raise
+            elapsed = time.perf_counter() - t0
+            ok.observe(elapsed)
+            profiling.record_call(name, elapsed, True)
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            elapsed = time.perf_counter() - t0
+            error.observe(elapsed)
+            profiling.record_call(name, elapsed, False)
+            raise
+        elapsed = time.perf_counter() - t0
+        ok.observe(elapsed)
+        profiling.record_call(name, elapsed, True)
+        return result
+
+    return wrapper
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - t0)
+
+def watch_queue(depth: Callable[[], float]) -> None:
+    """Profundidad de la cola leída en cada scrape (no existe en modo multiproceso)."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        QUEUE_DEPTH.set_function(depth)
+
+def mount(app) -> None:
+    """Latencia por ruta (el patrón de la regla, no la URL) y GET /metrics en una app Flask."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start():
+        g.metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        t0 = g.pop("metrics_t0", None)
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        if t0 is not None and rule != "/metrics":
+            HTTP_LATENCY.labels(request.method, rule, str(response.status_code)).observe(time.perf_counter() - t0)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE_LATEST)
+
+def render() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
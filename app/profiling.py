@@ -0,0 +1,210 @@
+# app/profiling.py
+# Profiling bajo demanda de turnos del webhook (mensaje -> agente -> envío). Opt-in: sin
+# PROFILE_TOKEN / PROFILE_SAMPLE_RATE / PROFILE_ALL no se muestrea nada (un if por mensaje).
+#
+# - PROFILE_ALL=1 o PROFILE_SAMPLE_RATE=0.05: todos / una fracción de los mensajes.
+# - Header `X-Profile: <PROFILE_TOKEN>` en el POST al webhook: se perfilan los mensajes de ese
+#   POST (p.ej. reenviando con curl un payload logueado con WA_LOG_PAYLOADS=1).
+#
+# Mientras dura el turno, un thread muestrea el stack del worker del dispatcher cada
+# PROFILE_INTERVAL_MS (con WA_ASYNC=1, el del event loop: las muestras incluyen lo que corren
+# otros turnos entre awaits; llamadas, intención y profiles de la API sí son del turno). Las llamadas de tools.py quedan registradas con su duración, y a la
+# API le llega el mismo `X-Profile`, así que genera su propio profile con el SQL (su id queda
+# en `api_profiles`). Salida en PROFILE_DIR, acotada a PROFILE_MAX_FILES:
+# <id>.collapsed (flamegraph.pl / speedscope) y <id>.json (sesión seudonimizada, intención,
+# duración, llamadas; sin número de teléfono ni texto del mensaje).
+from __future__ import annotations
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ALL = os.environ.get("PROFILE_ALL", "0") == "1"
+INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "1")) / 1000
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/tmp/laburen-profiles"))
+MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+MAX_CALLS = 500
+
+class TurnProfile:
+    def __init__(self, label: str):
+        self.label = label
+        self.thread = threading.get_ident()
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.calls: List[Dict[str, Any]] = []  # llamadas de tools.py
+        self.api_profiles: List[str] = []  # X-Profile-Id que devolvió la API
+        self.notes: Dict[str, Any] = {}
+
+# Turno en curso: por thread (Dispatcher) o por task (AsyncDispatcher, WA_ASYNC=1)
+_current: ContextVar[Optional[TurnProfile]] = ContextVar("profile", default=None)
+
+def current() -> Optional[TurnProfile]:
+    return _current.get()
+
+def requested(token: Optional[str]) -> bool:
+    """¿El request del webhook pidió profiling con el header?"""
+    return bool(PROFILE_TOKEN) and token == PROFILE_TOKEN
+
+_PSEUDONYM_KEY = os.urandom(16)  # sin PROFILE_TOKEN: estable sólo dentro del proceso
+
+def pseudonym(value: str) -> str:
+    """Id para correlacionar los profiles de una sesión sin guardar el número de teléfono. HMAC
+    con PROFILE_TOKEN como clave: sin ella no se puede recalcular probando números."""
+    key = PROFILE_TOKEN.encode() or _PSEUDONYM_KEY
+    return "s-" + hmac.new(key, value.encode(), hashlib.sha256).hexdigest()[:12]
+
+def sampled() -> bool:
+    return PROFILE_ALL or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+def _frame_name(code) -> str:
+    parts = Path(code.co_filename).parts[-2:]
+    return f"{code.co_name} ({'/'.join(parts)}:{code.co_firstlineno})".replace(";", ",")
+
+class _Sampler:
+    """Thread único que muestrea los turnos activos; se duerme si no hay ninguno."""
+
+    def __init__(self):
+        self._active: set = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: TurnProfile) -> None:
+        with self._cond:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, profile: TurnProfile) -> None:
+        with self._cond:
+            self._active.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._active)
+                active = list(self._active)
+            frames = sys._current_frames()
+            for profile in active:
+                frame = frames.get(profile.thread)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    profile.stacks[";".join(reversed(stack))] += 1
+                    profile.samples += 1
+            del frames
+            time.sleep(INTERVAL)
+
+_sampler = _Sampler()
+_seq = itertools.count()
+
+def _start(label: str):
+    profile = TurnProfile(label)
+    token = _current.set(profile)
+    _sampler.add(profile)
+    return profile, token
+
+def _finish(profile: TurnProfile, token, meta: Dict[str, Any]) -> None:
+    _sampler.remove(profile)
+    _current.reset(token)
+    meta["duration_ms"] = round((time.perf_counter() - profile.started) * 1000, 3)
+
+def _save(profile: TurnProfile, meta: Dict[str, Any]) -> None:
+    try:
+        write(profile, meta)
+    except OSError as e:
+        print("Profile write error:", e)
+
+@contextmanager
+def profile_turn(label: str, meta: Dict[str, Any]):
+    """Perfila el bloque (un turno en el thread actual); `meta` se completa durante el turno y
+    se guarda en el .json."""
+    profile, token = _start(label)
+    try:
+        yield profile
+    finally:
+        _finish(profile, token, meta)
+        _save(profile, meta)
+
+@asynccontextmanager
+async def profile_turn_async(label: str, meta: Dict[str, Any]):
+    """profile_turn para un turno en el event loop (WA_ASYNC=1): los archivos se escriben en
+    un thread, sin frenar a los otros turnos."""
+    profile, token = _start(label)
+    try:
+        yield profile
+    finally:
+        _finish(profile, token, meta)
+        await asyncio.to_thread(_save, profile, meta)
+
+def note(**fields: Any) -> None:
+    """Datos extra para el .json del turno en curso (p.ej. la intención); no-op si no hay."""
+    profile = current()
+    if profile is not None:
+        profile.notes.update(fields)
+
+def record_call(tool: str, seconds: float, ok: bool) -> None:
+    profile = current()
+    if profile is not None and len(profile.calls) < MAX_CALLS:
+        profile.calls.append({"tool": tool, "ms": round(seconds * 1000, 3), "ok": ok})
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers para los requests a la API: X-Profile durante un turno perfilado (la API perfila
+    ese request también), nada si no."""
+    if PROFILE_TOKEN and current() is not None:
+        return {"X-Profile": PROFILE_TOKEN}
+    return {}
+
+def collect_api_profile(response) -> None:
+    """Guarda en el turno en curso el id del profile que generó la API (requests o httpx)."""
+    profile = current()
+    if profile is not None:
+        pid = response.headers.get("X-Profile-Id")
+        if pid:
+            profile.api_profiles.append(pid)
+
+def _prune(directory: Path) -> None:
+    files = sorted(directory.glob("*.collapsed"))  # el id empieza con la fecha
+    for old in files[:max(0, len(files) - MAX_FILES)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+def write(profile: TurnProfile, meta: Dict[str, Any]) -> str:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", profile.label).strip("_")[:60]
+    pid = f"{stamp}-{os.getpid()}-{next(_seq):06d}-{slug}"
+    (PROFILE_DIR / f"{pid}.collapsed").write_text(
+        "".join(f"{stack} {n}\n" for stack, n in profile.stacks.most_common())
+    )
+    (PROFILE_DIR / f"{pid}.json").write_text(json.dumps({
+        **meta,
+        **profile.notes,
+        "label": profile.label,
+        "samples": profile.samples,
+        "interval_ms": INTERVAL * 1000,
+        "tool_ms": round(sum(c["ms"] for c in profile.calls), 3),
+        "calls": profile.calls,
+        "api_profiles": profile.api_profiles,
+    }, indent=2, ensure_ascii=False))
+    _prune(PROFILE_DIR)
+    return pid
@@ -0,0 +1,180 @@
+# app/whatsapp_sender.py
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Envío de mensajes por la WhatsApp Cloud API (Graph).
+# - Sesión HTTP compartida (keep-alive + pool) en vez de un requests.post suelto por mensaje.
+# - Token bucket: no superar el throughput del número (80 msg/s por defecto en Cloud API).
+# - Reintentos con backoff exponencial + jitter ante 429/5xx y errores de conexión
+#   (respeta Retry-After si viene).
+# - Respuestas de más de 4000 caracteres se parten en varios mensajes, en orden.
+
+GRAPH_URL = os.environ.get("WHATSAPP_GRAPH_URL", "https://graph.facebook.com/v20.0")
+MAX_TEXT = 4000
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+class SendError(Exception):
+    pass
+
+class TokenBucket:
+    """`rate` tokens por segundo, hasta `capacity` acumulados (ráfaga). Thread-safe."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Toma un token; espera lo necesario. False si no alcanzó el timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+def split_text(body: str, limit: int = MAX_TEXT) -> List[str]:
+    """Parte en trozos de hasta `limit` caracteres, cortando en salto de línea o espacio si hay."""
+    parts = []
+    while len(body) > limit:
+        cut = body.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = body.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(body[:cut].rstrip())
+        body = body[cut:].lstrip()
+    if body or not parts:
+        parts.append(body)
+    return parts
+
+class WhatsAppSender:
+    def __init__(
+        self,
+        token: str,
+        phone_number_id: str,
+        base_url: str = GRAPH_URL,
+        rate: float = float(os.environ.get("WA_SEND_RATE", "80")),
+        burst: Optional[float] = None,
+        max_retries: int = int(os.environ.get("WA_SEND_RETRIES", "4")),
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        timeout: float = 15,
+        pool_size: int = int(os.environ.get("WA_SEND_POOL_SIZE", "16")),
+    ):
+        self.url = f"{base_url.rstrip('/')}/{phone_number_id}/messages"
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}", "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats_lock = threading.Lock()
+        self._counters = {"sent": 0, "failed": 0, "retries": 0, "parts": 0}
+        self._waiting = 0
+        self._in_flight = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    def send_text(self, to: str, body: str) -> List[Dict[str, Any]]:
+        """Envía `body` (partido si hace falta). Devuelve las respuestas de Graph; SendError si falla."""
+        parts = split_text(body)
+        out = []
+        for part in parts:
+            out.append(self._send({
+                "messaging_product": "whatsapp",
+                "to": to,
+                "type": "text",
+                "text": {"body": part},
+            }))
+        with self._stats_lock:
+            self._counters["parts"] += len(parts)
+        return out
+
+    def _send(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self._waiting += 1
+            try:
+                self.bucket.acquire()
+            finally:
+                with self._stats_lock:
+                    self._waiting -= 1
+                    self._in_flight += 1
+            retry_after = None
+            try:
+                r = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if r.status_code < 400:
+                    self._record(started, ok=True)
+                    return r.json() if r.content else {}
+                if r.status_code not in RETRY_STATUS:
+                    self._record(started, ok=False)
+                    raise SendError(f"HTTP {r.status_code}: {r.text[:500]}")
+                error = f"HTTP {r.status_code}: {r.text[:500]}"
+                retry_after = _retry_after(r)
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+            if attempt >= self.max_retries:
+                self._record(started, ok=False)
+                raise SendError(f"{error} (tras {attempt} reintentos)")
+            # Full jitter: espera aleatoria en [0, min(max, base * 2^intento)]
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_max))
+            attempt += 1
+            with self._stats_lock:
+                self._counters["retries"] += 1
+            time.sleep(delay)
+
+    def _record(self, started: float, ok: bool):
+        with self._stats_lock:
+            self._counters["sent" if ok else "failed"] += 1
+            if ok:
+                self._latencies.append(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            lat = sorted(self._latencies)
+
+            def pct(p: float) -> float:
+                return round(1000 * lat[min(len(lat) - 1, int(p * len(lat)))], 2) if lat else 0.0
+
+            return {
+                **self._counters,
+                "queue_depth": self._waiting,  # envíos esperando token del rate limiter
+                "in_flight": self._in_flight,
+                "latency_p50_ms": pct(0.50),
+                "latency_p95_ms": pct(0.95),
+                "latency_max_ms": round(1000 * lat[-1], 2) if lat else 0.0,
+            }
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    try:
+        return float(r.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
@@ -1,30 +1,115 @@
 # app/whatsapp_server.py
+import asyncio
+import atexit
 import os
+import threading
+from typing import Optional
 from flask import Flask, request, jsonify
-import requests
 from app.agent.shopping_agent import ShoppingAgent
+from app.agent.tools import CATALOG
+from app.dedup import deduper_from_env
+from app.dispatcher import AsyncDispatcher, Dispatcher
+from app import metrics, profiling
+from app.whatsapp_sender import WhatsAppSender
 import json
 
 app = Flask(__name__)
+metrics.mount(app)  # GET /metrics (Prometheus)
 
 # Deben venir por variables de entorno. Fallback SOLO para VERIFY_TOKEN.
 VERIFY_TOKEN = os.environ.get("WHATSAPP_VERIFY_TOKEN", "laburen2025")
 WHATSAPP_TOKEN = os.environ.get("WHATSAPP_TOKEN")
 PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID")  # ej: "801551269711659"
+# Loguea el JSON completo de cada POST entrante (debug)
+LOG_PAYLOADS = os.environ.get("WA_LOG_PAYLOADS", "0") == "1"
+
+_sender: Optional[WhatsAppSender] = None
+_sender_lock = threading.Lock()
+
+def get_sender() -> WhatsAppSender:
+    global _sender
+    if _sender is None:
+        if not (WHATSAPP_TOKEN and PHONE_NUMBER_ID):
+            raise RuntimeError("Faltan WHATSAPP_TOKEN o WHATSAPP_PHONE_NUMBER_ID en variables de entorno")
+        with _sender_lock:
+            if _sender is None:
+                _sender = WhatsAppSender(WHATSAPP_TOKEN, PHONE_NUMBER_ID)
+    return _sender
 
 def send_whatsapp_text(to: str, body: str):
-    if not (WHATSAPP_TOKEN and PHONE_NUMBER_ID):
-        raise RuntimeError("Faltan WHATSAPP_TOKEN o WHATSAPP_PHONE_NUMBER_ID en variables de entorno")
-    url = f"https://graph.facebook.com/v20.0/{PHONE_NUMBER_ID}/messages"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to,
-        "type": "text",
-        "text": {"body": body[:4000]}
-    }
-    r = requests.post(url, headers=headers, json=payload, timeout=15)
-    r.raise_for_status()
+    # Pool + rate limit + reintentos; textos largos se parten en varios mensajes
+    get_sender().send_text(to, body)
+
+def _profiled(msg: dict) -> bool:
+    return bool(msg.get("_profile")) or profiling.sampled()
+
+def _profile_meta(session_id: str, msg: dict) -> dict:
+    # Los profiles quedan en disco: ni el número (session_id = "wa:<teléfono>") ni el texto
+    return {"session": profiling.pseudonym(session_id), "msg_id": msg.get("id"), "text_chars": len(msg["text"]["body"])}
+
+def _profile_label(session_id: str) -> str:
+    return f"turn {profiling.pseudonym(session_id)}"
+
+def process_message(session_id: str, msg: dict):
+    """Corre en un worker del dispatcher, nunca dentro del request del webhook."""
+    if _profiled(msg):
+        with profiling.profile_turn(_profile_label(session_id), _profile_meta(session_id, msg)):
+            _process(session_id, msg)
+    else:
+        _process(session_id, msg)
+
+def _process(session_id: str, msg: dict):
+    user_number = msg["from"]
+    with metrics.timed(metrics.STAGE_LATENCY, "agent"):
+        resp = ShoppingAgent(session_id).handle(msg["text"]["body"])
+    with metrics.timed(metrics.STAGE_LATENCY, "send"):
+        send_whatsapp_text(user_number, resp)
+
+async def process_message_async(session_id: str, msg: dict):
+    """WA_ASYNC=1: el turno corre en el event loop del AsyncDispatcher; el envío (requests,
+    con rate limit y reintentos) va a un thread para no frenar el loop."""
+    if _profiled(msg):
+        async with profiling.profile_turn_async(_profile_label(session_id), _profile_meta(session_id, msg)):
+            await _process_async(session_id, msg)
+    else:
+        await _process_async(session_id, msg)
+
+async def _process_async(session_id: str, msg: dict):
+    with metrics.timed(metrics.STAGE_LATENCY, "agent"):
+        resp = await ShoppingAgent(session_id).handle_async(msg["text"]["body"])
+    with metrics.timed(metrics.STAGE_LATENCY, "send"):
+        await asyncio.to_thread(send_whatsapp_text, msg["from"], resp)
+
+if os.environ.get("WA_ASYNC", "0") == "1":
+    # Un event loop atiende cientos de sesiones a la vez (no hay un thread por turno)
+    dispatcher = AsyncDispatcher(
+        process_message_async,
+        concurrency=int(os.environ.get("WA_ASYNC_CONCURRENCY", "500")),
+        queue_size=int(os.environ.get("WA_QUEUE_SIZE", "1000")),
+        on_wait=metrics.STAGE_LATENCY.labels("queue").observe,
+    )
+else:
+    dispatcher = Dispatcher(
+        process_message,
+        workers=int(os.environ.get("WA_WORKERS", "8")),
+        queue_size=int(os.environ.get("WA_QUEUE_SIZE", "100")),
+        overflow=os.environ.get("WA_QUEUE_OVERFLOW", "reject"),
+        block_timeout=float(os.environ.get("WA_QUEUE_BLOCK_TIMEOUT", "1.0")),
+        on_wait=metrics.STAGE_LATENCY.labels("queue").observe,
+    )
+metrics.watch_queue(lambda: dispatcher.stats()["queue_depth"])
+# Al apagar el worker se procesan los mensajes ya aceptados (con tope)
+atexit.register(dispatcher.stop, 10.0)
+# Reentregas de Meta (mismo msg["id"]) se descartan antes de tocar el agente o la API
+deduper = deduper_from_env()
+
+def iter_text_messages(data: dict):
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for msg in value.get("messages", []):
+                if msg.get("type") == "text":
+                    yield msg
 
 @app.route("/wa/webhook", methods=["GET"])
 def verify():
@@ -39,45 +124,44 @@ def verify():
 @app.route("/wa/webhook", methods=["POST"])
 def incoming():
     data = request.get_json(force=True, silent=True) or {}
+    if LOG_PAYLOADS:
+        print("\n=== WEBHOOK IN ===")
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+        print("=== /WEBHOOK IN ===\n")
+    # Sólo se encola: el agente y el envío corren en el dispatcher, el 200 sale enseguida
+    rejected = 0
+    profile = profiling.requested(request.headers.get("X-Profile"))
     try:
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                value = change.get("value", {})
-                for msg in value.get("messages", []):
-                    if msg.get("type") == "text":
-                        user_number = msg["from"]
-                        text = msg["text"]["body"]
-                        session_id = f"wa:{user_number}"
-                        agent = ShoppingAgent(session_id)
-                        resp = agent.handle(text)
-                        send_whatsapp_text(user_number, resp)
+        for msg in iter_text_messages(data):
+            msg_id = msg.get("id")
+            if msg_id and deduper.seen(msg_id):
+                continue
+            if profile:
+                msg = {**msg, "_profile": True}
+            if not dispatcher.submit(f"wa:{msg['from']}", msg):
+                rejected += 1
+                if msg_id:
+                    deduper.forget(msg_id)  # la reentrega tiene que procesarse
     except Exception as e:
         print("Webhook error:", e)
+    if rejected:
+        # Cola llena (overflow=reject): Meta reintenta la entrega más tarde
+        return jsonify(status="busy", rejected=rejected), 503
     return jsonify(status="ok"), 200
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
-
-
 # --- healthcheck (Render lo usa para saber si está vivo) ---
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify(status="ok"), 200
 
-# --- logueo claro del POST entrante ---
-@app.route("/wa/webhook", methods=["POST"])
-def incoming():
-    data = request.get_json(force=True, silent=True) or {}
-    print("\n=== WEBHOOK IN ===")
-    try:
-        print(json.dumps(data, indent=2, ensure_ascii=False))
-    except Exception:
-        print(str(data))
-    print("=== /WEBHOOK IN ===\n")
-    # ... (tu código de parseo/respuesta como ya lo tenés)
-    try:
-        # (tu lógica actual)
-        ...
-    except Exception as e:
-        print("Webhook error:", e)
-    return jsonify(status="ok"), 200
+# --- métricas de la cola (profundidad, rechazos, esperas), dedup, envío (latencia) y catálogo local ---
+@app.route("/wa/stats", methods=["GET"])
+def stats():
+    return jsonify(dispatcher.stats() | {
+        "dedup": deduper.stats(),
+        "sender": _sender.stats() if _sender else None,
+        "catalog": CATALOG.stats(),
+    }), 200
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
@@ -0,0 +1,2 @@
+# Los tests de la API viven en api/tests y se corren desde api/ (su paquete también se llama `app`).
+collect_ignore = ["api"]
@@ -7,6 +7,40 @@ def find_products(base_url, q):
     r.raise_for_status()
     return r.json()
 
+def iter_products(base_url, q=None, page_size=200):
+    """Recorre todo el resultado paginando con el cursor after_id (header X-Next-After-Id)."""
+    params = {"limit": page_size}
+    if q:
+        params["q"] = q
+        params["after_id"] = 0  # con cursor la búsqueda se ordena por id
+    while True:
+        r = requests.get(f"{base_url}/products", params=params, timeout=10)
+        r.raise_for_status()
+        yield from r.json()
+        nxt = r.headers.get("X-Next-After-Id")
+        if not nxt:
+            return
+        params["after_id"] = nxt
+
+def export_catalog(base_url, path):
+    """Descarga el catálogo completo como NDJSON (streaming, memoria constante)."""
+    n = 0
+    with requests.get(f"{base_url}/products", headers={"Accept": "application/x-ndjson"}, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(path, "wb") as out:
+            for line in r.iter_lines():
+                if line:
+                    out.write(line + b"\n")
+                    n += 1
+    return n
+
+def get_products(base_url, ids):
+    """Valida/lee varios productos en un solo request. Devuelve (productos, ids_faltantes)."""
+    r = requests.post(f"{base_url}/products/batch", json={"ids": ids}, timeout=10)
+    r.raise_for_status()
+    body = r.json()
+    return body["items"], body["missing"]
+
 def create_cart(base_url, items):
     r = requests.post(f"{base_url}/carts", json={"items": items}, timeout=10)
     r.raise_for_status()
@@ -21,11 +55,17 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--base-url", default="http://localhost:8000", help="API base URL")
     parser.add_argument("--demo", action="store_true", help="ejecuta flujo predefinido")
+    parser.add_argument("--export", metavar="PATH", help="exporta el catálogo completo a un archivo NDJSON")
     args = parser.parse_args()
 
     base = args.base_url
     log(f"Usando API en {base}")
 
+    if args.export:
+        n = export_catalog(base, args.export)
+        log(f"Exporté {n} productos a {args.export}.")
+        return
+
     if args.demo:
         # Buscar algo genérico
         results = find_products(base, q="")
@@ -51,9 +91,8 @@ def main():
         log("Eliminé el segundo item del carrito.")
 
         # Resumen final
-        total = 0.0
-        for it in cart["items"]:
-            total += it["qty"] * it["product"]["price"]
+        # total exacto que mantiene la API (string decimal); fallback a la suma en cliente
+        total = float(cart["total"]) if "total" in cart else sum(it["qty"] * it["product"]["price"] for it in cart["items"])
         log(f"Resumen carrito #{cart['id']}: {len(cart['items'])} items | Total: ${total:.2f}")
         for it in cart["items"]:
             p = it["product"]
@@ -71,7 +110,14 @@ def main():
                     continue
                 sel = input("Elegí IDs separados por coma (ej: 1,2): ").strip()
                 ids = [int(x) for x in sel.split(",") if x.strip().isdigit()]
-                items = [{"product_id": pid, "qty": 1} for pid in ids]
+                if not ids:
+                    continue
+                found, missing = get_products(base, ids)
+                if missing:
+                    print(f"No existen: {', '.join(map(str, missing))}")
+                if not found:
+                    continue
+                items = [{"product_id": p["id"], "qty": 1} for p in found]
                 cart = create_cart(base, items)
                 print(f"Carrito #{cart['id']} creado.")
                 break
@@ -0,0 +1,91 @@
+# scripts/fake_graph.py — Graph API falso para probar el envío sin pegarle a Meta.
+#
+#   python scripts/fake_graph.py --port 9999
+#   WHATSAPP_GRAPH_URL=http://127.0.0.1:9999/v20.0 WHATSAPP_TOKEN=x WHATSAPP_PHONE_NUMBER_ID=1 ...
+#
+# Acepta POST /<version>/<phone_id>/messages, guarda cada payload y responde como Graph.
+# `fail_next` permite encolar respuestas de error (p.ej. [429, 503]) antes de volver a 200.
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeGraph:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, on_message=None):
+        self.messages = []
+        self.on_message = on_message  # callback(payload) por cada mensaje aceptado (p.ej. replay_webhook.py)
+        self.requests = 0
+        self.fail_next = []  # códigos de estado a devolver en los próximos requests
+        self.retry_after = None  # header Retry-After para las respuestas 429
+        self.latency = latency
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake._lock:
+                    fake.requests += 1
+                    status = fake.fail_next.pop(0) if fake.fail_next else 200
+                    if status == 200:
+                        fake.messages.append(body)
+                        n = len(fake.messages)
+                if status == 200:
+                    if fake.on_message:
+                        fake.on_message(body)
+                    self._reply(200, {
+                        "messaging_product": "whatsapp",
+                        "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                        "messages": [{"id": f"wamid.fake{n}"}],
+                    })
+                else:
+                    headers = {"Retry-After": str(fake.retry_after)} if status == 429 and fake.retry_after is not None else {}
+                    self._reply(status, {"error": {"code": status, "message": "fake error"}}, headers)
+
+            def _reply(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}/v20.0"
+
+    def start(self) -> "FakeGraph":
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graph API falso (WhatsApp Cloud)")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos de demora por request")
+    args = parser.parse_args()
+    fake = FakeGraph(port=args.port, latency=args.latency)
+    print(f"Fake Graph en {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
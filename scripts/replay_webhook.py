@@ -0,0 +1,286 @@
+# scripts/replay_webhook.py — carga end-to-end: webhook de WhatsApp -> agente -> API -> Graph.
+#
+#   python scripts/replay_webhook.py --users 50 --messages 8 --workers 2
+#   python scripts/replay_webhook.py --record dialogs.jsonl --users 200   # genera y guarda
+#   python scripts/replay_webhook.py --load dialogs.jsonl                 # reproduce lo guardado
+#   python scripts/replay_webhook.py --api-base http://localhost:8000     # contra una API ya levantada
+#
+# Levanta (salvo --api-base) la API con uvicorn sobre un catálogo sintético en SQLite temporal,
+# el servidor del webhook con gunicorn (`app.whatsapp_server:app`) apuntando a un Graph falso
+# (scripts/fake_graph.py) y simula usuarios concurrentes con diálogos de compra. Cada usuario
+# manda un mensaje, espera la respuesta en el Graph falso y recién ahí manda el siguiente.
+#
+# Reporta latencia mensaje -> respuesta (p50/p95/p99/max), conversaciones y mensajes por
+# segundo, y errores: HTTP del webhook (503 = cola llena), respuestas que no llegaron y
+# respuestas de error del agente. Sirve para dimensionar WA_WORKERS/gunicorn -w y para
+# detectar regresiones en ShoppingAgent.handle.
+#
+# Los payloads grabados (--record / --load) son JSONL con un webhook de Meta por línea, en el
+# orden en que cada usuario los manda; sirve también lo que loguea WA_LOG_PAYLOADS=1.
+import argparse
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.append(str(ROOT / "api"))  # benchmarks.common (al final: `app` tiene que ser el del agente)
+
+from fake_graph import FakeGraph  # noqa: E402
+from benchmarks.common import COLORES, TIPOS, TALLAS, make_catalog, percentile, serve, temp_sqlite_url  # noqa: E402
+
+# Respuestas del agente que cuentan como error (la API falló o no respondió)
+AGENT_ERRORS = ("Ocurrió un error con la API",)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# ---------- Diálogos ----------
+
+def dialog(rnd: random.Random, n_products: int, n_messages: int) -> list:
+    """Conversación de compra típica: buscar, ver detalle, agregar (por id y por nombre),
+    mirar el carrito, cambiar cantidades, quitar."""
+    tipo, color = rnd.choice(TIPOS).lower(), rnd.choice(COLORES).lower()
+    pid, other = rnd.randint(1, n_products), rnd.randint(1, n_products)
+    script = [
+        "hola",
+        f"buscá {tipo} {color}",
+        f"detalle producto {pid}",
+        f"agregá {rnd.randint(1, 3)} del producto {pid}",
+        f"agregá 1 {tipo} {color} talle {rnd.choice(TALLAS)}",
+        "ver carrito",
+        f"mostrá productos color:{color} talle:{rnd.choice(TALLAS).lower()}",
+        f"agregar producto {other}",
+        f"cambiar producto {pid} a {rnd.randint(1, 5)}",
+        f"quitar producto {other}",
+        "total",
+    ]
+    return [script[i % len(script)] for i in range(n_messages)]
+
+def webhook_payload(user: str, text: str, msg_id: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "replay", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "15550000000", "phone_number_id": "replay"},
+            "contacts": [{"profile": {"name": f"user {user}"}, "wa_id": user}],
+            "messages": [{"from": user, "id": msg_id, "timestamp": str(int(time.time())),
+                          "type": "text", "text": {"body": text}}],
+        }}]}],
+    }
+
+def generate(users: int, messages: int, n_products: int, seed: int) -> "OrderedDict[str, list]":
+    run = f"{seed}-{int(time.time())}"
+    out: "OrderedDict[str, list]" = OrderedDict()
+    for u in range(users):
+        rnd = random.Random(seed * 100_003 + u)
+        user = f"54911{u:08d}"
+        out[user] = [webhook_payload(user, text, f"wamid.replay.{run}.{u}.{k}")
+                     for k, text in enumerate(dialog(rnd, n_products, messages))]
+    return out
+
+def load(path: str) -> "OrderedDict[str, list]":
+    out: "OrderedDict[str, list]" = OrderedDict()
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                payload = json.loads(line)
+                msg = payload["entry"][0]["changes"][0]["value"]["messages"][0]
+                out.setdefault(msg["from"], []).append(payload)
+    return out
+
+def save(path: str, dialogs: "OrderedDict[str, list]") -> None:
+    with open(path, "w") as f:
+        for payloads in dialogs.values():
+            for p in payloads:
+                f.write(json.dumps(p, ensure_ascii=False) + "\n")
+
+# ---------- Procesos ----------
+
+@contextmanager
+def webhook_server(env: dict, workers: int):
+    port = free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+           "--log-level", "warning", "app.whatsapp_server:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env={**os.environ, **env})
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline or proc.poll() is not None:
+                raise RuntimeError("el servidor del webhook no levantó")
+            time.sleep(0.1)
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+
+@contextmanager
+def api_server(api_base, products: int):
+    if api_base:
+        yield api_base
+        return
+    db_url = temp_sqlite_url()
+    make_catalog(db_url, products)
+    with serve(db_url) as base:
+        yield base
+
+# ---------- Simulación ----------
+
+class Replay:
+    def __init__(self, webhook_url: str, timeout: float):
+        self.webhook_url = webhook_url
+        self.timeout = timeout
+        self.inbox = {}  # usuario -> Queue de (t, texto) que llegan al Graph falso
+        self.latencies = []
+        self.errors = {"http": 0, "rejected": 0, "no_reply": 0, "agent_error": 0}
+        self.sent = 0
+        self.conversations = 0
+        self._lock = threading.Lock()
+
+    def on_reply(self, body: dict) -> None:
+        q = self.inbox.get(body.get("to"))
+        if q is not None:
+            q.put((time.perf_counter(), body.get("text", {}).get("body", "")))
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.errors[key] += 1
+
+    def user(self, user: str, payloads: list) -> None:
+        inbox = self.inbox[user]
+        session = requests.Session()
+        replied = 0
+        for payload in payloads:
+            # Partes sobrantes de una respuesta larga anterior (se parte en varios mensajes)
+            while not inbox.empty():
+                inbox.get_nowait()
+            # Antes del POST: un error de conexión también es un intento (error_rate <= 100%)
+            with self._lock:
+                self.sent += 1
+            t0 = time.perf_counter()
+            try:
+                r = session.post(self.webhook_url, json=payload, timeout=self.timeout)
+            except requests.RequestException:
+                self._count("http")
+                continue
+            if r.status_code == 503:
+                self._count("rejected")  # Meta reintentaría; acá cuenta como error de capacidad
+                continue
+            if r.status_code != 200:
+                self._count("http")
+                continue
+            try:
+                t1, text = inbox.get(timeout=self.timeout)
+            except queue.Empty:
+                self._count("no_reply")
+                continue
+            if any(e in text for e in AGENT_ERRORS):
+                self._count("agent_error")
+            replied += 1
+            with self._lock:
+                self.latencies.append((t1 - t0) * 1000)
+        # Sólo cuentan las conversaciones completas: con sobrecarga, conv/s no se infla
+        if replied == len(payloads):
+            with self._lock:
+                self.conversations += 1
+
+    def run(self, dialogs: "OrderedDict[str, list]") -> float:
+        for user in dialogs:
+            self.inbox[user] = queue.Queue()
+        threads = [threading.Thread(target=self.user, args=(u, p), daemon=True) for u, p in dialogs.items()]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay end-to-end del webhook de WhatsApp con Graph falso")
+    ap.add_argument("--users", type=int, default=50, help="usuarios simulados concurrentes")
+    ap.add_argument("--messages", type=int, default=8, help="mensajes por usuario")
+    ap.add_argument("--products", type=int, default=2000, help="catálogo sintético (si no hay --api-base)")
+    ap.add_argument("--api-base", help="API ya levantada (default: uvicorn + SQLite temporal)")
+    ap.add_argument("--workers", type=int, default=2, help="workers de gunicorn del webhook")
+    ap.add_argument("--wa-workers", type=int, default=8, help="WA_WORKERS (threads del dispatcher por proceso)")
+    ap.add_argument("--async", dest="async_mode", action="store_true",
+                    help="WA_ASYNC=1: ShoppingAgent.handle_async en un event loop por worker")
+    ap.add_argument("--graph-latency", type=float, default=0.0, help="demora (s) del Graph falso por envío")
+    ap.add_argument("--timeout", type=float, default=30.0, help="espera máxima por respuesta (s)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--record", help="guarda los payloads generados en este JSONL")
+    ap.add_argument("--load", help="reproduce payloads grabados (JSONL) en vez de generarlos")
+    ap.add_argument("--json", help="guarda el resumen en este archivo")
+    args = ap.parse_args()
+
+    dialogs = load(args.load) if args.load else generate(args.users, args.messages, args.products, args.seed)
+    if args.record:
+        save(args.record, dialogs)
+    tmp = Path(tempfile.mkdtemp())
+    replay = None
+
+    with FakeGraph(latency=args.graph_latency) as graph, api_server(args.api_base, args.products) as api:
+        env = {
+            "API_BASE": api,
+            "WHATSAPP_GRAPH_URL": graph.url,
+            "WHATSAPP_TOKEN": "replay",
+            "WHATSAPP_PHONE_NUMBER_ID": "replay",
+            "WA_WORKERS": str(args.wa_workers),
+            "WA_ASYNC": "1" if args.async_mode else "0",
+            # Estado compartido entre los workers de gunicorn, como en render.yaml
+            "SESSION_STORE": f"sqlite:///{tmp / 'sessions.db'}",
+            "WA_DEDUP_STORE": f"sqlite:///{tmp / 'dedup.db'}",
+        }
+        with webhook_server(env, args.workers) as base:
+            replay = Replay(f"{base}/wa/webhook", args.timeout)
+            graph.on_message = replay.on_reply
+            elapsed = replay.run(dialogs)
+            stats = requests.get(f"{base}/wa/stats", timeout=5).json()
+
+    lat = replay.latencies
+    summary = {
+        "users": len(dialogs),
+        "messages": sum(len(p) for p in dialogs.values()),
+        "sent": replay.sent,
+        "replies": len(lat),
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        "conversations_per_s": round(replay.conversations / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {p: round(percentile(lat, int(p[1:])), 1) for p in ("p50", "p95", "p99")} | {
+            "max": round(max(lat), 1) if lat else 0.0},
+        "errors": replay.errors,
+        "error_rate": round(sum(replay.errors.values()) / max(1, replay.sent), 4),
+        "webhook_stats": stats,  # del último worker que atendió /wa/stats
+    }
+    lm = summary["latency_ms"]
+    print(f"{summary['users']} usuarios, {summary['messages']} mensajes | "
+          f"gunicorn -w {args.workers} | " + ("WA_ASYNC=1" if args.async_mode else f"WA_WORKERS={args.wa_workers}"))
+    print(f"respuestas {summary['replies']}/{summary['messages']} en {summary['elapsed_s']}s | "
+          f"{summary['messages_per_s']} msg/s | {summary['conversations_per_s']} conv/s")
+    print(f"latencia mensaje->respuesta ms: p50 {lm['p50']}  p95 {lm['p95']}  p99 {lm['p99']}  max {lm['max']}")
+    print(f"errores: {summary['errors']} (tasa {summary['error_rate']:.2%})")
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
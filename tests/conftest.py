@@ -0,0 +1,31 @@
+# tests/conftest.py
+import os
+import pytest
+
+# Sin thread de refresh del catálogo: los tests cargan el snapshot a mano
+os.environ.setdefault("AGENT_CATALOG_REFRESH_SECONDS", "0")
+
+from app.agent import tools
+
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS") == "1"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: mide tiempos; sólo con RUN_BENCHMARKS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Las mediciones de tiempo dependen de la máquina: fuera de la corrida por defecto
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="benchmark: correr con RUN_BENCHMARKS=1")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def _clear_tool_caches():
+    # Los caches de tools son de módulo; cada test arranca en frío
+    tools.clear_caches()
+    yield
@@ -0,0 +1,21 @@
+# tests/intent_corpus.py — mensajes reales/realistas de clientes (español rioplatense)
+CORPUS = [
+    "hola", "Hola! buen día", "ayuda", "qué sabés hacer?", "como uso esto", "help",
+    "Buscá medias", "busca medias negras", "buscá pantalón azul", "Busca remeras talle: M",
+    "buscá medias color: negro talle: L", "mostrá productos", "mostrá productos color:negro talle:M",
+    "tenés zoquetes?", "tenes buzos de algodón?", "Tenés camisas formales",
+    "productos", "mostrá productos deportivos", "busca chaqueta", "buscá camiseta color: blanco",
+    "Detalle producto 1", "detalle producto 25", "info producto 7", "información producto 12",
+    "detalle id 3", "Info id 40",
+    "Agregá 2 del producto 1", "agregá 3 del producto 15", "agregar 1 del producto 9",
+    "agrega 5 unidades del producto 3", "agregá 2 x 8", "añade 4 del producto 2", "sumar 1 producto 6",
+    "agregar producto 5", "agregá el producto 33", "sumá el producto 4 por favor", "agrega producto 10",
+    "quitar 1 del producto 5", "quita 3 unidades del producto 8",
+    "remover 1 del producto 2", "saca 1 producto 7",
+    "cambiar producto 5 a 3", "cambia el producto 2 a 10", "deja producto 4 en 1", "poner producto 9 a 2",
+    "setea producto 3 en 6",
+    "quitar producto 5", "sacar el producto 2", "remueve producto 11",
+    "ver carrito", "mostrar carrito", "carrito", "total", "cuál es el total?", "Ver carrito por favor",
+    "gracias!", "chau", "ok", "dale", "¿hacen envíos a córdoba?", "cuánto sale el envío",
+    "quiero medias", "medias negras talle m", "necesito algo para correr",
+]
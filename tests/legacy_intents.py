@@ -0,0 +1,66 @@
+# tests/legacy_intents.py — parser previo a app/agent/intents.py, congelado como referencia
+# para el test de paridad y el benchmark. No usar en código nuevo.
+import re
+from typing import Any, Dict
+
+
+def legacy_parse(text: str) -> Dict[str, Any]:
+    t = text.lower().strip()
+
+    # ayuda
+    if any(k in t for k in ["ayuda", "qué sabés hacer", "como uso", "help"]):
+        return {"intent": "help"}
+
+    # ver carrito / total
+    if re.search(r"\b(carrito|total|ver carrito|mostrar carrito)\b", t):
+        return {"intent": "show_cart"}
+
+    # detalle por id
+    m = re.search(r"(detalle|info|información)\s+(id|producto)\s*(\d+)", t)
+    if m:
+        return {"intent": "detail", "product_id": int(m.group(3))}
+
+    # agregar X unidades de producto Y (por id)
+    m = re.search(r"(agrega|agregá|añade|sumar|agregar)\s*(\d+)\s*(?:x|unidades?|u\.?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)", t)
+    if m:
+        return {"intent": "add", "qty": int(m.group(2)), "product_id": int(m.group(3))}
+
+    # agregar por id simple: "agregar producto 5", qty=1
+    m = re.search(r"(agrega|agregá|agregar|sumar).*(producto\s*)(\d+)", t)
+    if m:
+        return {"intent": "add", "qty": 1, "product_id": int(m.group(3))}
+
+    # quitar/cambiar qty
+    # "quitar 1 del producto 5" => qty negativa
+    m = re.search(r"(quita|quitar|remueve|remover|saca|sacar)\s*(\d+)\s*(?:x|unidades?)?\s*(?:del\s*)?(?:producto\s*)?(\d+)", t)
+    if m:
+        return {"intent": "add", "qty": -int(m.group(2)), "product_id": int(m.group(3))}
+
+    # "cambiar producto 5 a 3" => set qty 3
+    m = re.search(r"(cambia|cambiar|setea|poner|deja)\s*(?:el\s*)?(?:producto\s*)?(\d+)\s*(?:a|en)\s*(\d+)", t)
+    if m:
+        return {"intent": "set_qty", "product_id": int(m.group(2)), "qty": int(m.group(3))}
+
+    # quitar por id completo: "quitar producto 5" => qty 0
+    m = re.search(r"(quita|quitar|remueve|remover|saca|sacar).*(producto\s*)(\d+)", t)
+    if m:
+        return {"intent": "set_qty", "product_id": int(m.group(3)), "qty": 0}
+
+    # buscar (por texto)
+    # guarda filtros recordados (color/talle) si aparecen
+    filters = {}
+    m_color = re.search(r"\b(color|colores?)\s*:\s*([a-záéíóúñ]+)", t)
+    if m_color:
+        filters["color"] = m_color.group(2)
+    m_talle = re.search(r"\b(talle|tamaño|size)\s*:\s*([a-z0-9\-]+)", t)
+    if m_talle:
+        filters["talle"] = m_talle.group(2)
+
+    # “busca medias negras”, “mostrá productos”, “tenés zoquetes?”
+    if any(k in t for k in ["busca", "buscá", "buscar", "productos", "tenes", "tenés", "mostra", "mostrá", "mostrame"]):
+        q = re.sub(r"(busca|buscá|buscar|mostra|mostrá|mostrame|productos|tenes|tenés)", "", t).strip()
+        q = re.sub(r"(color\s*:\s*\w+|talle\s*:\s*\w+)", "", q).strip()
+        return {"intent": "search", "q": q if q else None, "filters": filters or None}
+
+    # fallback a ayuda
+    return {"intent": "help"}
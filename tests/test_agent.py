@@ -47,14 +47,27 @@ def test_detail_404(agent):
 def test_add_creates_cart_201(agent):
     with Mocker() as m:
         p = mock_products()[0]
-        m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
-        m.post(f"{API_BASE}/carts", json=mock_cart(cart_id=77), status_code=201)
-        # patch devuelve carrito con items
-        m.patch(f"{API_BASE}/carts/77", json=mock_cart(77, items=[{"product": p, "qty": 2}]), status_code=200)
+        # un solo request: crea el carrito, valida el producto y aplica el item
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(77, items=[{"product": p, "qty": 2}]), status_code=201)
 
         resp = agent.handle("Agregá 2 del producto 1")
         assert "Agregué producto 1 x2" in resp
         assert "Total: $2000" in resp
+        assert m.call_count == 1
+        assert m.last_request.json() == {"cart_id": None, "items": [{"product_id": 1, "qty": 2, "op": "inc"}]}
+
+def test_stale_cart_id_retries_with_new_cart(agent):
+    with Mocker() as m:
+        p = mock_products()[0]
+        agent.state.cart_id = 41  # carrito que la API ya no tiene (p.ej. base recreada)
+        agent.store.put(agent.session_id, agent.state)
+        m.post(f"{API_BASE}/carts/commands", [
+            {"json": {"detail": "Cart not found"}, "status_code": 404},
+            {"json": mock_cart(42, items=[{"product": p, "qty": 1}]), "status_code": 201},
+        ])
+        assert "Agregué producto 1 x1" in agent.handle("agregar producto 1")
+        assert [r.json()["cart_id"] for r in m.request_history] == [41, None]
+        assert agent.state.cart_id == 42
 
 def test_set_qty_200(agent):
     with Mocker() as m:
@@ -62,17 +75,24 @@ def test_set_qty_200(agent):
         # existencia del producto
         m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
         # carrito ya existe
-        m.post(f"{API_BASE}/carts", json=mock_cart(88), status_code=201)
-        m.patch(f"{API_BASE}/carts/88", json=mock_cart(88, items=[{"product": p, "qty": 3}]), status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(88, items=[{"product": p, "qty": 3}]), status_code=200)
 
         # primera acción creará cart
         _ = agent.handle("agregar producto 2")
         # ahora setear qty
-        m.patch(f"{API_BASE}/carts/88", json=mock_cart(88, items=[{"product": p, "qty": 5}]), status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(88, items=[{"product": p, "qty": 5}]), status_code=200)
         resp = agent.handle("cambiar producto 2 a 5")
         assert "Dejé producto 2 en 5u" in resp
         assert "Total: $5500" in resp
 
+def test_add_without_stock_409(agent):
+    with Mocker() as m:
+        p = mock_products()[2]
+        m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json={"detail": "Insufficient stock for products: [3]"}, status_code=409)
+        resp = agent.handle("Agregá 50 del producto 3")
+        assert "No hay stock suficiente" in resp
+
 def test_show_cart_empty(agent):
     # sin cart creado
     resp = agent.handle("ver carrito")
@@ -82,17 +102,82 @@ def test_remove_to_zero(agent):
     with Mocker() as m:
         p = mock_products()[2]
         m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
-        m.post(f"{API_BASE}/carts", json=mock_cart(90), status_code=201)
         # Agregar 1
-        m.patch(f"{API_BASE}/carts/90", json=mock_cart(90, items=[{"product": p, "qty": 1}]), status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(90, items=[{"product": p, "qty": 1}]), status_code=200)
         _ = agent.handle("agregar producto 3")
         # Eliminar (qty=0)
-        m.patch(f"{API_BASE}/carts/90", json=mock_cart(90, items=[]), status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(90, items=[]), status_code=200)
         resp = agent.handle("quitar producto 3")
         assert "Eliminé producto 3" in resp
         assert "Total: $0" in resp
 
+def test_show_cart_uses_conditional_get(agent):
+    with Mocker() as m:
+        p = mock_products()[0]
+        m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(95, items=[{"product": p, "qty": 2}]),
+                headers={"ETag": '"cart-95-v2"'}, status_code=200)
+        _ = agent.handle("agregar 2 del producto 1")
+
+        get = m.get(f"{API_BASE}/carts/95", status_code=304, headers={"ETag": '"cart-95-v2"'})
+        resp = agent.handle("ver carrito")
+        assert get.last_request.headers["If-None-Match"] == '"cart-95-v2"'
+        assert "- 1 Media negra M x2 = $2000" in resp
+        assert "Total: $2000" in resp
+
+def test_total_uses_api_summary(agent):
+    with Mocker() as m:
+        p = mock_products()[0]
+        m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
+        cart = {**mock_cart(96, items=[{"product": p, "qty": 3}]), "line_count": 1, "unit_count": 3, "total": "3000.30"}
+        m.post(f"{API_BASE}/carts/commands", json=cart, status_code=200)
+        resp = agent.handle("agregá 3 del producto 1")
+        assert "Total: $3000.30" in resp
+
+def test_product_cache_and_invalidation(agent):
+    from app.agent import tools
+    with Mocker() as m:
+        p = mock_products()[0]
+        search = m.get(f"{API_BASE}/products", json=mock_products(), status_code=200)
+        detail = m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
+        agent.handle("buscá medias")
+        agent.handle("Buscá  MEDIAS")  # misma consulta normalizada
+        agent.handle("detalle producto 1")  # ya vino en la búsqueda
+        assert search.call_count == 1
+        assert detail.call_count == 0
+        assert tools.cache_stats()["search"]["hits"] == 1
+
+        # el carrito trae el producto con stock actualizado: refresca el cache y vacía búsquedas
+        fresher = {**p, "stock": 7}
+        m.post(f"{API_BASE}/carts/commands", json=mock_cart(97, items=[{"product": fresher, "qty": 1}]), status_code=200)
+        agent.handle("agregar producto 1")
+        assert tools.get_product(1)["stock"] == 7
+        agent.handle("buscá medias")
+        assert search.call_count == 2
+
+def test_get_products_batches_cache_misses():
+    from app.agent import tools
+    with Mocker() as m:
+        p1, p2, p3 = mock_products()
+        m.get(f"{API_BASE}/products/{p1['id']}", json=p1, status_code=200)
+        tools.get_product(1)
+        batch = m.post(f"{API_BASE}/products/batch", json={"items": [p3, p2], "missing": [9]}, status_code=200)
+        found, missing = tools.get_products([3, 1, 9, 2])
+        assert batch.last_request.json() == {"ids": [3, 9, 2]}
+        assert [p["id"] for p in found] == [3, 1, 2]
+        assert missing == [9]
+
+def test_search_pushes_session_filters_to_api():
+    agent = ShoppingAgent(session_id=f"t-filters-{uuid4()}")
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=mock_products()[:1], status_code=200)
+        agent.handle("mostrá productos color:negro talle:M")
+        assert m.last_request.qs == {"color": ["negro"], "talle": ["m"]}
+        # Los filtros quedan en la sesión y acompañan la próxima búsqueda
+        agent.handle("buscá medias")
+        assert m.last_request.qs == {"q": ["medias"], "color": ["negro"], "talle": ["m"]}
+
 @pytest.fixture
 def agent():
     # session_id único por test
-    return ShoppingAgent(session_id=f"t-{uuid4()}")
\ No newline at end of file
+    return ShoppingAgent(session_id=f"t-{uuid4()}")
@@ -0,0 +1,229 @@
+# tests/test_async_agent.py
+import asyncio
+import json
+import threading
+import time
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from app.agent import async_tools
+from app.agent.session_store import SqliteSessionStore
+from app.agent.shopping_agent import ShoppingAgent
+from app.dispatcher import AsyncDispatcher
+
+PRODUCTS = {
+    1: {"id": 1, "name": "Media negra M", "description": "Cómoda", "price": 1000, "stock": 50},
+    2: {"id": 2, "name": "Media blanca L", "description": "Clásica", "price": 1100, "stock": 30},
+}
+
+
+class FakeApi:
+    """API en memoria sobre httpx.MockTransport; cada request tarda `delay` s."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.carts = {}
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(f"{request.method} {request.url.path}")
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            return self.route(request)
+        finally:
+            self.running -= 1
+
+    def route(self, request):
+        path, method = request.url.path, request.method
+        if path == "/products":
+            q = request.url.params.get("q", "")
+            return httpx.Response(200, json=[p for p in PRODUCTS.values() if q.split()[0] in p["name"].lower()])
+        if path.startswith("/products/"):
+            p = PRODUCTS.get(int(path.rsplit("/", 1)[1]))
+            return httpx.Response(200, json=p) if p else httpx.Response(404, json={"detail": "Not found"})
+        if path == "/carts/commands":
+            return self.command(json.loads(request.content))
+        if path == "/carts" and method == "POST":
+            cid = 100 + len(self.carts)
+            self.carts[cid] = {}
+            return httpx.Response(201, json=self.cart(cid))
+        cid = int(path.rsplit("/", 1)[1])
+        if cid not in self.carts:
+            return httpx.Response(404, json={"detail": "Cart not found"})
+        if method == "PATCH":
+            error = self.apply(cid, json.loads(request.content)["items"])
+            if error:
+                return error
+        return httpx.Response(200, json=self.cart(cid))
+
+    def command(self, body):
+        """POST /carts/commands: crea o usa el carrito y aplica los items, todo o nada."""
+        cid, items = body["cart_id"], body["items"]
+        if any(it["product_id"] not in PRODUCTS for it in items):
+            return httpx.Response(404, json={"detail": "Not found"})
+        if cid is not None and cid not in self.carts:
+            return httpx.Response(404, json={"detail": "Cart not found"})
+        created = cid is None
+        before = {} if created else dict(self.carts[cid])
+        if created:
+            cid = 100 + len(self.carts)
+            self.carts[cid] = {}
+        error = self.apply(cid, items)
+        if error:
+            if created:
+                del self.carts[cid]
+            else:
+                self.carts[cid] = before
+            return error
+        return httpx.Response(201 if created else 200, json=self.cart(cid))
+
+    def apply(self, cid, items):
+        for it in items:
+            qty = self.carts[cid].get(it["product_id"], 0) + it["qty"] if it.get("op") == "inc" else it["qty"]
+            if qty > PRODUCTS[it["product_id"]]["stock"]:
+                return httpx.Response(409, json={"detail": "Insufficient stock"})
+            self.carts[cid][it["product_id"]] = qty
+            if qty <= 0:
+                del self.carts[cid][it["product_id"]]
+        return None
+
+    def cart(self, cid):
+        items = [{"product": PRODUCTS[pid], "qty": q} for pid, q in self.carts[cid].items()]
+        return {"id": cid, "items": items}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeApi()
+    monkeypatch.setattr(async_tools, "_transport", httpx.MockTransport(fake))
+    monkeypatch.setattr(async_tools, "_client", None)
+    return fake
+
+
+def converse(texts, session_id=None):
+    agent = ShoppingAgent(session_id or f"a-{uuid4()}")
+
+    async def run():
+        try:
+            return [await agent.handle_async(t) for t in texts]
+        finally:
+            await async_tools.aclose()
+
+    return asyncio.run(run())
+
+
+def test_same_replies_as_sync_handler(api):
+    replies = converse([
+        "ayuda", "buscá media", "detalle producto 2", "detalle producto 9",
+        "agregá 2 del producto 1", "agregar producto 2", "cambiar producto 2 a 3",
+        "agregá 100 del producto 1", "quitar producto 2", "ver carrito",
+    ])
+    assert replies[0].startswith("Puedo buscar productos")
+    assert replies[1].startswith("Productos:\n1. Media negra M")
+    assert replies[2].startswith("2. Media blanca L\n$1100")
+    assert replies[3] == "No encuentro ese producto (404)."
+    assert replies[4] == "Agregué producto 1 x2. Total: $2000."
+    assert replies[5] == "Agregué producto 2 x1. Total: $3100."
+    assert replies[6] == "Dejé producto 2 en 3u. Total: $5300."
+    assert replies[7] == "No hay stock suficiente para esa cantidad."
+    assert replies[8] == "Eliminé producto 2. Total: $2000."
+    assert replies[9] == "- 1 Media negra M x2 = $2000\nTotal: $2000"
+    assert api.calls.count("POST /carts/commands") == 5
+    assert "POST /carts" not in api.calls and not any(c.startswith("PATCH") for c in api.calls)
+
+
+def test_add_is_a_single_request(api):
+    replies = converse(["agregá 2 del producto 1"])
+    assert replies == ["Agregué producto 1 x2. Total: $2000."]
+    assert api.calls == ["POST /carts/commands"]
+
+
+def test_missing_product_creates_no_cart(api):
+    session = f"a-{uuid4()}"
+    assert converse(["agregar producto 9"], session) == ["No encuentro ese producto (404)."]
+    assert api.carts == {}
+    assert converse(["agregar producto 1"], session) == ["Agregué producto 1 x1. Total: $1000."]
+    assert list(api.carts) == [100]
+
+
+def test_stale_cart_is_replaced(api):
+    session = f"a-{uuid4()}"
+    converse(["agregar producto 1"], session)
+    api.carts.clear()  # p.ej. la API perdió la base o se purgaron carritos viejos
+    assert converse(["agregá 2 del producto 2"], session) == ["Agregué producto 2 x2. Total: $2200."]
+    assert api.calls.count("POST /carts/commands") == 3
+
+
+def test_blocking_session_store_runs_off_the_loop(api, tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    threads = []
+    for name in ("get", "put"):
+        def spy(*args, fn=getattr(store, name)):
+            threads.append(threading.get_ident())
+            return fn(*args)
+        setattr(store, name, spy)
+    agent = ShoppingAgent("a-sqlite", store=store)
+
+    async def run():
+        try:
+            return threading.get_ident(), await agent.handle_async("agregar producto 1")
+        finally:
+            await async_tools.aclose()
+
+    loop_thread, reply = asyncio.run(run())
+    assert reply == "Agregué producto 1 x1. Total: $1000."
+    assert len(threads) == 2 and loop_thread not in threads
+    assert store.get("a-sqlite").cart_id == 100
+
+
+def test_async_dispatcher_serves_many_sessions_on_one_loop():
+    seen = {}
+    running, peak = [0], [0]
+
+    async def handler(session_id, n):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.02)
+        running[0] -= 1
+        seen.setdefault(session_id, []).append(n)
+
+    d = AsyncDispatcher(handler, concurrency=300, queue_size=10_000)
+    t0 = time.monotonic()
+    for n in range(3):
+        for s in range(300):
+            assert d.submit(f"wa:{s}", n)
+    assert d.join(timeout=10)
+    elapsed = time.monotonic() - t0
+    d.stop()
+
+    assert all(seen[f"wa:{s}"] == [0, 1, 2] for s in range(300))  # orden por sesión
+    assert peak[0] > 100 and elapsed < 2  # 900 turnos de 20 ms: en paralelo, no en serie
+    stats = d.stats()
+    assert stats["processed"] == 900 and stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def test_async_dispatcher_rejects_when_full_and_counts_failures():
+    gate = asyncio.Event()
+
+    async def handler(session_id, n):
+        if n == "boom":
+            raise RuntimeError("boom")
+        await gate.wait()
+
+    d = AsyncDispatcher(handler, concurrency=1, queue_size=2)
+    assert d.submit("a", "boom") and d.submit("a", 1)
+    while d.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    assert d.submit("b", 2) and d.submit("c", 3)  # esperando: 2 de 2
+    assert not d.submit("d", 4)
+    d._loop.call_soon_threadsafe(gate.set)
+    assert d.join(5)
+    d.stop()
+    stats = d.stats()
+    assert stats["failed"] == 1 and stats["processed"] == 3 and stats["rejected"] == 1
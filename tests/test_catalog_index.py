@@ -0,0 +1,129 @@
+# tests/test_catalog_index.py
+import os
+import random
+import time
+import pytest
+import requests
+from requests_mock import Mocker
+from app.agent import tools
+from app.agent.catalog_index import CatalogIndex, CatalogSnapshot, tokenize
+from app.agent.shopping_agent import ShoppingAgent
+
+API_BASE = os.environ.get("API_BASE", "http://api:8000")
+
+PRODUCTS = [
+    {"id": 1, "name": "Media negra M", "description": "Algodón peinado", "price": 1000, "stock": 50},
+    {"id": 2, "name": "Media blanca L", "description": "Clásica", "price": 1100, "stock": 30},
+    {"id": 3, "name": "Remera negra M", "description": "Manga corta", "price": 5000, "stock": 0},
+    {"id": 4, "name": "Remera negra M", "description": "Manga corta", "price": 5200, "stock": 7},
+    {"id": 5, "name": "Pantalón verde 42", "description": "Gabardina", "price": 9000, "stock": 3},
+]
+
+@pytest.fixture
+def index():
+    return CatalogIndex(PRODUCTS)
+
+def test_tokenize_folds_accents_plurals_and_filler():
+    assert tokenize("Medias NEGRAS talle M") == tokenize("media negra m")
+    assert tokenize("pantalón") == tokenize("pantalones")
+
+@pytest.mark.parametrize("q,expected", [
+    ("medias negras talle M", 1),
+    ("media blanca", 2),
+    ("remera negra", 4),      # a igualdad de score, el que tiene stock
+    ("pantal verde", 5),      # prefijo
+    ("pantalon verd", 5),
+    ("remra negra", 4),       # typo => trigramas
+])
+def test_resolve(index, q, expected):
+    assert index.resolve(q)["id"] == expected
+
+def test_resolve_requires_half_of_the_terms(index):
+    assert index.resolve("zapatilla roja running") is None
+    assert index.resolve("talle") is None  # sólo relleno
+
+def test_search_ranks_by_covered_terms(index):
+    assert [p["id"] for p in index.search("media negra", limit=3)][:1] == [1]
+    assert {p["id"] for p in index.search("negra")} == {1, 3, 4}
+
+def test_search_filters_on_attributes():
+    idx = CatalogIndex([{**p, "color": "negro" if "negra" in p["name"] else "blanco"} for p in PRODUCTS])
+    assert [p["id"] for p in idx.search("media", filters={"color": "Negro"})] == [1]
+
+def test_snapshot_refresh_keeps_last_index_on_error():
+    calls = []
+    def fetch():
+        calls.append(1)
+        if len(calls) > 1:
+            raise requests.ConnectionError("down")
+        return PRODUCTS
+    snap = CatalogSnapshot(fetch, interval=0)
+    assert snap.get() is None
+    assert snap.refresh() and snap.get().resolve("media blanca")["id"] == 2
+    assert not snap.refresh()
+    assert snap.get() is not None
+    assert snap.stats()["products"] == 5 and snap.stats()["errors"] == 1
+
+def test_fetch_catalog_reads_ndjson():
+    body = "".join(f'{{"id": {p["id"]}, "name": "{p["name"]}", "price": 1, "stock": 1}}\n' for p in PRODUCTS)
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", text=body, request_headers={"Accept": "application/x-ndjson"})
+        assert [p["id"] for p in tools.fetch_catalog()] == [1, 2, 3, 4, 5]
+
+def test_agent_adds_by_name_from_local_index():
+    tools.CATALOG.load(PRODUCTS)
+    with Mocker() as m:
+        m.post(f"{API_BASE}/carts/commands", json={"id": 5, "items": [], "total": "2000"}, status_code=200)
+        resp = ShoppingAgent("t-catalog-add").handle("agregá 2 medias negras talle M")
+        assert resp == "Agregué producto 1 (Media negra M) x2. Total: $2000."
+        assert m.last_request.json() == {"cart_id": None, "items": [{"product_id": 1, "qty": 2, "op": "inc"}]}
+        # Ningún GET /products: resuelto sin ir a la API
+        assert not any(r.method == "GET" for r in m.request_history)
+
+def test_agent_add_by_name_falls_back_to_api_search():
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=[PRODUCTS[4]])
+        m.post(f"{API_BASE}/carts/commands", json={"id": 6, "items": [], "total": "9000"}, status_code=200)
+        resp = ShoppingAgent("t-catalog-api").handle("agregar pantalón verde")
+        assert "Agregué producto 5 (Pantalón verde 42) x1" in resp
+
+def test_agent_add_by_name_api_fallback_drops_filler_words():
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=[PRODUCTS[0]])
+        m.post(f"{API_BASE}/carts/commands", json={"id": 7, "items": [], "total": "1000"}, status_code=200)
+        ShoppingAgent("t-catalog-filler").handle("agregá 1 media negra talle M")
+        assert m.request_history[0].qs == {"q": ["media negra m"]}
+
+def test_agent_add_by_name_not_found():
+    tools.CATALOG.load(PRODUCTS)
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=[])
+        assert "No encontré" in ShoppingAgent("t-catalog-none").handle("agregá zapatillas rojas")
+
+def test_agent_search_falls_back_to_snapshot_when_api_is_down():
+    tools.CATALOG.load(PRODUCTS)
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", exc=requests.ConnectTimeout)
+        resp = ShoppingAgent("t-catalog-down").handle("buscá remeras negras")
+        assert "4. Remera negra M" in resp
+
+@pytest.mark.benchmark
+def test_benchmark_resolve_throughput():
+    """Índice de 20k productos: construcción y resolve por consulta. Opt-in: RUN_BENCHMARKS=1."""
+    rnd = random.Random(1)
+    words = ["media", "remera", "pantalon", "buzo", "campera", "gorra", "negra", "blanca", "verde", "azul", "roja"]
+    products = [
+        {"id": i, "name": f"{rnd.choice(words[:6])} {rnd.choice(words[6:])} {rnd.choice('SML')}",
+         "description": f"Modelo {i}", "price": 1, "stock": rnd.randint(0, 5)}
+        for i in range(1, 20001)
+    ]
+    t0 = time.perf_counter()
+    idx = CatalogIndex(products)
+    build = time.perf_counter() - t0
+    queries = [f"{rnd.choice(words[:6])} {rnd.choice(words[6:])}" for _ in range(200)]
+    t0 = time.perf_counter()
+    for q in queries:
+        assert idx.resolve(q) is not None
+    per_query = (time.perf_counter() - t0) / len(queries)
+    report = f"catalog index: build {build:.2f}s for {len(products)} products, resolve {per_query * 1000:.2f} ms/query"
+    assert build < 10 and per_query < 0.05, report  # cotas holgadas: el reporte es lo que importa
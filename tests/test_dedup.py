@@ -0,0 +1,86 @@
+# tests/test_dedup.py
+import time
+
+import pytest
+
+from app.dedup import Deduper, MemoryDeduper, SqliteDeduper, deduper_from_env
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def deduper(request, tmp_path):
+    if request.param == "memory":
+        return MemoryDeduper(window=0.2, maxsize=100)
+    return SqliteDeduper(str(tmp_path / "dedup.db"), window=0.2)
+
+
+def test_duplicates_dropped_within_window(deduper):
+    assert not deduper.seen("wamid.1")
+    assert deduper.seen("wamid.1")
+    assert not deduper.seen("wamid.2")
+    assert deduper.stats() == {"checked": 3, "duplicates_dropped": 1, "size": 2}
+
+    time.sleep(0.25)
+    assert not deduper.seen("wamid.1")  # fuera de la ventana vuelve a ser nuevo
+
+
+def test_deduper_interface_is_abstract():
+    class Partial(Deduper):
+        def _check_and_add(self, msg_id):
+            return False
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_forget(deduper):
+    deduper.seen("wamid.1")
+    deduper.forget("wamid.1")
+    assert not deduper.seen("wamid.1")
+
+
+def test_memory_is_bounded():
+    d = MemoryDeduper(window=60, maxsize=3)
+    for i in range(10):
+        d.seen(str(i))
+    assert d.size() == 3
+    assert not d.seen("0")  # el más viejo se descartó
+
+
+def test_sqlite_is_shared_between_workers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'dedup.db'}"
+    worker_1, worker_2 = deduper_from_env(url), deduper_from_env(url)
+    assert not worker_1.seen("wamid.1")
+    assert worker_2.seen("wamid.1")
+
+
+def _webhook(msg_id, body="agregá 2 del producto 5"):
+    return {"entry": [{"changes": [{"value": {"messages": [
+        {"id": msg_id, "from": "549111", "type": "text", "text": {"body": body}},
+    ]}}]}]}
+
+
+def test_redelivered_webhook_is_processed_once(monkeypatch):
+    from app import whatsapp_server
+
+    handled = []
+    monkeypatch.setattr(whatsapp_server.dispatcher, "handler", lambda sid, msg: handled.append(msg["id"]))
+    monkeypatch.setattr(whatsapp_server, "deduper", MemoryDeduper())
+    client = whatsapp_server.app.test_client()
+
+    for _ in range(3):
+        assert client.post("/wa/webhook", json=_webhook("wamid.A")).status_code == 200
+    client.post("/wa/webhook", json=_webhook("wamid.B"))
+    assert whatsapp_server.dispatcher.join(5)
+
+    assert handled == ["wamid.A", "wamid.B"]
+    assert client.get("/wa/stats").get_json()["dedup"]["duplicates_dropped"] == 2
+
+
+def test_rejected_message_is_not_marked_as_seen(monkeypatch):
+    from app import whatsapp_server
+
+    monkeypatch.setattr(whatsapp_server, "deduper", MemoryDeduper())
+    monkeypatch.setattr(whatsapp_server.dispatcher, "submit", lambda sid, msg: False)
+    client = whatsapp_server.app.test_client()
+    assert client.post("/wa/webhook", json=_webhook("wamid.C")).status_code == 503
+    assert not whatsapp_server.deduper.seen("wamid.C")
@@ -0,0 +1,129 @@
+# tests/test_dispatcher.py
+import threading
+import time
+
+import pytest
+
+from app.dispatcher import Dispatcher
+
+
+def test_same_session_in_order_different_sessions_in_parallel():
+    seen = {}
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def handler(session_id, n):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.002)
+        with lock:
+            running[0] -= 1
+            seen.setdefault(session_id, []).append(n)
+
+    d = Dispatcher(handler, workers=4, queue_size=1000)
+    for n in range(50):
+        for s in range(8):
+            assert d.submit(f"wa:{s}", n)
+    assert d.join(timeout=10)
+    d.stop()
+
+    assert all(seen[f"wa:{s}"] == list(range(50)) for s in range(8))
+    assert peak[0] > 1
+    stats = d.stats()
+    assert stats["submitted"] == stats["processed"] == 400
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def _blocked(overflow, **kw):
+    gate = threading.Event()
+    done = []
+
+    def handler(session_id, n):
+        gate.wait(5)
+        done.append(n)
+
+    d = Dispatcher(handler, workers=1, queue_size=2, overflow=overflow, **kw)
+    d.submit("s", 0)
+    while d.stats()["in_flight"] == 0:  # el worker tomó el 0 y quedó trabado
+        time.sleep(0.001)
+    return d, gate, done
+
+
+def test_overflow_reject():
+    d, gate, done = _blocked("reject")
+    assert d.submit("s", 1) and d.submit("s", 2)
+    assert not d.submit("s", 3)
+    gate.set()
+    d.join(5)
+    assert done == [0, 1, 2]
+    assert d.stats()["rejected"] == 1 and d.stats()["max_depth_seen"] == 2
+
+
+def test_overflow_drop_oldest():
+    d, gate, done = _blocked("drop_oldest")
+    for n in (1, 2, 3):
+        assert d.submit("s", n)
+    gate.set()
+    d.join(5)
+    assert done == [0, 2, 3]
+    assert d.stats()["dropped"] == 1
+
+
+def test_overflow_block_waits_then_rejects():
+    d, gate, done = _blocked("block", block_timeout=0.05)
+    assert d.submit("s", 1) and d.submit("s", 2)
+    t0 = time.monotonic()
+    assert not d.submit("s", 3)
+    assert time.monotonic() - t0 >= 0.05
+
+    # Si se libera lugar durante la espera, el mensaje entra
+    d.block_timeout = 5
+    threading.Timer(0.02, gate.set).start()
+    assert d.submit("s", 4)
+    d.join(5)
+    assert done == [0, 1, 2, 4]
+    assert d.stats()["rejected"] == 1
+
+
+def test_handler_errors_are_counted_and_do_not_kill_the_worker():
+    def handler(session_id, n):
+        if n == 0:
+            raise RuntimeError("boom")
+
+    d = Dispatcher(handler, workers=1)
+    d.submit("s", 0), d.submit("s", 1)
+    d.join(5)
+    assert d.stats()["failed"] == 1 and d.stats()["processed"] == 1
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Dispatcher(lambda s, p: None, overflow="nope")
+
+
+def test_webhook_acks_before_processing(monkeypatch):
+    from app import whatsapp_server
+
+    gate = threading.Event()
+    handled = []
+
+    def slow(session_id, msg):
+        gate.wait(5)
+        handled.append((session_id, msg["text"]["body"]))
+
+    monkeypatch.setattr(whatsapp_server.dispatcher, "handler", slow)
+    body = {"entry": [{"changes": [{"value": {"messages": [
+        {"from": "549111", "type": "text", "text": {"body": "hola"}},
+        {"from": "549111", "type": "image"},
+    ]}}]}]}
+    client = whatsapp_server.app.test_client()
+    t0 = time.monotonic()
+    r = client.post("/wa/webhook", json=body)
+    assert r.status_code == 200 and time.monotonic() - t0 < 1
+    assert handled == []
+
+    gate.set()
+    assert whatsapp_server.dispatcher.join(5)
+    assert handled == [("wa:549111", "hola")]
+    assert client.get("/wa/stats").get_json()["processed"] >= 1
@@ -0,0 +1,74 @@
+# tests/test_intents.py
+import time
+
+import pytest
+
+from app.agent.intents import keyword_families, parse_intent
+from app.agent.shopping_agent import ShoppingAgent
+from intent_corpus import CORPUS
+from legacy_intents import legacy_parse
+
+
+def _norm(intent):
+    # El parser nuevo colapsa espacios en `q`; el viejo los dejaba tal cual
+    if intent.get("q"):
+        intent = {**intent, "q": " ".join(intent["q"].split())}
+    return intent
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_parity_with_legacy_parser(text):
+    assert parse_intent(text) == _norm(legacy_parse(text))
+
+
+# Casos donde el parser viejo se equivocaba por el orden de las reglas o por borrar
+# palabras clave como substrings
+FIXED = {
+    "agregá 2 del producto 5 al carrito": {"intent": "add", "qty": 2, "product_id": 5},
+    "sacá el producto 3 del carrito": {"intent": "set_qty", "product_id": 3, "qty": 0},
+    "sacá 2 del producto 3": {"intent": "add", "qty": -2, "product_id": 3},
+    "buscar medias": {"intent": "search", "q": "medias", "filters": None},
+    "mostrame zapatillas": {"intent": "search", "q": "zapatillas", "filters": None},
+    "buscá medias tamaño: xl": {"intent": "search", "q": "medias", "filters": {"talle": "xl"}},
+}
+
+
+@pytest.mark.parametrize("text, expected", FIXED.items())
+def test_fixed_misroutes(text, expected):
+    assert parse_intent(text) == expected
+    assert legacy_parse(text) != expected
+
+
+def test_add_by_name_needs_a_product_word():
+    assert parse_intent("agregá 2 medias negras al carrito") == {"intent": "add", "qty": 2, "query": "medias negras"}
+    assert parse_intent("agregar al carrito") == {"intent": "show_cart"}
+    assert parse_intent("agregá el carrito") == {"intent": "show_cart"}
+
+
+def test_keyword_automaton_single_pass():
+    assert keyword_families("agregá 2 del producto 5 al carrito") == {"add": [0], "cart": [27]}
+    assert keyword_families("información producto 3") == {"detail": [0]}
+    assert keyword_families("hola") == {}
+
+
+def test_agent_uses_intent_grammar():
+    assert ShoppingAgent("t-intents").parse("Agregá 2 del producto 1") == {"intent": "add", "qty": 2, "product_id": 1}
+
+
+@pytest.mark.benchmark
+def test_benchmark_messages_per_second():
+    """Micro-benchmark: mensajes/s sobre el corpus, contra el parser anterior. Opt-in:
+    `RUN_BENCHMARKS=1 python -m pytest -q tests/test_intents.py`."""
+    messages = CORPUS * 200
+
+    def rate(fn):
+        best = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            for m in messages:
+                fn(m)
+            best = min(best, time.perf_counter() - t0)
+        return len(messages) / best
+
+    new, old = rate(parse_intent), rate(legacy_parse)
+    assert new > old, f"intents: {new:,.0f} msg/s (legacy {old:,.0f} msg/s, x{new / old:.1f})"
@@ -0,0 +1,62 @@
+# tests/test_metrics.py
+import os
+
+import pytest
+from prometheus_client import REGISTRY
+from requests_mock import Mocker
+
+from app.agent import tools
+from app.agent.shopping_agent import ShoppingAgent
+
+API_BASE = os.environ.get("API_BASE", "http://api:8000")
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_tools_are_timed_by_name_and_status():
+    ok = _sample("agent_tool_duration_seconds_count", tool="get_product", status="ok")
+    err = _sample("agent_tool_duration_seconds_count", tool="get_product", status="error")
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products/1", json={"id": 1, "name": "Media", "price": 1, "stock": 1})
+        m.get(f"{API_BASE}/products/2", status_code=404)
+        tools.get_product(1)
+        tools.get_product(1)  # hit de cache: también se mide
+        with pytest.raises(tools.ApiError):
+            tools.get_product(2)
+    assert tools.get_product.__name__ == "get_product"
+    assert _sample("agent_tool_duration_seconds_count", tool="get_product", status="ok") == ok + 2
+    assert _sample("agent_tool_duration_seconds_count", tool="get_product", status="error") == err + 1
+
+
+def test_handle_is_timed_per_intent():
+    before = {i: _sample("agent_intent_duration_seconds_count", intent=i) for i in ("search", "detail", "help")}
+    agent = ShoppingAgent(session_id="metrics")
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=[])
+        m.get(f"{API_BASE}/products/9", status_code=404)
+        agent.handle("buscá medias")
+        agent.handle("detalle producto 9")
+        agent.handle("ayuda")
+    for intent, n in before.items():
+        assert _sample("agent_intent_duration_seconds_count", intent=intent) == n + 1
+
+
+def test_webhook_metrics_endpoint(monkeypatch):
+    from app import whatsapp_server
+
+    monkeypatch.setattr(whatsapp_server.dispatcher, "handler", lambda session_id, msg: None)
+    client = whatsapp_server.app.test_client()
+    queued = _sample("webhook_stage_duration_seconds_count", stage="queue")
+    body = {"entry": [{"changes": [{"value": {"messages": [{"from": "549222", "type": "text", "text": {"body": "hola"}}]}}]}]}
+    assert client.post("/wa/webhook", json=body).status_code == 200
+    assert whatsapp_server.dispatcher.join(5)
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["Content-Type"].startswith("text/plain")
+    assert 'route="/wa/webhook"' in r.get_data(as_text=True)
+    assert 'route="/metrics"' not in r.get_data(as_text=True)
+    assert _sample("webhook_stage_duration_seconds_count", stage="queue") == queued + 1
+    assert _sample("webhook_queue_depth") == 0
@@ -0,0 +1,105 @@
+# tests/test_profiling.py
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+from requests_mock import Mocker
+
+from app import profiling
+from app.agent import async_tools, tools
+from app.agent.shopping_agent import ShoppingAgent
+
+API_BASE = os.environ.get("API_BASE", "http://api:8000")
+
+
+@pytest.fixture
+def out(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secreto")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "MAX_FILES", 2)
+    return tmp_path
+
+
+def test_turn_profile_records_intent_tools_and_api_profile(out):
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products", json=[], headers={"X-Profile-Id": "api-1"})
+        with profiling.profile_turn("turn wa:1", {"session": "wa:1"}):
+            ShoppingAgent("wa:1").handle("buscá medias")
+            sent = m.last_request.headers.get("X-Profile")
+        tools.search_products("remeras")  # fuera del turno: sin header
+        assert "X-Profile" not in m.last_request.headers
+    (collapsed,) = out.glob("*.collapsed")
+    meta = json.loads(collapsed.with_suffix(".json").read_text())
+    assert meta["session"] == "wa:1" and meta["intent"] == "search"
+    assert [c["tool"] for c in meta["calls"]] == ["search_products"]
+    assert meta["duration_ms"] > 0
+    assert sent == "secreto" and meta["api_profiles"] == ["api-1"]
+    assert profiling.current() is None
+    profiling.note(intent="x")  # fuera de un turno: no-op
+
+
+def test_async_turn_is_profiled_like_sync(out, monkeypatch):
+    from app import whatsapp_server
+
+    sent = []
+
+    def api(request):
+        sent.append(request.headers.get("X-Profile"))
+        return httpx.Response(200, json=[], headers={"X-Profile-Id": "api-2"})
+
+    monkeypatch.setattr(async_tools, "_transport", httpx.MockTransport(api))
+    monkeypatch.setattr(async_tools, "_client", None)
+    monkeypatch.setattr(whatsapp_server, "send_whatsapp_text", lambda to, body: None)
+    write, on_loop = profiling.write, []
+
+    def spy(profile, meta):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return write(profile, meta)
+
+    monkeypatch.setattr(profiling, "write", spy)
+    msg = {"from": "549333", "id": "m1", "type": "text", "text": {"body": "buscá medias"}, "_profile": True}
+
+    async def run():
+        try:
+            await whatsapp_server.process_message_async("wa:549333", msg)
+            await whatsapp_server.process_message_async("wa:549333", {**msg, "_profile": None})
+        finally:
+            await async_tools.aclose()
+
+    asyncio.run(run())
+    (meta_file,) = out.glob("*.json")
+    meta = json.loads(meta_file.read_text())
+    assert meta["intent"] == "search" and [c["tool"] for c in meta["calls"]] == ["search_products"]
+    assert sent == ["secreto"] and meta["api_profiles"] == ["api-2"]
+    assert on_loop == [False]  # los archivos se escriben fuera del event loop
+    # Ni el teléfono ni el texto quedan en disco (nombre de archivo incluido)
+    assert meta["session"] == profiling.pseudonym("wa:549333") and meta["text_chars"] == 12
+    for path in out.iterdir():
+        assert "549333" not in path.name and "549333" not in path.read_text() and "medias" not in path.read_text()
+
+
+def test_output_is_bounded(out):
+    for i in range(4):
+        with profiling.profile_turn(f"turn {i}", {}):
+            pass
+    assert sorted(p.name.rsplit("-", 1)[1] for p in out.glob("*.json")) == ["turn_2.json", "turn_3.json"]
+
+
+def test_webhook_header_marks_messages(out, monkeypatch):
+    from app import whatsapp_server
+
+    seen = []
+    monkeypatch.setattr(whatsapp_server.dispatcher, "handler", lambda session_id, msg: seen.append(msg.get("_profile")))
+    client = whatsapp_server.app.test_client()
+    body = {"entry": [{"changes": [{"value": {"messages": [{"from": "549333", "type": "text", "text": {"body": "hola"}}]}}]}]}
+    client.post("/wa/webhook", json=body)
+    client.post("/wa/webhook", json=body, headers={"X-Profile": "otro"})
+    client.post("/wa/webhook", json=body, headers={"X-Profile": "secreto"})
+    assert whatsapp_server.dispatcher.join(5)
+    assert seen == [None, None, True]
@@ -0,0 +1,101 @@
+# tests/test_session_store.py
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from requests_mock import Mocker
+
+from app.agent.session_store import MemorySessionStore, SessionRecord, SessionStore, SqliteSessionStore, store_from_env
+from app.agent.shopping_agent import ShoppingAgent
+from test_agent import API_BASE, mock_cart, mock_products
+
+
+def test_memory_store_is_bounded_lru():
+    store = MemorySessionStore(maxsize=2, ttl=60)
+    for sid in ("a", "b"):
+        store.put(sid, SessionRecord(cart_id=1))
+    store.get("a")  # "a" pasa a ser la más reciente
+    store.put("c", SessionRecord(cart_id=3))
+    assert store.get("b").cart_id is None
+    assert store.get("a").cart_id == 1 and store.get("c").cart_id == 3
+    assert store.stats() == {"backend": "memory", "size": 2, "evictions": 1}
+
+
+def test_memory_store_expires_idle_sessions():
+    store = MemorySessionStore(maxsize=10, ttl=0.05)
+    store.put("a", SessionRecord(cart_id=1, filters={"color": "negro"}))
+    assert store.get("a").filters == {"color": "negro"}
+    time.sleep(0.1)
+    assert store.get("a").cart_id is None
+    assert store.stats()["size"] == 0
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_ttl_slides_on_each_read(backend, tmp_path):
+    if backend == "memory":
+        store = MemorySessionStore(maxsize=10, ttl=0.3)
+    else:
+        store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl=0.3)
+    store.put("a", SessionRecord(cart_id=1))
+    # Una sesión en uso (sin put(): no cambió nada) no vence a los `ttl` de creada
+    for _ in range(4):
+        time.sleep(0.1)
+        assert store.get("a").cart_id == 1
+    time.sleep(0.4)
+    assert store.get("a").cart_id is None
+
+
+def test_new_sessions_are_not_stored_until_they_change():
+    store = MemorySessionStore()
+    store.get("solo-lectura")
+    assert store.stats()["size"] == 0
+
+
+def test_store_interface_is_abstract():
+    class Partial(SessionStore):
+        def get(self, session_id):
+            return SessionRecord()
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_sqlite_store_is_shared_across_processes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'sessions.db'}"
+    store = store_from_env(url)
+    store.put("wa:1", SessionRecord(cart_id=42, filters={"talle": "m"}))
+
+    # Otro proceso (otro worker de gunicorn) lee y modifica la misma sesión
+    code = (
+        "from app.agent.session_store import store_from_env\n"
+        f"s = store_from_env({url!r})\n"
+        "r = s.get('wa:1'); assert r.cart_id == 42 and r.filters == {'talle': 'm'}\n"
+        "r.cart_id = 43; s.put('wa:1', r)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[1])
+    assert store.get("wa:1").cart_id == 43
+
+
+def test_sqlite_store_expires(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"), ttl=0.05)
+    store.put("a", SessionRecord(cart_id=1))
+    time.sleep(0.1)
+    assert store.get("a").cart_id is None
+    assert store.stats() == {"backend": "sqlite", "size": 0}
+
+
+def test_cart_survives_switching_workers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'sessions.db'}"
+    worker_1, worker_2 = store_from_env(url), store_from_env(url)
+    p = mock_products()[0]
+    with Mocker() as m:
+        m.get(f"{API_BASE}/products/{p['id']}", json=p, status_code=200)
+        command = m.post(f"{API_BASE}/carts/commands", json=mock_cart(55, items=[{"product": p, "qty": 1}]), status_code=201)
+
+        ShoppingAgent("wa:123", store=worker_1).handle("agregar producto 1")
+        resp = ShoppingAgent("wa:123", store=worker_2).handle("agregar producto 1")
+        assert "Agregué producto 1" in resp
+        assert command.request_history[0].json()["cart_id"] is None
+        assert command.last_request.json()["cart_id"] == 55  # el segundo turno reutilizó el carrito
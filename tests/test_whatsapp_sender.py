@@ -0,0 +1,90 @@
+# tests/test_whatsapp_sender.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.whatsapp_sender import SendError, TokenBucket, WhatsAppSender, split_text
+from scripts.fake_graph import FakeGraph
+
+
+@pytest.fixture
+def graph():
+    with FakeGraph() as fake:
+        yield fake
+
+
+def _sender(graph, **kw):
+    return WhatsAppSender("tok", "123", base_url=graph.url, **{"backoff_base": 0.01, **kw})
+
+
+def test_send_reuses_connection_and_reports_stats(graph):
+    sender = _sender(graph)
+    for i in range(5):
+        sender.send_text("549111", f"hola {i}")
+    assert [m["text"]["body"] for m in graph.messages] == [f"hola {i}" for i in range(5)]
+    assert graph.messages[0]["to"] == "549111"
+    stats = sender.stats()
+    assert stats["sent"] == 5 and stats["failed"] == 0 and stats["queue_depth"] == 0
+    assert 0 < stats["latency_p50_ms"] <= stats["latency_max_ms"]
+
+
+def test_long_replies_are_split_in_order(graph):
+    lines = [f"{i}. Producto de prueba con un nombre largo" for i in range(300)]
+    body = "\n".join(lines)
+    assert len(body) > 12000
+    _sender(graph).send_text("549111", body)
+    parts = [m["text"]["body"] for m in graph.messages]
+    assert len(parts) == 4 and all(len(p) <= 4000 for p in parts)
+    assert "\n".join(parts) == body  # se corta en saltos de línea, no se pierde nada
+
+
+def test_split_text_without_breaks():
+    assert [len(p) for p in split_text("x" * 9000)] == [4000, 4000, 1000]
+    assert split_text("") == [""]
+
+
+def test_retries_429_and_5xx_with_backoff(graph):
+    graph.fail_next = [429, 503, 500]
+    sender = _sender(graph)
+    sender.send_text("549111", "hola")
+    assert graph.requests == 4 and len(graph.messages) == 1
+    assert sender.stats()["retries"] == 3
+
+
+def test_retry_after_is_honored(graph):
+    graph.fail_next, graph.retry_after = [429], 0.2
+    t0 = time.monotonic()
+    _sender(graph).send_text("549111", "hola")
+    assert time.monotonic() - t0 >= 0.2
+
+
+def test_gives_up_after_max_retries_and_on_4xx(graph):
+    graph.fail_next = [503] * 3
+    sender = _sender(graph, max_retries=2)
+    with pytest.raises(SendError):
+        sender.send_text("549111", "hola")
+    assert graph.requests == 3
+
+    graph.fail_next = [400]
+    with pytest.raises(SendError, match="HTTP 400"):
+        sender.send_text("549111", "hola")
+    assert graph.requests == 4  # 4xx no se reintenta
+    assert sender.stats()["failed"] == 2
+
+
+def test_rate_limit_caps_throughput(graph):
+    sender = _sender(graph, rate=50, burst=5)
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: sender.send_text("549111", str(i)), range(30)))
+    elapsed = time.monotonic() - t0
+    # 5 de ráfaga + 25 a 50/s => al menos ~0.5 s
+    assert elapsed >= 0.45
+    assert len(graph.messages) == 30
+
+
+def test_token_bucket_timeout():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire()
+    assert not bucket.acquire(timeout=0.01)